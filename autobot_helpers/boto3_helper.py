@@ -1,25 +1,133 @@
-from datetime import datetime, timedelta
+import threading
+from datetime import timedelta
 import boto3
-from autobot_helpers import context_helper
+import botocore.session
+from botocore.config import Config
+from botocore.credentials import CredentialProvider, CredentialResolver, RefreshableCredentials
+from dateutil.tz import tzlocal
+from autobot_helpers import cache_helper, context_helper, rate_limiter, telemetry_helper
 from services.aws.utils import Constants, Helpers
 
 autobot_region = 'Virginia'
+# Lifetime of the assumed role credentials
+sts_creds_duration_seconds = 3600
+
+default_pool_config = {
+    'max_pool_connections': 50,
+    # Sessions and clients not used for idle_seconds are dropped, at most max_sessions / max_clients are kept
+    'max_sessions': 256,
+    'max_clients': 2048,
+    'idle_seconds': 1800
+}
+
+# Tagged with ('identity', identity) so reset_credentials can drop them, created on first use
+__sessions = None
+__clients = None
+# Reentrant, creating the credentials of a role takes the autobot sts client
+__lock = threading.RLock()
+__local = threading.local()
+
+
+def pool_config():
+    config = dict(default_pool_config)
+    config.update(context_helper.app().config.get('BOTO3_POOL_CONFIG') or {})
+    return config
+
+
+def __pools():
+    global __sessions, __clients
+    if __sessions is None:
+        config = pool_config()
+        __sessions = cache_helper.TTLCache(config['max_sessions'], config['idle_seconds'])
+        __clients = cache_helper.TTLCache(config['max_clients'], config['idle_seconds'])
+    return __sessions, __clients
+
+
+def __pooled(cache, key, identity):
+    """ The cached value of key, its idle time starting over, None when it isn't cached """
+    value = cache.get(key)
+    if value is not None:
+        cache.set(key, value, tags=[('identity', identity)])
+    return value
+
+
+class RoleCredentialProvider(CredentialProvider):
+    """ Hands botocore the refreshable credentials of a customer's role """
+    METHOD = 'sts-assume-role'
+    CANONICAL_NAME = 'custom-sts-assume-role'
+
+    def __init__(self, credentials):
+        super(RoleCredentialProvider, self).__init__()
+        self.credentials = credentials
+
+    def load(self):
+        return self.credentials
+
+
+def __role_credentials(attributes):
+    """
+    Credentials of the customer's role that assume it again ahead of expiry. botocore refreshes them under its own
+    lock 15 minutes before they expire, every client made from them picks the new keys up.
+    """
+    sts_client = get_client('sts', autobot_resources=True)
+    role = {'RoleArn': attributes['roleArn'], 'RoleSessionName': attributes['roleSession'],
+            'ExternalId': attributes['externalId']}
+
+    def assume_role():
+        credentials = sts_client.assume_role(DurationSeconds=sts_creds_duration_seconds, **role)['Credentials']
+        return {'access_key': credentials['AccessKeyId'], 'secret_key': credentials['SecretAccessKey'],
+                'token': credentials['SessionToken'], 'expiry_time': credentials['Expiration'].isoformat()}
+
+    if attributes.get('AccessKeyId'):
+        # Start from the credentials the session was initialized with
+        expiry_time = attributes.get('stsCredsExpireOn') or (
+            Helpers.fromisoformat(attributes['stsCredsGeneratedOn']) +
+            timedelta(seconds=sts_creds_duration_seconds)).replace(tzinfo=tzlocal()).isoformat()
+        metadata = {'access_key': attributes['AccessKeyId'], 'secret_key': attributes['SecretAccessKey'],
+                    'token': attributes['SessionToken'], 'expiry_time': expiry_time}
+    else:
+        metadata = assume_role()
+    return RefreshableCredentials.create_from_metadata(metadata, assume_role, 'sts-assume-role')
+
+
+def __get_boto3_session(autobot_resources):
+    """
+    Identity of the credentials calls are made with and the boto3 session holding them, one session per identity
+    so service models are loaded once. A customer's identity is its account and role, autobotAI's own resources
+    use the configured keys locally and the Lambda role's credentials otherwise.
+    """
+    attributes = None if autobot_resources else context_helper.get_current_session()['attributes']
+    identity = ('autobot',) if autobot_resources else (attributes['accountNumber'], attributes['roleArn'])
+    with __lock:
+        sessions = __pools()[0]
+        session = __pooled(sessions, identity, identity)
+        if session is None:
+            if not autobot_resources:
+                # The role's credentials are the only ones the session resolves, never the environment's
+                botocore_session = botocore.session.Session()
+                botocore_session.register_component('credential_provider', CredentialResolver(
+                    [RoleCredentialProvider(__role_credentials(attributes))]))
+                session = boto3.Session(botocore_session=botocore_session)
+            elif context_helper.app().config["ENVIRONMENT"] == "local":
+                session = boto3.Session(aws_access_key_id=get_access_key(True),
+                                        aws_secret_access_key=get_secret_key(True))
+            else:
+                session = boto3.Session()
+            sessions.set(identity, session, tags=[('identity', identity)])
+        return identity, session
+
+
+def reset_credentials(attributes):
+    """ Drops the credentials of the session's role and the clients using them, the next call assumes it again """
+    identity = (attributes['accountNumber'], attributes['roleArn'])
+    with __lock:
+        for cache in __pools():
+            cache.invalidate(('identity', identity))
 
 
 def get_session(autobot_resources=False):
     context_helper.logger().debug("get_session called for %s", str(autobot_resources))
-    session = None
-    if session is None:
-        if not autobot_resources or context_helper.app().config["ENVIRONMENT"] == "local":
-            session = boto3.Session(
-                aws_access_key_id=get_access_key(autobot_resources),
-                aws_secret_access_key=get_secret_key(autobot_resources),
-                region_name=get_region_id(get_region(autobot_resources)),
-                aws_session_token=get_session_token(autobot_resources)
-            )
-        else:
-            session = boto3.Session(region_name=get_region_id(get_region(autobot_resources)))
-    return session
+    return __get_boto3_session(autobot_resources)[1]
 
 
 def get_autobot_access_role():
@@ -30,22 +138,70 @@ def get_autobot_access_role():
 
 
 def get_client(resource, region_name=Constants.AWSRegions.VIRGINIA.value, autobot_resources=False):
+    """
+    Returns the pooled client of the service and region for the current credentials, creating it on first use.
+    Clients are thread safe and shared by every caller, keeping their connections open between calls.
+    """
     context_helper.logger().debug("get_client called for resource=%s, region=%s, autobot_resource=%s", resource,
                                   region_name, str(autobot_resources))
-    client = None
-    if client is None:
-        if not autobot_resources or context_helper.app().config["ENVIRONMENT"] == "local":
-            client = boto3.client(resource,
-                                  aws_access_key_id=get_access_key(autobot_resources),
-                                  aws_secret_access_key=get_secret_key(autobot_resources),
-                                  region_name=region_name if region_name else get_region_id(
-                                      get_region(autobot_resources)),
-                                  aws_session_token=get_session_token(autobot_resources)
-                                  )
-        else:
-            client = boto3.client(resource, region_name=region_name if region_name
-            else get_region_id(get_region(autobot_resources)))
-    return client
+    region_name = region_name if region_name else get_region_id(get_region(autobot_resources))
+    identity, session = __get_boto3_session(autobot_resources)
+    key = (resource, region_name, identity)
+    with __lock:
+        clients = __pools()[1]
+        client = __pooled(clients, key, identity)
+        if client is not None:
+            return client
+        # Throttled calls are retried with backoff instead of failing the collector
+        client_config = Config(retries={'max_attempts': rate_limiter.config()['max_attempts'], 'mode': 'standard'},
+                               max_pool_connections=pool_config()['max_pool_connections'])
+        client = session.client(resource, region_name=region_name, config=client_config)
+        if not autobot_resources:
+            rate_limiter.register(client, identity[0], client.meta.region_name, resource)
+        clients.set(key, telemetry_helper.register(client), tags=[('identity', identity)])
+        return client
+
+
+# (request parameter, response key) of the page tokens and the page size parameters, for operations botocore
+# has no paginator for
+__page_tokens = (('NextToken', 'NextToken'), ('Marker', 'NextMarker'), ('Marker', 'Marker'))
+__page_size_parameters = ('MaxResults', 'MaxRecords', 'MaxItems', 'PageSize')
+
+
+def __paginate_by_token(client, operation_name, result_key, page_size, kwargs):
+    """ Follows the operation's page token by hand, the token parameters are looked up in the service model """
+    operation = client.meta.service_model.operation_model(client.meta.method_to_api_mapping[operation_name])
+    input_members = operation.input_shape.members if operation.input_shape else {}
+    output_members = operation.output_shape.members if operation.output_shape else {}
+    token = next(((parameter, key) for parameter, key in __page_tokens
+                  if parameter in input_members and key in output_members), None)
+    size_parameter = next((parameter for parameter in __page_size_parameters if parameter in input_members), None)
+    if page_size and size_parameter:
+        kwargs[size_parameter] = page_size
+    while True:
+        response = getattr(client, operation_name)(**kwargs)
+        for item in response.get(result_key, []):
+            yield item
+        next_token = response.get(token[1]) if token else None
+        if not next_token:
+            return
+        kwargs[token[0]] = next_token
+
+
+def paginate(client, operation_name, result_key, page_size=None, **kwargs):
+    """
+    Yields the items under result_key of every page of a describe/list call as the pages come in, so only one page
+    is held at a time. page_size is sent as the operation's MaxResults/MaxRecords/MaxItems, kwargs like Filters
+    go with every page. Operations botocore has no paginator for have their NextToken/Marker followed by hand.
+    """
+    if not client.can_paginate(operation_name):
+        for item in __paginate_by_token(client, operation_name, result_key, page_size, dict(kwargs)):
+            yield item
+        return
+    pagination_config = {'PageSize': page_size} if page_size else {}
+    for page in client.get_paginator(operation_name).paginate(PaginationConfig=pagination_config, **kwargs):
+        for item in page.get(result_key, []):
+            yield item
 
 
 def get_dynamo_db_table(table_name, autobot_resources=False, live=False):
@@ -53,9 +209,19 @@ def get_dynamo_db_table(table_name, autobot_resources=False, live=False):
     if context_helper.app().config["ENVIRONMENT"] != "live" and not live:
         context_helper.logger().debug("Not production, using staging table=%s", table_name)
         table_name = "staging_" + table_name
-    session = get_session(autobot_resources)
-    dynamodb = session.resource('dynamodb', region_name=get_region_id(get_region(autobot_resources)))
-    table = dynamodb.Table(table_name)
+    region_name = get_region_id(get_region(autobot_resources))
+    identity, session = __get_boto3_session(autobot_resources)
+    # Resources aren't thread safe, each thread keeps its own
+    resources = getattr(__local, 'dynamodb_resources', None)
+    if resources is None:
+        resources = __local.dynamodb_resources = {}
+    key = (region_name, identity)
+    if key not in resources or resources[key][1] is not session:
+        with __lock:
+            dynamodb = session.resource('dynamodb', region_name=region_name,
+                                        config=Config(max_pool_connections=pool_config()['max_pool_connections']))
+        resources[key] = (dynamodb, session)
+    table = resources[key][0].Table(table_name)
     context_helper.logger().debug("Returning dynamo table")
     return table
 
@@ -65,10 +231,7 @@ def get_access_key(autobot_resources=False):
     if autobot_resources:
         return context_helper.app().config["ACCESS_KEY"]
     else:
-        if (datetime.now() - Helpers.fromisoformat(
-                context_helper.get_current_session()['attributes']['stsCredsGeneratedOn'])).total_seconds() > 3600:
-            context_helper.refresh_sts_creds(context_helper.get_current_session())
-        return context_helper.get_current_session()['attributes']['AccessKeyId']
+        return __get_frozen_credentials().access_key
 
 
 def get_secret_key(autobot_resources=False):
@@ -76,7 +239,7 @@ def get_secret_key(autobot_resources=False):
     if autobot_resources:
         return context_helper.app().config["SECRET_KEY"]
     else:
-        return context_helper.get_current_session()['attributes']['SecretAccessKey']
+        return __get_frozen_credentials().secret_key
 
 
 def get_session_token(autobot_resources=False):
@@ -84,7 +247,11 @@ def get_session_token(autobot_resources=False):
     if autobot_resources:
         return None
     else:
-        return context_helper.get_current_session()['attributes']['SessionToken']
+        return __get_frozen_credentials().token
+
+
+def __get_frozen_credentials():
+    return __get_boto3_session(False)[1].get_credentials().get_frozen_credentials()
 
 
 def get_region(autobot_resources=False):
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Every cache created, for invalidate
+caches = []
+caches_lock = threading.Lock()
+
+
+class TTLCache:
+    """
+    In-process LRU cache whose entries also expire after their own time to live.
+
+    Entries are tagged with what they were built from, like ('user', email) or ('account', account id), so the write
+    paths of those records can drop every entry built from them with invalidate(tag) without knowing the caches.
+    The cache only holds for the process, other Lambda containers keep their entries until they expire, so the
+    times to live are kept short. Safe to share between threads.
+    """
+
+    def __init__(self, max_size, ttl_seconds):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        with caches_lock:
+            caches.append(self)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self.entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value, tags=(), ttl_seconds=None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else min(ttl_seconds, self.ttl_seconds)
+        if ttl_seconds <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + ttl_seconds, frozenset(tags))
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, tag):
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if tag in entry[2]]:
+                del self.entries[key]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def invalidate(tag):
+    """ Drops the entries tagged with tag from every cache """
+    with caches_lock:
+        registered = list(caches)
+    for cache in registered:
+        cache.invalidate(tag)
@@ -1,5 +1,6 @@
+import copy
 import traceback
-from datetime import datetime
+from datetime import datetime, timezone
 from random import randint
 
 from botocore.exceptions import ClientError
@@ -8,7 +9,7 @@ from flask import session as flask_session
 from flask_ask import context as ask_context
 from flask_ask import session as ask_session
 
-from autobot_helpers import boto3_helper
+from autobot_helpers import boto3_helper, cache_helper
 from models import autobot_context
 from models import cloud_service_provider, users
 from services.aws.utils import Constants, Helpers
@@ -37,9 +38,51 @@ def logger():
         return autobot_context.app.logger
 
 
+default_session_cache_config = {
+    'max_size': 1024,
+    'ttl_seconds': 900,
+    # Bundles are dropped this long before their credentials expire
+    'expiry_margin_seconds': 300
+}
+
+__session_bundles = None
+
+
+def session_cache_config():
+    config = dict(default_session_cache_config)
+    config.update(app().config.get('SESSION_CACHE_CONFIG') or {})
+    return config
+
+
+def __get_session_bundles():
+    global __session_bundles
+    if __session_bundles is None:
+        config = session_cache_config()
+        __session_bundles = cache_helper.TTLCache(config['max_size'], config['ttl_seconds'])
+    return __session_bundles
+
+
+def session_cache_stats():
+    return __get_session_bundles().stats()
+
+
+def invalidate_session(email=None, account_id=None):
+    """ Drops the cached sessions of a user or an account, the next request initializes them again """
+    if email:
+        cache_helper.invalidate(('user', email))
+    if account_id:
+        cache_helper.invalidate(('account', account_id))
+
+
 def initialize(email=None, account_id=None):
     try:
         session = get_current_session()
+        # The user, account, assumed role credentials and regions of a recent request for the same user and account
+        bundle = __get_session_bundles().get((email, account_id))
+        if bundle:
+            session['attributes'] = copy.deepcopy(bundle)
+            session['attributes']['SessionOtp'] = str(randint(10 ** (4 - 1), (10 ** 4) - 1))
+            return {'success': True}
         allregions = []
 
         user = users.get_by_email(email)
@@ -95,6 +138,7 @@ def initialize(email=None, account_id=None):
                               "defaultRegion": csp_attributes['default_region'], "setAction": "", "setEnvironment": "",
                               'roleSession': csp_attributes['rolesession'], 'externalId': csp_attributes["external_id"],
                               'roleArn': csp['roleArn'], 'stsCredsGeneratedOn': datetime.now().isoformat(),
+                              'stsCredsExpireOn': credentials['Expiration'].isoformat(),
                               'userId': user['id'], 'isRoot': isRoot, 'rootUserId': root_user['id'],
                               'permissions': user.get('permissions'), 'role_name': Helpers.role_from_arn(csp['roleArn'])
                               }
@@ -106,6 +150,11 @@ def initialize(email=None, account_id=None):
         session_attributes['all_regions'] = aws_global_regions
         session_attributes['activeRegions'] = __get_active_regions(csp)
         session['attributes'] = session_attributes
+        __get_session_bundles().set(
+            (email, account_id), copy.deepcopy(session_attributes),
+            tags=[('user', user['id']), ('user', root_user['id']), ('account', csp['accountId'])],
+            ttl_seconds=(credentials['Expiration'] - datetime.now(timezone.utc)).total_seconds() -
+            session_cache_config()['expiry_margin_seconds'])
         return {'success': True}
     except ClientError as e:
         print(traceback.format_exc())
@@ -143,4 +192,8 @@ def refresh_sts_creds(session):
     session['attributes']['SecretAccessKey'] = credentials['SecretAccessKey']
     session['attributes']['SessionToken'] = credentials['SessionToken']
     session['attributes']['stsCredsGeneratedOn'] = datetime.now().isoformat()
+    session['attributes']['stsCredsExpireOn'] = credentials['Expiration'].isoformat()
+    # Pooled clients and cached sessions still hold the role's previous credentials
+    boto3_helper.reset_credentials(session['attributes'])
+    invalidate_session(account_id=session['attributes']['accountNumber'])
 
@@ -1,15 +1,55 @@
+from autobot_helpers import cache_helper, context_helper
 from models import cloud_service_provider, users
 from services.aws.utils import Constants
 
+default_permission_cache_config = {
+    'max_size': 4096,
+    'ttl_seconds': 60
+}
+
+__permission_cache = None
+
+
+def permission_cache_config():
+    config = dict(default_permission_cache_config)
+    config.update(context_helper.app().config.get('PERMISSION_CACHE_CONFIG') or {})
+    return config
+
+
+def __get_permission_cache():
+    global __permission_cache
+    if __permission_cache is None:
+        config = permission_cache_config()
+        __permission_cache = cache_helper.TTLCache(config['max_size'], config['ttl_seconds'])
+    return __permission_cache
+
 
 def has_account_permission(user_id, account_id):
+    """
+    Decisions are cached for a short while, tagged with the user, their root user and the account so the user and
+    cloud service provider write paths drop them
+    """
+    decision = __get_permission_cache().get((user_id, account_id))
+    if decision is not None:
+        return decision
     user = users.get_by_email(user_id)
     csp = cloud_service_provider.get_by_account_id(user['rootUserId'], account_id)
+    decision = False
     if csp:
         if user['userType'] == Constants.UserTypes.ROOT.value:
-            return True
+            decision = True
         elif user['permissions'].get('accounts'):
-            return True if account_id in user['permissions'].get('accounts') else False
+            decision = True if account_id in user['permissions'].get('accounts') else False
         else:
-            return True
-    return False
+            decision = True
+    __get_permission_cache().set((user_id, account_id), decision,
+                                 tags=[('user', user_id), ('user', user['rootUserId']), ('account', account_id)])
+    return decision
+
+
+def permission_cache_stats():
+    return __get_permission_cache().stats()
+
+
+def is_admin(user_id):
+    return user_id in (context_helper.app().config.get('ADMIN_EMAILS') or [])
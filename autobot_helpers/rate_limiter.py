@@ -0,0 +1,127 @@
+import threading
+import time
+
+from autobot_helpers import context_helper, telemetry_helper
+
+default_config = {
+    'default': {'rate': 10, 'burst': 20, 'min_rate': 0.5, 'max_rate': 50},
+    'ec2': {'rate': 20, 'burst': 50, 'max_rate': 100},
+    'iam': {'rate': 5, 'burst': 10, 'max_rate': 20},
+    # lookup_events allows 2 calls a second per account and region
+    'cloudtrail': {'rate': 2, 'burst': 2, 'max_rate': 2},
+    'increase_step': 0.1,
+    'decrease_factor': 0.5,
+    'decrease_cooldown_seconds': 1,
+    'max_attempts': 8
+}
+
+__buckets = {}
+__buckets_lock = threading.Lock()
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every client calling one service of one account in one region.
+
+    The refill rate adapts to what AWS lets through: every successful call adds increase_step to it up to
+    max_rate and a throttling error multiplies it by decrease_factor down to min_rate, dropping the tokens saved
+    up so the next calls wait for the lowered rate. The calls already in flight when the limit was hit come back
+    throttled too, so the rate is lowered once per decrease_cooldown_seconds. Callers reserve their token under
+    the lock and sleep outside of it, so waiting threads are served in arrival order.
+    """
+
+    def __init__(self, rate, burst, min_rate, max_rate, increase_step=0.1, decrease_factor=0.5,
+                 decrease_cooldown_seconds=1):
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.min_rate = float(min_rate)
+        self.max_rate = float(max_rate)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.decrease_cooldown_seconds = decrease_cooldown_seconds
+        self.decreased_at = 0
+        self.tokens = float(burst)
+        self.updated_at = time.time()
+        self.throttles = 0
+        self.lock = threading.Lock()
+
+    def __refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def acquire(self):
+        """ Takes a token, waiting for it if needed, and returns the seconds waited """
+        with self.lock:
+            now = time.time()
+            self.__refill(now)
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+    def on_success(self):
+        with self.lock:
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttle(self):
+        with self.lock:
+            now = time.time()
+            self.throttles += 1
+            if now - self.decreased_at < self.decrease_cooldown_seconds:
+                return
+            self.__refill(now)
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            self.tokens = min(self.tokens, 0)
+            self.decreased_at = now
+
+
+def config():
+    rate_config = dict(default_config)
+    rate_config.update(context_helper.app().config.get('RATE_LIMIT_CONFIG') or {})
+    return rate_config
+
+
+def get_bucket(account_number, region, service):
+    key = (account_number, region, service)
+    with __buckets_lock:
+        if key not in __buckets:
+            rate_config = config()
+            limits = dict(default_config['default'])
+            limits.update(rate_config.get('default') or {})
+            limits.update(default_config.get(service) or {})
+            limits.update(rate_config.get(service) or {})
+            __buckets[key] = TokenBucket(limits['rate'], limits['burst'], limits['min_rate'], limits['max_rate'],
+                                         rate_config['increase_step'], rate_config['decrease_factor'],
+                                         rate_config['decrease_cooldown_seconds'])
+        return __buckets[key]
+
+
+def register(client, account_number, region, service):
+    """
+    Makes every request the client sends, retries included, take a token from the shared bucket first. The time
+    spent waiting is added to the waitMs of the operation in the collector telemetry.
+    """
+    bucket = get_bucket(account_number, region, service)
+
+    def on_request_created(operation_name=None, **kwargs):
+        # Emitted once per attempt, before the request is sent
+        wait = bucket.acquire()
+        telemetry = telemetry_helper.current()
+        if wait and telemetry is not None and operation_name:
+            telemetry.operation(operation_name)['waitMs'] += int(wait * 1000)
+
+    def on_needs_retry(response=None, **kwargs):
+        if not response or not response[1]:
+            return
+        if response[1].get('Error', {}).get('Code') in telemetry_helper.THROTTLING_ERROR_CODES:
+            bucket.on_throttle()
+
+    def on_after_call(http_response=None, **kwargs):
+        if http_response is not None and http_response.status_code < 400:
+            bucket.on_success()
+
+    client.meta.events.register('request-created', on_request_created)
+    client.meta.events.register('needs-retry', on_needs_retry)
+    client.meta.events.register('after-call', on_after_call)
+    return client
@@ -0,0 +1,140 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from botocore import xform_name
+
+THROTTLING_ERROR_CODES = ('Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+                          'TooManyRequestsException', 'ProvisionedThroughputExceededException',
+                          'TransactionInProgressException', 'RequestLimitExceeded', 'BandwidthLimitExceeded',
+                          'LimitExceededException', 'RequestThrottled', 'SlowDown', 'PriorRequestNotComplete',
+                          'EC2ThrottledException')
+
+__local = threading.local()
+
+
+class CollectorStopped(Exception):
+    """ Raised by the AWS calls of a collector run whose executor has given up on it """
+
+
+class CollectorTelemetry:
+    """ Counters of one collector run, filled by the botocore event handlers of the thread running it """
+
+    def __init__(self, name, region=None, stop=None):
+        self.name = name
+        self.region = region
+        self.stop = stop
+        self.started_at = time.time()
+        self.wall_time = 0
+        self.items = 0
+        self.operations = {}
+
+    def operation(self, operation_name):
+        if operation_name not in self.operations:
+            self.operations[operation_name] = {'calls': 0, 'pages': 0, 'throttles': 0, 'retries': 0, 'bytes': 0,
+                                               'waitMs': 0}
+        return self.operations[operation_name]
+
+    def to_dict(self):
+        record = {
+            'name': self.name,
+            'region': self.region if self.region else 'global',
+            'wallTimeMs': int(self.wall_time * 1000),
+            'items': self.items,
+            'operations': self.operations
+        }
+        for counter in ('calls', 'pages', 'throttles', 'retries', 'bytes', 'waitMs'):
+            record[counter] = sum(operation[counter] for operation in self.operations.values())
+        return record
+
+
+def current():
+    return getattr(__local, 'telemetry', None)
+
+
+@contextmanager
+def recording(name, region=None, stop=None):
+    """
+    Records the AWS calls made by the current thread while the block runs. Once the stop event is set those calls
+    raise CollectorStopped instead of going out.
+    """
+    telemetry = CollectorTelemetry(name, region, stop)
+    previous = current()
+    __local.telemetry = telemetry
+    try:
+        yield telemetry
+    finally:
+        telemetry.wall_time = time.time() - telemetry.started_at
+        __local.telemetry = previous
+
+
+def propagate(function):
+    """ Wraps function so calls it makes on another thread count towards the current thread's recording """
+    telemetry = current()
+
+    def run(*args, **kwargs):
+        previous = current()
+        __local.telemetry = telemetry
+        try:
+            return function(*args, **kwargs)
+        finally:
+            __local.telemetry = previous
+    return run
+
+
+def count_items(datapoints):
+    """ Number of resources in a collector result, non list datapoints count as one """
+    if not isinstance(datapoints, dict):
+        return 0
+    return sum(len(value) if isinstance(value, list) else 1 for value in datapoints.values() if value)
+
+
+def register(client):
+    """ Hooks the telemetry counters into a boto3 client, calls made outside a recording are not counted """
+    def on_after_call(http_response=None, parsed=None, model=None, **kwargs):
+        telemetry = current()
+        if telemetry is None or model is None:
+            return
+        operation = telemetry.operation(model.name)
+        operation['calls'] += 1
+        if client.can_paginate(xform_name(model.name)):
+            operation['pages'] += 1
+        if parsed:
+            operation['retries'] += parsed.get('ResponseMetadata', {}).get('RetryAttempts', 0)
+        if http_response is None:
+            return
+        if model.has_streaming_output or http_response.raw is None:
+            # Reading the content would consume streaming bodies like s3 get_object, the header has to do
+            operation['bytes'] += int(http_response.headers.get('content-length') or 0)
+        else:
+            # Already read and parsed by botocore at this point, content is cached
+            operation['bytes'] += len(http_response.content)
+
+    def on_needs_retry(response=None, operation=None, **kwargs):
+        telemetry = current()
+        if telemetry is None or operation is None or not response:
+            return
+        error_code = response[1].get('Error', {}).get('Code') if response[1] else None
+        if error_code in THROTTLING_ERROR_CODES:
+            telemetry.operation(operation.name)['throttles'] += 1
+
+    def on_before_call(**kwargs):
+        telemetry = current()
+        if telemetry is not None and telemetry.stop is not None and telemetry.stop.is_set():
+            raise CollectorStopped("Collector %s stopped" % telemetry.name)
+
+    client.meta.events.register('before-call', on_before_call)
+    client.meta.events.register('after-call', on_after_call)
+    client.meta.events.register('needs-retry', on_needs_retry)
+    return client
+
+
+def summarise(records):
+    """ Account level totals of a list of collector records """
+    totals = {'collectors': len(records), 'wallTimeMs': 0, 'items': 0, 'calls': 0, 'pages': 0, 'throttles': 0,
+              'retries': 0, 'bytes': 0, 'waitMs': 0}
+    for record in records:
+        for counter in totals:
+            if counter != 'collectors':
+                totals[counter] += record.get(counter, 0)
+    return totals
@@ -50,6 +50,18 @@ def unused_resources(account_id):
     return jsonify(unused_resource_list)
 
 
+@aws_api.route('/<account_id>/insights/unusedResources/securityGroups/<group_id>/usage', methods=['GET'])
+def security_group_usage(account_id, group_id):
+    region = request.args.get('region')
+    if not region:
+        return jsonify({'success': False, 'error_code': 'REGION_REQUIRED', 'message': 'region is required'})
+    response = AWS.get_dashboard_data(account_id)
+    if not response['success']:
+        return jsonify(response)
+    return jsonify(UnusedResourcesServices.get_security_group_users(account_id, response['timestamp'], region,
+                                                                    group_id))
+
+
 @aws_api.route('/<account_id>/insights/securityIssues', methods=['GET'])
 def security_issues(account_id):
     response = AWS.get_dashboard_data(account_id)
@@ -139,6 +151,8 @@ def get_ssm_instances(account_id):
         if filters and filters.get('ssm'):
             aws = AWS()
             return jsonify({'success': True, 'resource_list': aws.get_ssm_instances(account_id)})
+        elif request.args.get('pageSize') or request.args.get('cursor'):
+            return __get_datapoints_page(account_id, "ec2s")
         else:
             intent_history = aws_intent_history.get_latest_by_account_id(account_id)
             instances = aws_datapoint_history.get_datapoints_by_type(account_id, intent_history['timestamp'], "ec2s")
@@ -149,13 +163,71 @@ def get_ssm_instances(account_id):
                         'error_code': 'SOME_EXCEPTION'})
 
 
+@aws_api.route('/<account_id>/resources/<datapoint>', methods=['GET'])
+def get_resources(account_id, datapoint):
+    if datapoint not in Constants.datapoint_display_names:
+        return jsonify({'success': False, 'error_code': 'INVALID_PARAMS', 'message': "Unknown resource type."})
+    try:
+        return __get_datapoints_page(account_id, datapoint)
+    except BaseException as e:
+        print(traceback.format_exc())
+        return jsonify({'success': False, 'error': "Some exception while loading resources",
+                        'error_code': 'SOME_EXCEPTION'})
+
+
+def __get_datapoints_page(account_id, datapoint):
+    """ A page of the datapoint from the latest data fetch, the nextCursor returned is passed as cursor for the next """
+    try:
+        page_size = int(request.args.get('pageSize') or aws_datapoint_history.DEFAULT_PAGE_SIZE)
+    except ValueError:
+        page_size = 0
+    if not 0 < page_size <= aws_datapoint_history.MAX_PAGE_SIZE:
+        return jsonify({'success': False, 'error_code': 'INVALID_PARAMS',
+                        'message': "pageSize must be between 1 and %s." % aws_datapoint_history.MAX_PAGE_SIZE})
+    intent_history = aws_intent_history.get_latest_by_account_id(account_id)
+    if not intent_history:
+        return jsonify({'success': False, 'error_code': 'NOT_FOUND', 'message': 'No data fetch found'})
+    try:
+        items, next_cursor = aws_datapoint_history.get_datapoints_page(account_id, intent_history['timestamp'],
+                                                                       datapoint, page_size,
+                                                                       request.args.get('cursor'))
+    except ValueError:
+        return jsonify({'success': False, 'error_code': 'INVALID_CURSOR', 'message': "Invalid cursor."})
+    return jsonify({'success': True, 'resource_list': items, 'nextCursor': next_cursor})
+
+
 @aws_api.route('/<account_id>/baseline/fetchSchedule', methods=['POST'])
 def initiate_data_fetch(account_id):
     email = context_helper.get_current_session()['attributes']['email']
-    response = DataFetchService.schedule_data_fetch_for_account(email, account_id)
+    request_json = request.get_json(silent=True) or {}
+    error = DataFetchService.validate_fetch_request(context_helper.get_current_session(),
+                                                    request_json.get('datapoints'), request_json.get('regions'))
+    if error:
+        return jsonify(error)
+    response = DataFetchService.schedule_data_fetch_for_account(email, account_id, request_json.get('datapoints'),
+                                                                request_json.get('regions'))
     return jsonify(response)
 
 
+@aws_api.route('/<account_id>/admin/fetchTelemetry', methods=['GET'])
+def get_fetch_telemetry(account_id):
+    if not permission_helper.is_admin(context_helper.get_current_session()['attributes']['userId']):
+        return jsonify({'unauthorized': True}), 401
+    intent_history = aws_intent_history.get_telemetry(account_id, request.args.get('timestamp'))
+    if not intent_history:
+        return jsonify({'success': False, 'error_code': 'NOT_FOUND', 'message': 'No data fetch found'})
+    return jsonify({'success': True, 'timestamp': intent_history['timestamp'],
+                    'telemetry': intent_history.get('telemetry')})
+
+
+@aws_api.route('/<account_id>/admin/cacheStats', methods=['GET'])
+def get_cache_stats(account_id):
+    if not permission_helper.is_admin(context_helper.get_current_session()['attributes']['userId']):
+        return jsonify({'unauthorized': True}), 401
+    return jsonify({'success': True, 'permissions': permission_helper.permission_cache_stats(),
+                    'sessions': context_helper.session_cache_stats()})
+
+
 @aws_api.route('/<account_id>/instances', methods=['PUT'])
 def enable_cw_for_instance(account_id):
     try:
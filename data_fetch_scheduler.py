@@ -1,7 +1,8 @@
 import json
 import os
+from datetime import datetime, timedelta
 
-from autobot_helpers import boto3_helper, context_helper
+from autobot_helpers import context_helper
 from models import cloud_service_provider
 from services.aws.data_fetch_service import DataFetchService
 
@@ -10,22 +11,20 @@ def schedule(event, context):
     os.environ['ROOT_PATH'] = os.path.dirname(os.path.realpath(__file__))
     try:
         print('Running schedule on '+context_helper.app().config["ENVIRONMENT"])
-        batch = 2
-        accounts = cloud_service_provider.get_accounts_to_be_indexed(batch)
-        print('found accounts to be indexed -------------')
-        print(accounts)
-        print('found accounts to be indexed -------------')
-        sns_client = boto3_helper.get_client('sns', autobot_resources=True)
-        current_count = 0
-        for account in accounts:
-            account_id = account['accountId']
-            response = DataFetchService.schedule_data_fetch_for_account(account['userId'], account_id)
-            current_count += 1
-            if not current_count < batch:
-                break
-            print(response)
-        return json.dumps({'success': True})
+        if event and event.get('backfill'):
+            count = cloud_service_provider.backfill_index_schedule()
+            print('backfilled index schedule of ' + str(count) + ' accounts')
+            return json.dumps({'success': True, 'backfilled': count})
+        config = DataFetchService.schedule_config()
+        accounts = cloud_service_provider.get_accounts_to_be_indexed(config['jobs_per_tick'])
+        print('found ' + str(len(accounts)) + ' accounts to be indexed')
+        retry_at = (datetime.utcnow() + timedelta(minutes=config['retry_after_minutes'])).isoformat()
+        claimed = [account for account in accounts
+                   if cloud_service_provider.claim_for_indexing(account['userId'], account['accountId'],
+                                                                account['indexDueAt'], retry_at)]
+        response = DataFetchService.schedule_data_fetch_for_accounts(claimed)
+        print(response)
+        return json.dumps({'success': True, 'scheduled': response['published'], 'failed': response['failed']})
     except BaseException as e:
         context_helper.logger().exception("Some error occured while scheduling")
         return json.dumps({'success': False, 'error_code': 'EXCEPTION', 'message': repr(e)})
-
@@ -1,9 +1,25 @@
 from services.aws.data_fetch_service import DataFetchService
 from services.aws.aws import AWS
+from services.aws.index_lease import IndexLease
 from autobot_helpers import context_helper
 import json
 import traceback
 import os
+import time
+
+
+def parse_message(message):
+    """
+    The message is either the account id or a JSON request with accountId and optionally the datapoints of a
+    partial refresh, the shard and timestamp of a sharded fetch and the leaseOwner of a resumed or sharded fetch
+    """
+    try:
+        request = json.loads(message)
+    except ValueError:
+        return {'accountId': message}
+    if isinstance(request, dict):
+        return request
+    return {'accountId': message}
 
 
 def fetch(event, context):
@@ -11,7 +27,8 @@ def fetch(event, context):
     os.environ['ROOT_PATH'] = os.path.dirname(os.path.realpath(__file__))
     try:
         try:
-            account_id = event['Records'][0]['Sns']['Message']
+            request = parse_message(event['Records'][0]['Sns']['Message'])
+            account_id = request.get('accountId')
             email = event['Records'][0]['Sns']['Subject']
         except:
             return json.dumps({'success': False,
@@ -21,20 +38,56 @@ def fetch(event, context):
             return json.dumps(
                 {'success': False, 'error_code': 'DF_INSUFFICIENT_DATA', 'error': 'Insufficient data provided'})
         context_helper.logger().info("Email received="+email)
-        result = context_helper.initialize(email, account_id)
-        if not result['success']:
-            DataFetchService.index_failure_handler(email, account_id, result)
-            return json.dumps(result)
-        AWS.refresh_access_policy_for_current_account()
-        response = DataFetchService.fetch_data()
-        if response['success']:
-            DataFetchService.index_success_handler(email, account_id)
-        else:
-            DataFetchService.index_failure_handler(email, account_id, response)
-        return json.dumps(response)
+        config = DataFetchService.fetch_config()
+        lease = IndexLease(email, account_id, request.get('leaseOwner'), config['lease_seconds'],
+                           config['lease_renew_seconds'])
+        if not lease.acquire():
+            return json.dumps({'success': False, 'error_code': 'INDEX_IN_PROGRESS',
+                               'message': 'Account is being indexed by another fetch'})
+        keep_lease = False
+        try:
+            result = context_helper.initialize(email, account_id)
+            if not result['success']:
+                DataFetchService.index_failure_handler(email, account_id, result)
+                return json.dumps(result)
+            AWS.refresh_access_policy_for_current_account()
+            if request.get('shard'):
+                response = DataFetchService.fetch_shard(request['timestamp'], request['shard'], lease)
+                if not response.get('aggregated'):
+                    # The other shards still run under the same lease
+                    keep_lease = True
+                elif response['success']:
+                    DataFetchService.index_success_handler(email, account_id)
+                else:
+                    DataFetchService.index_failure_handler(email, account_id, response)
+                return json.dumps(response)
+            if request.get('datapoints'):
+                # Partial refreshes don't count as an index of the account, successful or not
+                return json.dumps(DataFetchService.refresh_data(request['datapoints'], request.get('regions'), lease))
+            deadline = None
+            if context and hasattr(context, 'get_remaining_time_in_millis'):
+                deadline = time.time() + context.get_remaining_time_in_millis() / 1000.0
+            response = DataFetchService.fetch_data(deadline, lease)
+            if response.get('sharded'):
+                keep_lease = True
+            elif response['success']:
+                DataFetchService.index_success_handler(email, account_id)
+            elif response.get('resume'):
+                # Progress is checkpointed, queue the next invocation instead of counting a failure, it takes the
+                # lease over
+                keep_lease = True
+                DataFetchService.schedule_data_fetch_for_account(email, account_id, lease_owner=lease.owner)
+            elif response.get('error_code') == 'LEASE_LOST':
+                keep_lease = True
+            else:
+                DataFetchService.index_failure_handler(email, account_id, response)
+            return json.dumps(response)
+        finally:
+            if not keep_lease:
+                lease.release()
     except BaseException as e:
         context_helper.logger().exception("Some exception while fetching data")
         traceback.print_exc()
         error_desc = traceback.format_exc()
         DataFetchService.index_failure_handler(email, account_id, error_desc)
-        return json.dumps({'success': False, 'error_code': 'EXCEPTION', 'message': error_desc})
\ No newline at end of file
+        return json.dumps({'success': False, 'error_code': 'EXCEPTION', 'message': error_desc})
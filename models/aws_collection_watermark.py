@@ -0,0 +1,29 @@
+from datetime import datetime
+
+from autobot_helpers import boto3_helper
+
+
+def __get_table():
+    return boto3_helper.get_dynamo_db_table("aws_collection_watermarks", True)
+
+
+def __collection(region, datapoint):
+    return region + '#' + datapoint
+
+
+def get(account_id, region, datapoint):
+    result = __get_table().get_item(
+        Key={'accountId': account_id, 'collection': __collection(region, datapoint)},
+        ConsistentRead=True
+    )
+    if result and result.get('Item'):
+        return result['Item']
+    return None
+
+
+def save(account_id, region, datapoint, watermark):
+    item = dict(watermark)
+    item['accountId'] = account_id
+    item['collection'] = __collection(region, datapoint)
+    item['updatedAt'] = datetime.utcnow().isoformat()
+    __get_table().put_item(Item=item)
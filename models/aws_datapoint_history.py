@@ -1,73 +1,539 @@
+import base64
+import json
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
 from boto3.dynamodb.conditions import Key, Attr
 from autobot_helpers import boto3_helper
-from services.aws.utils import Constants
+from models import aws_intent_history
+from services.aws import records
+from services.aws.utils import Constants, Helpers
+
+
+# Snapshots of version 2 keep the record's own type as sourceType, their items can be read back as collected.
+# From version 3 items also carry regionType, so the snapshot and its base are in REGION_TYPE_INDEX.
+SNAPSHOT_VERSION = 3
+REGION_TYPE_SNAPSHOT_VERSION = 3
+# GSIs with partition key intentId (S), projecting the table keys and isDeleted (INCLUDE), so a lookup reads only
+# the keys of what it matches and the items are then read by key:
+# - ID_INDEX, sort key id (S)
+# - REGION_TYPE_INDEX, sort key regionType (S), region + '#' + datapoint of the item
+ID_INDEX = 'intentId-id-index'
+REGION_TYPE_INDEX = 'intentId-regionType-index'
+# BatchGetItem takes up to 100 keys a call
+BATCH_GET_SIZE = 100
+BATCH_GET_WORKERS = 4
+BATCH_GET_MAX_ATTEMPTS = 8
+# Items per page of the paged reads
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
 
 
 def __get_table():
     return boto3_helper.get_dynamo_db_table("aws_datapoint_history", True)
 
 
-def get_datapoints_by_id(account_number, timestamp, resource_id):
-    table = __get_table()
-    result = table.query(
-        KeyConditionExpression=Key('intentId').eq(account_number + '_' + timestamp),
-        FilterExpression=Attr('id').eq(resource_id),
+def __snapshot_intent_ids(account_number, timestamp):
+    """ Returns the (base, delta) partitions making up a snapshot, base is None for full snapshots """
+    snapshot = aws_intent_history.get_snapshot_info(timestamp, account_number)
+    if snapshot and snapshot.get('type') == 'delta':
+        return account_number + '_' + snapshot['baseTimestamp'], account_number + '_' + timestamp
+    return None, account_number + '_' + timestamp
+
+
+def __merge_snapshot(base_items, delta_items):
+    """ Applies delta items over base items, tombstones remove the base copy """
+    merged = OrderedDict((item['itemId'], item) for item in base_items)
+    for item in delta_items:
+        if item.get('isDeleted'):
+            merged.pop(item['itemId'], None)
+        else:
+            merged[item['itemId']] = item
+    return list(merged.values())
+
+
+def __query_by_id(intent_id, resource_id):
+    """ Keys and isDeleted of the partition's first item with the id, looked up in ID_INDEX """
+    result = __get_table().query(
+        IndexName=ID_INDEX,
+        KeyConditionExpression=Key('intentId').eq(intent_id) & Key('id').eq(resource_id),
+        Limit=1
     )
     if result and result.get('Items'):
         return result['Items'][0]
 
 
-def get_datapoints_by_ids(account_number, timestamp, resource_ids):
-    table = __get_table()
+def __query_region_keys(intent_id, datapoint, region):
+    """ Keys and isDeleted of the datapoint's items of one region in the partition, read from REGION_TYPE_INDEX """
+    kwargs = {
+        'IndexName': REGION_TYPE_INDEX,
+        'KeyConditionExpression': Key('intentId').eq(intent_id) & Key('regionType').eq(region + '#' + datapoint)
+    }
+    keys = []
+    while True:
+        result = __get_table().query(**kwargs)
+        keys.extend(result.get('Items', []))
+        if not result.get('LastEvaluatedKey'):
+            return keys
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def __query_region(account_number, timestamp, datapoint, region):
+    """ The datapoint's items of one region of a snapshot, in itemId order, reading only those items """
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    delta_keys = dict((key['itemId'], key) for key in __query_region_keys(intent_id, datapoint, region))
+    items = __batch_get(intent_id, [item_id for item_id, key in delta_keys.items() if not key.get('isDeleted')])
+    if base_intent_id:
+        items.update(__batch_get(base_intent_id, [key['itemId'] for key in
+                                                  __query_region_keys(base_intent_id, datapoint, region)
+                                                  if key['itemId'] not in delta_keys]))
+    return [items[item_id] for item_id in sorted(items)]
+
+
+def __batch_get_chunk(client, table_name, keys, projection=None):
+    """ Reads one BatchGetItem worth of keys, retrying the unprocessed ones with jittered exponential backoff """
     items = []
-    if len(resource_ids) > 99:
-        result = table.query(
-            KeyConditionExpression=Key('intentId').eq(account_number + '_'+timestamp),
-        )
-        if result and result.get('Items'):
-            for item in result['Items']:
-                if item['id'] in resource_ids:
-                    items.append(item)
+    request_items = {table_name: {'Keys': keys}}
+    if projection:
+        request_items[table_name]['ProjectionExpression'] = projection
+    for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=request_items)
+        items.extend(response.get('Responses', {}).get(table_name, []))
+        request_items = response.get('UnprocessedKeys')
+        if not request_items:
+            return items
+        time.sleep(min(0.05 * 2 ** attempt, 5) * random.uniform(0.5, 1))
+    raise Exception("%d keys of %s still unprocessed after %d attempts" % (
+        len(request_items[table_name]['Keys']), table_name, BATCH_GET_MAX_ATTEMPTS))
+
+
+def __batch_get(intent_id, item_ids, projection=None):
+    """ Returns the items of the partition with the given itemIds as {itemId: item}, chunks are read in parallel """
+    if not item_ids:
+        return {}
+    table = __get_table()
+    # Clients are thread safe, unlike the table resource
+    client = table.meta.client
+    chunks = [[{'intentId': intent_id, 'itemId': item_id} for item_id in item_ids[start:start + BATCH_GET_SIZE]]
+              for start in range(0, len(item_ids), BATCH_GET_SIZE)]
+    if len(chunks) == 1:
+        results = [__batch_get_chunk(client, table.name, chunks[0], projection)]
     else:
-        result = table.query(
-            KeyConditionExpression=Key('intentId').eq(account_number + '_' + timestamp),
-            FilterExpression=Attr('id').is_in(resource_ids),
-        )
-        if result and result.get('Items'):
-            items = result['Items']
-    return items
+        with ThreadPoolExecutor(max_workers=min(BATCH_GET_WORKERS, len(chunks))) as executor:
+            results = list(executor.map(lambda keys: __batch_get_chunk(client, table.name, keys, projection),
+                                        chunks))
+    return dict((item['itemId'], item) for items in results for item in items)
+
+
+def __query_page(intent_id, data_type, limit=None, start_key=None):
+    """ One page of the datapoint's items in the partition and the key to continue from, None after the last """
+    kwargs = {'KeyConditionExpression': Key('intentId').eq(intent_id) & Key('itemId').begins_with(data_type + '_')}
+    if limit:
+        kwargs['Limit'] = limit
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    result = __get_table().query(**kwargs)
+    return result.get('Items', []), result.get('LastEvaluatedKey')
+
+
+def __iter_by_type(intent_id, data_type):
+    start_key = None
+    while True:
+        items, start_key = __query_page(intent_id, data_type, start_key=start_key)
+        for item in items:
+            yield item
+        if not start_key:
+            return
+
+
+def __encode_cursor(timestamp, data_type, phase, key=None):
+    position = {'t': timestamp, 'd': data_type, 'phase': phase, 'key': key}
+    return base64.urlsafe_b64encode(json.dumps(position, default=Helpers.json_default).encode('utf-8')).decode('ascii')
+
+
+def __decode_cursor(cursor, data_type):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError("Invalid cursor")
+    if not isinstance(position, dict) or position.get('phase') not in ('base', 'delta') or \
+            not isinstance(position.get('t'), str) or position.get('d') != data_type:
+        raise ValueError("Invalid cursor")
+    return position
+
+
+def __check_cursor_key(key, intent_id, data_type):
+    """ The start key of a cursor has to be a key of the datapoint in the partition being paged """
+    if key is None:
+        return
+    if not isinstance(key, dict) or set(key) != {'intentId', 'itemId'} or key['intentId'] != intent_id or \
+            not isinstance(key['itemId'], str) or not key['itemId'].startswith(data_type + '_'):
+        raise ValueError("Invalid cursor")
+
+
+def get_datapoints_by_id(account_number, timestamp, resource_id):
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    key = __query_by_id(intent_id, resource_id)
+    if key and key.get('isDeleted'):
+        return None
+    if not key and base_intent_id:
+        key = __query_by_id(base_intent_id, resource_id)
+    if key:
+        return __get_table().get_item(Key={'intentId': key['intentId'], 'itemId': key['itemId']}).get('Item')
+
+
+def get_datapoints_by_item_ids(account_number, timestamp, item_ids):
+    """
+    Returns the items of a snapshot with the given itemIds (datapoint + '_' + id) in the order asked for, the ones
+    not in the snapshot are left out. Only the asked for items are read, by key.
+    """
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    item_ids = list(OrderedDict.fromkeys(item_ids))
+    items = __batch_get(intent_id, item_ids)
+    if base_intent_id:
+        # Items the delta has no copy or tombstone of are unchanged since the base
+        items.update(__batch_get(base_intent_id, [item_id for item_id in item_ids if item_id not in items]))
+    return [items[item_id] for item_id in item_ids if item_id in items and not items[item_id].get('isDeleted')]
+
+
+def iter_datapoints_by_type(account_number, timestamp, data_type):
+    """
+    Yields the datapoint's items of a snapshot page by page, holding one page at a time. For a delta snapshot only
+    the delta's items are held, the base is streamed with their changes applied.
+    """
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    if not base_intent_id:
+        for item in __iter_by_type(intent_id, data_type):
+            yield item
+        return
+    delta = OrderedDict((item['itemId'], item) for item in __iter_by_type(intent_id, data_type))
+    for item in __iter_by_type(base_intent_id, data_type):
+        item = delta.pop(item['itemId'], item)
+        if not item.get('isDeleted'):
+            yield item
+    for item in delta.values():
+        if not item.get('isDeleted'):
+            yield item
 
 
 def get_datapoints_by_type(account_number, timestamp, data_type):
-    table = __get_table()
-    result = table.query(
-        KeyConditionExpression=Key('intentId').eq(account_number + '_' + timestamp) & Key('itemId').begins_with(data_type),
-    )
-    if result and result.get('Items'):
-        items = result['Items']
+    items = list(iter_datapoints_by_type(account_number, timestamp, data_type))
+    if items:
         return items
 
 
+def get_datapoints_page(account_number, timestamp, data_type, page_size, cursor=None):
+    """
+    Returns a page of up to page_size of the datapoint's items of a snapshot and the opaque cursor of the next page,
+    None after the last one. A cursor keeps to the snapshot it was made for, its timestamp wins over the one passed.
+    A page can come back short or even empty with a cursor, the items end only when the cursor is None. Raises
+    ValueError for a cursor this didn't make or made for another account or datapoint.
 
-def save_all_resources(account_number, timestamp, dataset):
+    A delta snapshot is paged through its base first, each page's items replaced by their delta copies read by key,
+    then through the delta for the items added since the base.
+    """
+    position = __decode_cursor(cursor, data_type) if cursor else {'t': timestamp, 'phase': 'base', 'key': None}
+    timestamp = position['t']
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    if not base_intent_id:
+        if position['phase'] != 'base':
+            raise ValueError("Invalid cursor")
+        __check_cursor_key(position['key'], intent_id, data_type)
+        items, last_key = __query_page(intent_id, data_type, page_size, position['key'])
+        return items, __encode_cursor(timestamp, data_type, 'base', last_key) if last_key else None
+    if position['phase'] == 'base':
+        __check_cursor_key(position['key'], base_intent_id, data_type)
+        base_items, last_key = __query_page(base_intent_id, data_type, page_size, position['key'])
+        delta = __batch_get(intent_id, [item['itemId'] for item in base_items])
+        items = [delta.get(item['itemId'], item) for item in base_items]
+        next_cursor = __encode_cursor(timestamp, data_type, 'base', last_key) if last_key else \
+            __encode_cursor(timestamp, data_type, 'delta')
+        return [item for item in items if not item.get('isDeleted')], next_cursor
+    __check_cursor_key(position['key'], intent_id, data_type)
+    delta_items, last_key = __query_page(intent_id, data_type, page_size, position['key'])
+    delta_items = [item for item in delta_items if not item.get('isDeleted')]
+    in_base = __batch_get(base_intent_id, [item['itemId'] for item in delta_items], projection='itemId')
+    items = [item for item in delta_items if item['itemId'] not in in_base]
+    return items, __encode_cursor(timestamp, data_type, 'delta', last_key) if last_key else None
+
+
+def get_content_hashes(account_number, timestamp, regions=None):
+    """
+    Returns the content hashes of a base snapshot grouped as {(datapoint, region): {itemId: contentHash}}, only
+    for the given regions when set. Only the key and hash attributes are read.
+    """
+    table = __get_table()
+    groups = {}
+    kwargs = {
+        'KeyConditionExpression': Key('intentId').eq(account_number + '_' + timestamp),
+        'ProjectionExpression': "itemId, contentHash, #region",
+        'ExpressionAttributeNames': {'#region': 'region'}
+    }
+    if regions:
+        kwargs['FilterExpression'] = Attr('region').is_in(list(regions))
+    while True:
+        result = table.query(**kwargs)
+        for item in result.get('Items', []):
+            datapoint = item['itemId'].split('_', 1)[0]
+            groups.setdefault((datapoint, item.get('region')), {})[item['itemId']] = item.get('contentHash')
+        if not result.get('LastEvaluatedKey'):
+            return groups
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def get_batch_writer():
+    return __get_table().batch_writer()
+
+
+def build_item(intent_id, datapoint, region, item):
+    """
+    Stored copy of a collected record. The 'type' attribute holds the datapoint's display name, a 'type' of the
+    record itself is kept as sourceType so the record can be rebuilt by to_datapoint.
+    """
+    item = Helpers.cleaned_for_dynamo(item.to_item() if isinstance(item, records.Record) else item)
+    if 'type' in item:
+        item['sourceType'] = item['type']
+    item['itemId'] = datapoint + '_' + item['id']
+    item['region'] = region
+    item['regionType'] = region + '#' + datapoint
+    item['type'] = Constants.datapoint_display_names[datapoint]
+    item['contentHash'] = Helpers.content_hash(item)
+    item['intentId'] = intent_id
+    return item
+
+
+def build_tombstone(intent_id, item_id, datapoint, region):
+    return {
+        'intentId': intent_id,
+        'itemId': item_id,
+        'id': item_id.split('_', 1)[1],
+        'region': region,
+        'regionType': region + '#' + datapoint,
+        'type': Constants.datapoint_display_names.get(datapoint),
+        'isDeleted': True
+    }
+
+
+def to_datapoint(item):
+    """ Rebuilds the collected record from a stored item, blank strings stay None """
+    record = Helpers.from_dynamo(item)
+    datapoint = record['itemId'].split('_', 1)[0] if 'itemId' in record else None
+    for key in ('intentId', 'itemId', 'contentHash', 'type', 'regionType'):
+        record.pop(key, None)
+    if 'sourceType' in record:
+        record['type'] = record.pop('sourceType')
+    if datapoint in records.datapoint_records:
+        return records.datapoint_records[datapoint].from_item(record)
+    return record
+
+
+def __query_datapoint(intent_id, datapoint=None, projection=None, region=None):
     table = __get_table()
-    with table.batch_writer() as batch:
+    key_condition = Key('intentId').eq(intent_id)
+    if datapoint:
+        key_condition = key_condition & Key('itemId').begins_with(datapoint + '_')
+    kwargs = {'KeyConditionExpression': key_condition}
+    if region:
+        kwargs['FilterExpression'] = Attr('region').eq(region)
+    if projection:
+        kwargs['ProjectionExpression'] = projection
+        kwargs['ExpressionAttributeNames'] = {'#region': 'region'}
+    items = []
+    while True:
+        result = table.query(**kwargs)
+        items.extend(result.get('Items', []))
+        if not result.get('LastEvaluatedKey'):
+            return items
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def __group_by_region(items):
+    groups = {}
+    for item in items:
+        groups.setdefault(item.get('region'), []).append(item)
+    return groups
+
+
+def get_snapshot_datapoint(account_number, timestamp, datapoint, region=None):
+    """
+    Returns all records of a datapoint in a snapshot as collected, grouped as {region: [records]}. With a region
+    only its records are returned, read through REGION_TYPE_INDEX for snapshots written with regionType.
+    """
+    if region and int((aws_intent_history.get_snapshot_info(timestamp, account_number) or {}).get('version', 1)) >= \
+            REGION_TYPE_SNAPSHOT_VERSION:
+        items = __query_region(account_number, timestamp, datapoint, region)
+        return {region: [to_datapoint(item) for item in items]} if items else {}
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    items = __query_datapoint(intent_id, datapoint, region=region)
+    if base_intent_id:
+        items = __merge_snapshot(__query_datapoint(base_intent_id, datapoint, region=region), items)
+    return {region: [to_datapoint(item) for item in region_items]
+            for region, region_items in __group_by_region(items).items()}
+
+
+def read_snapshot(account_number, timestamp, base_timestamp=None):
+    """
+    Returns every record of a snapshot as collected, grouped as {region: {datapoint: [records]}}. The base is
+    passed in so snapshots can be read before their intent is saved.
+    """
+    items = __query_datapoint(account_number + '_' + timestamp)
+    if base_timestamp and base_timestamp != timestamp:
+        items = __merge_snapshot(__query_datapoint(account_number + '_' + base_timestamp), items)
+    regions = {}
+    for region, region_items in __group_by_region(items).items():
+        for item in region_items:
+            datapoint = item['itemId'].split('_', 1)[0]
+            regions.setdefault(region, {}).setdefault(datapoint, []).append(to_datapoint(item))
+    return regions
+
+
+def read_snapshot_region(account_number, timestamp, base_timestamp, region, datapoints):
+    """
+    Returns the records of the given datapoints of one region of a snapshot as collected, as {datapoint: [records]}.
+    Like read_snapshot, the base is passed in so a snapshot can be read while it is being written.
+    """
+    intent_id = account_number + '_' + timestamp
+    base_intent_id = account_number + '_' + base_timestamp if base_timestamp and base_timestamp != timestamp else None
+    region_records = {}
+    for datapoint in datapoints:
+        items = __query_datapoint(intent_id, datapoint, region=region)
+        if base_intent_id:
+            items = __merge_snapshot(__query_datapoint(base_intent_id, datapoint, region=region), items)
+        region_records[datapoint] = [to_datapoint(item) for item in items]
+    return region_records
+
+
+def merge_resources(account_number, timestamp, datapoint, region_items):
+    """
+    Replaces the records of a datapoint in the given regions of an existing snapshot with freshly collected ones,
+    region_items being {region: [records]}. A full snapshot is updated in place. For a delta snapshot only the
+    delta partition is touched, so the base stays valid for every other delta using it: records that now match
+    the base drop their delta copy, changed records are written and records gone from AWS are tombstoned.
+    Returns the number of written and deleted items.
+    """
+    base_intent_id, intent_id = __snapshot_intent_ids(account_number, timestamp)
+    projection = "itemId, contentHash, isDeleted, #region"
+    current = __group_by_region(__query_datapoint(intent_id, datapoint, projection))
+    base = __group_by_region(__query_datapoint(base_intent_id, datapoint, projection)) if base_intent_id else {}
+    changes = 0
+    with get_batch_writer() as batch:
+        for region, items in region_items.items():
+            current_items = {item['itemId']: item for item in current.get(region, [])}
+            base_hashes = {item['itemId']: item.get('contentHash') for item in base.get(region, [])}
+            seen = set()
+            for item in items or []:
+                item = build_item(intent_id, datapoint, region, item)
+                seen.add(item['itemId'])
+                current_item = current_items.get(item['itemId'])
+                if base_intent_id and base_hashes.get(item['itemId']) == item['contentHash']:
+                    if current_item:
+                        batch.delete_item(Key={'intentId': intent_id, 'itemId': item['itemId']})
+                        changes += 1
+                elif not current_item or current_item.get('isDeleted') or \
+                        current_item.get('contentHash') != item['contentHash']:
+                    batch.put_item(Item=item)
+                    changes += 1
+            for item_id in base_hashes:
+                if item_id not in seen and not current_items.get(item_id, {}).get('isDeleted'):
+                    batch.put_item(Item=build_tombstone(intent_id, item_id, datapoint, region))
+                    changes += 1
+            for item_id in current_items:
+                if item_id not in seen and item_id not in base_hashes:
+                    batch.delete_item(Key={'intentId': intent_id, 'itemId': item_id})
+                    changes += 1
+    return changes
+
+
+class SnapshotWriter:
+    """
+    Writes the datapoints of one fetch either as a full base snapshot or as a delta against a base snapshot.
+
+    Every item is stored with a contentHash of its cleaned content. In delta mode only items that are new or whose
+    hash differs from the base are written, and base items missing from a reported (datapoint, region) group are
+    written as isDeleted tombstones. Each delta is relative to the base rather than to the previous delta, so a
+    reader never needs more than the two partitions. A writer limited to some regions only compares against and
+    tombstones the base items of those regions, so several writers can fill one snapshot.
+    """
+
+    def __init__(self, account_number, timestamp, base_timestamp=None, item_count=0, delta_count=0, regions=None):
+        self.account_number = account_number
+        self.timestamp = timestamp
+        self.base_timestamp = base_timestamp
+        self.base_groups = get_content_hashes(account_number, base_timestamp, regions) if base_timestamp else {}
+        self.item_count = item_count
+        self.delta_count = delta_count
+        self.batch = None
+
+    def __enter__(self):
+        self.batch = get_batch_writer().__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return self.batch.__exit__(exc_type, exc_value, tb)
+
+    def save(self, datapoint, region, items):
+        """
+        Queues the complete item list of one datapoint in one region. Non list datapoints like accountSummary
+        are not stored as items.
+        """
+        if items is None:
+            items = []
+        if not isinstance(items, list):
+            return 0
+        base_hashes = self.base_groups.pop((datapoint, region), {})
+        for item in items:
+            item = self.__item(datapoint, region, item)
+            self.item_count += 1
+            if self.base_timestamp and base_hashes.pop(item['itemId'], None) == item['contentHash']:
+                continue
+            self.batch.put_item(Item=item)
+            self.delta_count += 1
+        for item_id in base_hashes:
+            self.__delete(item_id, datapoint, region)
+        return len(items)
+
+    def skip(self, datapoint, region):
+        """ Marks a group as already saved by an earlier invocation of a resumed fetch """
+        self.base_groups.pop((datapoint, region), None)
+
+    def flush(self):
+        """ Sends everything queued so far, the writer stays usable """
+        self.batch.__exit__(None, None, None)
+        self.batch = get_batch_writer().__enter__()
+
+    def finish(self):
+        """
+        Tombstones the base groups the fetch didn't report at all, e.g. a region that is no longer active, and
+        returns the snapshot info to be saved with the intent.
+        """
+        for (datapoint, region), base_hashes in self.base_groups.items():
+            for item_id in base_hashes:
+                self.__delete(item_id, datapoint, region)
+        self.base_groups = {}
+        return {
+            'type': 'delta' if self.base_timestamp else 'base',
+            'version': SNAPSHOT_VERSION,
+            'baseTimestamp': self.base_timestamp or self.timestamp,
+            'itemCount': self.item_count,
+            'deltaCount': self.delta_count
+        }
+
+    def __item(self, datapoint, region, item):
+        return build_item(self.account_number + '_' + self.timestamp, datapoint, region, item)
+
+    def __delete(self, item_id, datapoint, region):
+        self.batch.put_item(Item=build_tombstone(self.account_number + '_' + self.timestamp, item_id, datapoint,
+                                                 region))
+        self.delta_count += 1
+
+
+def save_all_resources(account_number, timestamp, dataset):
+    with SnapshotWriter(account_number, timestamp) as writer:
         for region in dataset['regionalData']:
             for datapoint in dataset['regionalData'][region]['datapoints']:
-                if dataset['regionalData'][region]['datapoints'][datapoint]:
-                    for item in dataset['regionalData'][region]['datapoints'][datapoint]:
-                        item['intentId'] = account_number + '_' + timestamp
-                        item['itemId'] = datapoint+'_'+item['id']
-                        item['region'] = region
-                        item['type'] = Constants.datapoint_display_names[datapoint]
-                        batch.put_item(Item=item)
+                writer.save(datapoint, region, dataset['regionalData'][region]['datapoints'][datapoint])
         for datapoint in dataset['globalData']['datapoints']:
-            if dataset['globalData']['datapoints'][datapoint]:
-                if isinstance(dataset['globalData']['datapoints'][datapoint], list):
-                    for item in dataset['globalData']['datapoints'][datapoint]:
-                        item['intentId'] = account_number + '_' + timestamp
-                        item['itemId'] = datapoint + '_' + item['id']
-                        item['region'] = 'global'
-                        item['type'] = Constants.datapoint_display_names[datapoint]
-                        batch.put_item(Item=item)
-
+            writer.save(datapoint, 'global', dataset['globalData']['datapoints'][datapoint])
+        return writer.finish()
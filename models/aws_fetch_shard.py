@@ -0,0 +1,62 @@
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+from autobot_helpers import boto3_helper
+
+
+def __get_table():
+    return boto3_helper.get_dynamo_db_table("aws_fetch_shards", True)
+
+
+def get(account_id):
+    result = __get_table().get_item(
+        Key={'accountId': account_id},
+        ConsistentRead=True
+    )
+    if result and result.get('Item'):
+        return result['Item']
+    return None
+
+
+def save(account_id, state):
+    item = dict(state)
+    item['accountId'] = account_id
+    item['updatedAt'] = datetime.utcnow().isoformat()
+    __get_table().put_item(Item=item)
+
+
+def report(account_id, timestamp, shard, shard_report):
+    """
+    Records the report of one shard of the fetch started at timestamp and returns the state after the write, or
+    None when the shard already reported or the fetch was replaced by a newer one
+    """
+    try:
+        result = __get_table().update_item(
+            Key={'accountId': account_id},
+            UpdateExpression="set #shards.#shard = :r, updatedAt = :u",
+            ConditionExpression=Attr('timestamp').eq(timestamp) & Attr('shards.' + shard + '.status').eq('pending'),
+            ExpressionAttributeNames={'#shards': 'shards', '#shard': shard},
+            ExpressionAttributeValues={
+                ':r': shard_report,
+                ':u': datetime.utcnow().isoformat()
+            },
+            ReturnValues="ALL_NEW"
+        )
+        return result['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+
+def delete(account_id, timestamp):
+    try:
+        __get_table().delete_item(
+            Key={'accountId': account_id},
+            ConditionExpression=Attr('timestamp').eq(timestamp)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from autobot_helpers import boto3_helper
+
+
+def __get_table():
+    return boto3_helper.get_dynamo_db_table("aws_index_checkpoints", True)
+
+
+def get(account_id):
+    result = __get_table().get_item(
+        Key={'accountId': account_id},
+        ConsistentRead=True
+    )
+    if result and result.get('Item'):
+        return result['Item']
+    return None
+
+
+def save(account_id, checkpoint):
+    item = dict(checkpoint)
+    item['accountId'] = account_id
+    item['updatedAt'] = datetime.utcnow().isoformat()
+    __get_table().put_item(Item=item)
+
+
+def delete(account_id):
+    __get_table().delete_item(
+        Key={'accountId': account_id}
+    )
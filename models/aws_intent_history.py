@@ -1,6 +1,9 @@
-from autobot_helpers import boto3_helper
+from autobot_helpers import boto3_helper, cache_helper
 from boto3.dynamodb.conditions import Key
 
+# Snapshot attributes of the intents read lately, the API container outlives many fetches so it is bounded
+__snapshot_info_cache = cache_helper.TTLCache(max_size=4096, ttl_seconds=3600)
+
 
 def get_latest_by_account_id(account_id):
     table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
@@ -31,6 +34,28 @@ def update_metadata(timestamp, account_id, metadata, intent_type, issue_type):
     )
 
 
+def update_metadata_keys(timestamp, account_id, updates, partial_refresh):
+    """ Replaces several data.<intentType>.<issueType> entries, updates being {(intent_type, issue_type): value} """
+    table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
+    expressions = ["#partialRefresh = :partialRefresh"]
+    names = {"#metadata": 'data', "#partialRefresh": 'partialRefresh'}
+    values = {":partialRefresh": partial_refresh}
+    for index, (intent_type, issue_type) in enumerate(updates):
+        expressions.append("#metadata.#intentType%d.#issueType%d = :r%d" % (index, index, index))
+        names['#intentType%d' % index] = intent_type
+        names['#issueType%d' % index] = issue_type
+        values[':r%d' % index] = updates[(intent_type, issue_type)]
+    table.update_item(
+        Key={
+            'cid': account_id + "_AllResources",
+            'timestamp': timestamp
+        },
+        UpdateExpression="set " + ", ".join(expressions),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+
 def get_by_intent_id(timestamp, account_id):
     table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
     cid = account_id+"_AllResources"
@@ -42,12 +67,73 @@ def get_by_intent_id(timestamp, account_id):
     return None
 
 
-def save(account_number, intent, timestamp, data):
+def get_telemetry(account_id, timestamp=None):
+    """ Returns the timestamp and fetch telemetry of an intent, the latest one when no timestamp is given """
+    table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
+    key_condition = Key('cid').eq(account_id + '_AllResources')
+    if timestamp:
+        key_condition = key_condition & Key('timestamp').eq(timestamp)
+    result = table.query(
+        KeyConditionExpression=key_condition,
+        ProjectionExpression="#timestamp, telemetry",
+        ExpressionAttributeNames={"#timestamp": 'timestamp'},
+        ScanIndexForward=False,
+        Limit=1,
+    )
+    if result and result.get('Items'):
+        return result['Items'][0]
+    return None
+
+
+def get_latest_snapshot_info(account_id):
+    """ Returns the timestamp and snapshot attribute of the latest intent """
+    table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
+    result = table.query(
+        KeyConditionExpression=Key('cid').eq(account_id + '_AllResources'),
+        ProjectionExpression="#timestamp, #snapshot",
+        ExpressionAttributeNames={"#timestamp": 'timestamp', "#snapshot": 'snapshot'},
+        ScanIndexForward=False,
+        Limit=1,
+    )
+    if result and result.get('Items'):
+        return result['Items'][0]
+    return None
+
+
+def get_snapshot_info(timestamp, account_id):
+    """
+    Returns the snapshot attribute of an intent, None for intents saved before delta snapshots. The attribute
+    never changes once the intent is saved so found values are cached.
+    """
+    key = (account_id, timestamp)
+    cached = __snapshot_info_cache.get(key)
+    if cached is not None:
+        return cached[0]
     table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
-    table.put_item(
-        Item={
-          "cid": account_number + "_" + intent,
-          "timestamp": timestamp,
-          "data": data
-        }
+    result = table.get_item(
+        Key={
+            'cid': account_id + "_AllResources",
+            'timestamp': timestamp
+        },
+        ProjectionExpression="#snapshot",
+        ExpressionAttributeNames={"#snapshot": 'snapshot'}
     )
+    if result and result.get('Item'):
+        # Held in a tuple so intents without a snapshot are cached too
+        __snapshot_info_cache.set(key, (result['Item'].get('snapshot'),))
+        return result['Item'].get('snapshot')
+    return None
+
+
+def save(account_number, intent, timestamp, data, snapshot=None, telemetry=None):
+    table = boto3_helper.get_dynamo_db_table("aws_intent_history", True)
+    item = {
+        "cid": account_number + "_" + intent,
+        "timestamp": timestamp,
+        "data": data
+    }
+    if snapshot:
+        item['snapshot'] = snapshot
+    if telemetry:
+        item['telemetry'] = telemetry
+    table.put_item(Item=item)
@@ -1,10 +1,28 @@
-from datetime import datetime
+import hashlib
+import heapq
+from datetime import datetime, timedelta
 
 from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
 
-from autobot_helpers import boto3_helper
+from autobot_helpers import boto3_helper, cache_helper
 from services.aws.utils import Helpers,Constants
 
+# Sparse GSI holding only the accounts to be indexed: partition key indexShard (S), sort key indexDueAt (S),
+# KEYS_ONLY projection. Accounts are spread over INDEX_SHARDS partitions so no single key gets hot, changing the
+# shard count needs a backfill_index_schedule run.
+INDEX_DUE_INDEX = 'indexShard-indexDueAt-index'
+INDEX_SHARDS = 4
+
+
+def index_shard(account_id):
+    return str(int(hashlib.md5(account_id.encode('utf-8')).hexdigest(), 16) % INDEX_SHARDS)
+
+
+def next_index_due_at():
+    """ Accounts are indexed once a day, the next run is due at the start of the next UTC day """
+    return datetime.combine(datetime.utcnow().date() + timedelta(days=1), datetime.min.time()).isoformat()
+
 
 def save(data):
     table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
@@ -14,6 +32,7 @@ def save(data):
     response = table.put_item(
         Item=data
     )
+    cache_helper.invalidate(('account', data.get('accountId')))
     return response
 
 
@@ -80,27 +99,113 @@ def update_region_preference(email, account_id,  default_region, active_regions)
             'userId': email,
             'accountId': account_id
         },
-        UpdateExpression="set #dRegion = :r, #aRegions = :s, #iActive = :t",
+        UpdateExpression="set #dRegion = :r, #aRegions = :s, #iActive = :t, "
+                         "indexShard = :h, indexDueAt = if_not_exists(indexDueAt, :d)",
         ExpressionAttributeNames={"#dRegion": 'defaultRegion', '#aRegions': 'activeRegions', '#iActive': 'isActive'},
         ExpressionAttributeValues={
             ':r': default_region,
             ':s': active_regions,
             ':t': True,
+            ':h': index_shard(account_id),
+            ':d': Helpers.timestamp()
         },
         ReturnValues="UPDATED_NEW"
     )
+    cache_helper.invalidate(('account', account_id))
 
 
-def get_accounts_to_be_indexed(batch=2):
+def __query_due_shard(table, shard, now, limit):
+    """ Yields (sort key, account) for the due accounts of one shard in due order, pages are read as needed """
+    kwargs = {
+        'IndexName': INDEX_DUE_INDEX,
+        'KeyConditionExpression': Key('indexShard').eq(shard) & Key('indexDueAt').lte(now),
+        'Limit': limit
+    }
+    while True:
+        result = table.query(**kwargs)
+        for item in result.get('Items', []):
+            yield (item['indexDueAt'], item['accountId']), item
+        if not result.get('LastEvaluatedKey'):
+            return
+        kwargs['ExclusiveStartKey'] = result['LastEvaluatedKey']
+
+
+def get_accounts_to_be_indexed(limit=10):
+    """
+    Returns up to limit accounts whose indexing is due, longest overdue first, as userId, accountId, indexShard and
+    indexDueAt. Reads only the due part of the index, so the cost follows the limit and not the number of accounts.
+    """
     table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
-    today = datetime.utcnow().date().isoformat()
-    response = table.scan(
-        FilterExpression=(Attr('lastIndexedAt').not_exists() | Attr("lastIndexedAt").lt(today))
-                         & Attr("isActive").eq(True) & Attr('roleArn').exists() & Attr('isUnauthorized').eq(False)
-    )
-    if 'Items' in response:
-        return response['Items']
-    return None
+    now = Helpers.timestamp()
+    shards = [__query_due_shard(table, str(shard), now, limit) for shard in range(INDEX_SHARDS)]
+    accounts = []
+    for item in heapq.merge(*shards):
+        accounts.append(item[1])
+        if len(accounts) >= limit:
+            break
+    return accounts
+
+
+def claim_for_indexing(email, account_id, due_at, retry_at):
+    """
+    Moves a due account to retry_at so it is picked once even if the fetch never reports back. Returns False when
+    another scheduler run already claimed it or a fetch holds a live indexing lease on it.
+    """
+    table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
+    try:
+        table.update_item(
+            Key={
+                'userId': email,
+                'accountId': account_id
+            },
+            UpdateExpression="set indexDueAt = :r",
+            ConditionExpression=Attr('indexDueAt').eq(due_at) & (Attr('indexLeaseExpiresAt').not_exists() |
+                                                                 Attr('indexLeaseExpiresAt').lt(Helpers.timestamp())),
+            ExpressionAttributeValues={
+                ':r': retry_at
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def __index_due_at(item):
+    """ When an account being (re)activated is due, now unless it was already indexed today """
+    if item.get('lastIndexedAt', '') < datetime.utcnow().date().isoformat():
+        return item.get('indexDueAt') or Helpers.timestamp()
+    return next_index_due_at()
+
+
+def backfill_index_schedule():
+    """ Adds the index due time to every account to be indexed, returns the number of accounts updated """
+    table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
+    kwargs = {
+        'FilterExpression': Attr("isActive").eq(True) & Attr('roleArn').exists() & Attr('isUnauthorized').eq(False),
+        'ProjectionExpression': "userId, accountId, lastIndexedAt, indexDueAt"
+    }
+    count = 0
+    while True:
+        response = table.scan(**kwargs)
+        for item in response.get('Items', []):
+            due_at = __index_due_at(item)
+            table.update_item(
+                Key={
+                    'userId': item['userId'],
+                    'accountId': item['accountId']
+                },
+                UpdateExpression="set indexShard = :h, indexDueAt = :d",
+                ExpressionAttributeValues={
+                    ':h': index_shard(item['accountId']),
+                    ':d': due_at
+                }
+            )
+            count += 1
+        if not response.get('LastEvaluatedKey'):
+            return count
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
 
 
 def mark_indexed(email, account_id):
@@ -110,10 +215,12 @@ def mark_indexed(email, account_id):
             'userId': email,
             'accountId': account_id
         },
-        UpdateExpression="set lastIndexedAt = :t, indexFailures = :c",
+        UpdateExpression="set lastIndexedAt = :t, indexFailures = :c, indexShard = :h, indexDueAt = :d",
         ExpressionAttributeValues={
             ':t': Helpers.timestamp(),
-            ':c': 0
+            ':c': 0,
+            ':h': index_shard(account_id),
+            ':d': next_index_due_at()
         },
         ReturnValues="UPDATED_NEW"
     )
@@ -141,7 +248,7 @@ def disable_account(email, account_id, unauthorized=False):
             'userId': email,
             'accountId': account_id
         },
-        UpdateExpression="set isActive = :t, indexFailures = :c, isUnauthorized = :u",
+        UpdateExpression="set isActive = :t, indexFailures = :c, isUnauthorized = :u remove indexShard, indexDueAt",
         ExpressionAttributeValues={
             ':t': False,
             ':c': 0,
@@ -149,6 +256,7 @@ def disable_account(email, account_id, unauthorized=False):
         },
         ReturnValues="UPDATED_NEW"
     )
+    cache_helper.invalidate(('account', account_id))
 
 
 def get_all():
@@ -160,7 +268,7 @@ def get_all():
 def update_all_csp():
     table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
     response = table.scan(
-        FilterExpression=Attr("defaultRegion").exists() and Attr('roleArn').exists() and Attr('externalId').exists()
+        FilterExpression=Attr("defaultRegion").exists() & Attr('roleArn').exists() & Attr('externalId').exists()
     )
     print(response)
     # yesterday = (datetime.utcnow() - timedelta(days=1)).isoformat()
@@ -169,12 +277,15 @@ def update_all_csp():
             print(item['userId'])
             response = table.update_item(
                 Key={
-                    'userId': item['email']
+                    'userId': item['userId'],
+                    'accountId': item['accountId']
                 },
-                UpdateExpression="set isActive = :t, indexFailures = :c",
+                UpdateExpression="set isActive = :t, indexFailures = :c, indexShard = :h, indexDueAt = :d",
                 ExpressionAttributeValues={
                     ':t': True,
-                    ':c': 0
+                    ':c': 0,
+                    ':h': index_shard(item['accountId']),
+                    ':d': __index_due_at(item)
                 },
                 ReturnValues="UPDATED_NEW"
             )
@@ -203,5 +314,71 @@ def restore(items):
                     'createdAt': org_item.get('createdAt', datetime.utcnow().isoformat()),
                     'updatedAt': org_item.get('updatedAt', datetime.utcnow().isoformat())
                 }
+                if item['isActive'] and not item['isUnauthorized']:
+                    # Active accounts are only found by the scheduler through the due-time index
+                    item['indexShard'] = index_shard(item['accountId'])
+                    item['indexDueAt'] = __index_due_at(item)
                 final_item = {k: v for k, v in item.items() if v is not None}
-                batch.put_item(Item=final_item)
\ No newline at end of file
+                batch.put_item(Item=final_item)
+
+def acquire_index_lease(email, account_id, owner, expires_at):
+    """ Takes the indexing lease unless another owner holds a live one, returns whether it was taken """
+    table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
+    try:
+        table.update_item(
+            Key={
+                'userId': email,
+                'accountId': account_id
+            },
+            UpdateExpression="set indexLeaseOwner = :o, indexLeaseExpiresAt = :e",
+            ConditionExpression=Attr('accountId').exists() & (Attr('indexLeaseOwner').not_exists() |
+                                                              Attr('indexLeaseOwner').eq(owner) |
+                                                              Attr('indexLeaseExpiresAt').lt(Helpers.timestamp())),
+            ExpressionAttributeValues={
+                ':o': owner,
+                ':e': expires_at
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def renew_index_lease(email, account_id, owner, expires_at):
+    """ Extends a lease still held by owner, returns False when it was lost """
+    table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
+    try:
+        table.update_item(
+            Key={
+                'userId': email,
+                'accountId': account_id
+            },
+            UpdateExpression="set indexLeaseExpiresAt = :e",
+            ConditionExpression=Attr('indexLeaseOwner').eq(owner),
+            ExpressionAttributeValues={
+                ':e': expires_at
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+
+def release_index_lease(email, account_id, owner):
+    table = boto3_helper.get_dynamo_db_table("cloud_service_providers", True)
+    try:
+        table.update_item(
+            Key={
+                'userId': email,
+                'accountId': account_id
+            },
+            UpdateExpression="remove indexLeaseOwner, indexLeaseExpiresAt",
+            ConditionExpression=Attr('indexLeaseOwner').eq(owner)
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
@@ -1,6 +1,6 @@
 from boto3.dynamodb.conditions import Attr, Key
 
-from autobot_helpers import boto3_helper
+from autobot_helpers import boto3_helper, cache_helper
 from services.aws.utils import Constants
 from services.aws.utils import Helpers
 
@@ -43,6 +43,7 @@ def create_sub_user(user_data, root_user_id):
         item['preferences'] = {'defaultAccount': user_data['accounts'][0]}
         item['permissions'] = {'accounts': user_data['accounts']}
     response = table.put_item(Item=item)
+    cache_helper.invalidate(('user', user_data['email']))
     return response
 
 
@@ -77,6 +78,7 @@ def update_preferences(user_id, root_user_id, preferences):
         },
         ReturnValues="UPDATED_NEW"
     )
+    cache_helper.invalidate(('user', user_id))
 
 
 def update_permissions(user_id, root_user_id, permissions):
@@ -93,6 +95,7 @@ def update_permissions(user_id, root_user_id, permissions):
         },
         ReturnValues="UPDATED_NEW"
     )
+    cache_helper.invalidate(('user', user_id))
 
 
 def restore(items):
@@ -1,4 +1,6 @@
 from autobot_helpers import context_helper, boto3_helper
+from services.aws import records
+from services.aws.region_index import RegionIndex
 from services.aws.utils import Constants
 
 
@@ -8,30 +10,28 @@ class AutoScaling:
         context_helper.logger().debug("Instance created for region=%s", region_name)
         self.client = boto3_helper.get_client('autoscaling', region_name=region_name)
 
-    # TODO: Pagination pending
     def get_launchconfig_details(self):
-        response = self.client.describe_launch_configurations()
         launch_configurations = []
-        for launch_config in response['LaunchConfigurations']:
+        for launch_config in boto3_helper.paginate(self.client, 'describe_launch_configurations',
+                                                   'LaunchConfigurations', page_size=100):
             try:
-                launch_configuration = {'id': launch_config['LaunchConfigurationName'],
-                                        'name': launch_config['LaunchConfigurationName'],
-                                        'arn': launch_config['LaunchConfigurationARN']
-                                        }
+                launch_configuration = records.LaunchConfig(id=launch_config['LaunchConfigurationName'],
+                                                            name=launch_config['LaunchConfigurationName'],
+                                                            arn=launch_config['LaunchConfigurationARN'])
                 launch_configurations.append(launch_configuration)
             except BaseException as e:
                 context_helper.logger().exception("Some exception occurred while getting LaunchConfig=%s", launch_config['LaunchConfigurationName'])
         return launch_configurations
 
-    # TODO: Pagination pending
     def get_autoscaling_group_details(self):
-        response = self.client.describe_auto_scaling_groups()
         autoscaling_groups = []
-        for as_group in response['AutoScalingGroups']:
+        for as_group in boto3_helper.paginate(self.client, 'describe_auto_scaling_groups', 'AutoScalingGroups',
+                                              page_size=100):
             try:
-                autoscaling_group = {'id': as_group['AutoScalingGroupName'], 'name': as_group['AutoScalingGroupName'],
-                                     'arn': as_group['AutoScalingGroupARN'], 'instances': [],
-                                     'createdOn': as_group['CreatedTime'].isoformat()}
+                autoscaling_group = records.AutoScalingGroup(id=as_group['AutoScalingGroupName'],
+                                                             name=as_group['AutoScalingGroupName'],
+                                                             arn=as_group['AutoScalingGroupARN'], instances=[],
+                                                             createdOn=as_group['CreatedTime'].isoformat())
                 if 'Status' in as_group:
                     autoscaling_group['status'] = as_group['Status']
                 if 'LaunchConfigurationName' in as_group:
@@ -88,15 +88,13 @@ class AutoScaling:
 
 
     @staticmethod
-    def get_unused_lanuchconfigs(launch_configs, autoscaling_groups):
+    def get_unused_lanuchconfigs(launch_configs, autoscaling_groups, index=None):
         unused_count = 0
         unused_list = []
+        index = index if index else RegionIndex({'autoScalingGroups': autoscaling_groups})
+        used_names = index.values('autoScalingGroups', 'launchConfigName')
         for launch_config in launch_configs:
-            is_used = False
-            for autoscaling_group in autoscaling_groups:
-                if autoscaling_group.get('launchConfigName') == launch_config['name']:
-                    is_used = True
-            if not is_used:
+            if launch_config['name'] not in used_names:
                 unused_count += 1
                 unused_list.append(launch_config['id'])
         return unused_count, unused_list
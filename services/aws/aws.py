@@ -78,7 +78,7 @@ class AWS:
     @staticmethod
     def get_ssm_instances(account_id):
         intent_history = aws_intent_history.get_latest_by_account_id(account_id)
-        instances = aws_datapoint_history.get_datapoints_by_type(account_id, intent_history['timestamp'], "ec2s")
+        instances = aws_datapoint_history.iter_datapoints_by_type(account_id, intent_history['timestamp'], "ec2s")
         region_ssm_instances = {}
 
         def is_ssm_managed(region, instance_id):
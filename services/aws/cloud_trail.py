@@ -1,10 +1,12 @@
 from autobot_helpers import context_helper, boto3_helper, policy_helper
+from services.aws import records
 from services.aws.utils import Constants
 from services.aws.s3 import S3
 import random
 import string
 from datetime import datetime
 import dateutil.parser
+import json
 
 
 class CloudTrail:
@@ -14,17 +16,43 @@ class CloudTrail:
         self.region_name = region_name
 
     def get_cloud_trail_details(self):
-        response = self.client.describe_trails()
+        # describe_trails has no pages, it returns every trail of the region at once
         trail_list = []
-        for trail in response['trailList']:
+        for trail in boto3_helper.paginate(self.client, 'describe_trails', 'trailList'):
             try:
-                trail_data = {'id': trail['Name']+'_'+self.region_name, 'name': trail['Name'], 'arn': trail['TrailARN']}
+                trail_data = records.CloudTrail(id=trail['Name']+'_'+self.region_name, name=trail['Name'],
+                                                arn=trail['TrailARN'])
                 trail_list.append(trail_data)
             except BaseException as e:
                 context_helper.logger().exception("Some exception occurred while getting CloudTrail=%s, %s",
                                                   trail['Name'], e)
         return trail_list
 
+    def get_event_resource_ids(self, event_names, since):
+        """
+        Returns {event name: set of ids} of the resources named in the requests of the region's management events
+        since the given time, read from the CloudTrail event history.
+        """
+        def walk(value, ids):
+            if isinstance(value, dict):
+                for key, item in value.items():
+                    if isinstance(item, str) and key.endswith('Id'):
+                        ids.add(item)
+                    else:
+                        walk(item, ids)
+            elif isinstance(value, list):
+                for item in value:
+                    walk(item, ids)
+
+        event_ids = {}
+        for event_name in event_names:
+            event_ids[event_name] = set()
+            for event in boto3_helper.paginate(self.client, 'lookup_events', 'Events', page_size=50, StartTime=since,
+                                               LookupAttributes=[{'AttributeKey': 'EventName',
+                                                                  'AttributeValue': event_name}]):
+                walk(json.loads(event['CloudTrailEvent']).get('requestParameters'), event_ids[event_name])
+        return event_ids
+
     def create_cloud_trail(self, region_name):
         if not region_name:
             return {'success': False, 'error_code': 'VALUE_ERROR', 'message': 'Region not provided'}
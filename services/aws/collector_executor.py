@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from autobot_helpers import context_helper, telemetry_helper
+
+CollectorTask = namedtuple('CollectorTask', ['name', 'function', 'args', 'region', 'service'])
+
+
+class CollectorExecutor:
+    """
+    Runs data collectors on a bounded thread pool.
+
+    Collectors spend nearly all of their time waiting on boto3 calls, so threads give the same overlap the
+    per-collector processes used to, without forking an interpreter per collector or pickling every result
+    back through a pipe. On top of the overall worker limit at most `max_per_region` tasks run against one
+    region and at most `max_per_service` tasks against one AWS service at any time. Tasks are started in
+    submission order whenever their limits allow it.
+
+    A consumer that stops early, at a deadline or by closing the generator, doesn't wait for the running
+    collectors. Their AWS calls raise CollectorStopped from then on, so a collector left behind in a frozen Lambda
+    container can't carry on with another invocation's session.
+    """
+
+    def __init__(self, max_workers=16, max_per_region=4, max_per_service=8):
+        self.max_workers = max(1, int(max_workers))
+        self.max_per_region = max(1, int(max_per_region))
+        self.max_per_service = max(1, int(max_per_service))
+        self.pending = deque()
+        self.last_telemetry = None
+        self.timed_out = False
+        self.stop = threading.Event()
+
+    def submit(self, name, function, args=(), region=None, service=None):
+        self.pending.append(CollectorTask(name, function, tuple(args), region, service))
+
+    def as_completed(self, deadline=None):
+        """
+        Starts the submitted tasks and yields (task, result) tuples in completion order. The results are the
+        collector's return values as is, nothing is copied or serialised. Exceptions raised by a collector are
+        re-raised here. The telemetry record of the task just yielded is in `last_telemetry`.
+
+        With a deadline (epoch seconds) the generator ends once it passes with `timed_out` set, even while
+        collectors are still running. Tasks not started when it ends early are dropped and the running ones stopped.
+        """
+        running = {}
+        region_counts = {}
+        service_counts = {}
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+        drained = False
+        try:
+            while self.pending or running:
+                self.__dispatch(pool, running, region_counts, service_counts)
+                timeout = max(0, deadline - time.time()) if deadline else None
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    self.timed_out = True
+                    return
+                for future in done:
+                    task = running.pop(future)
+                    self.__release(task, region_counts, service_counts)
+                    result, telemetry = future.result()
+                    context_helper.logger().debug("Collector=%s completed for region=%s in %.1fs", task.name,
+                                                  task.region, telemetry.wall_time)
+                    self.last_telemetry = telemetry
+                    yield task, result
+            drained = True
+        finally:
+            if not drained:
+                self.stop.set()
+                for future in running:
+                    future.cancel()
+                self.pending.clear()
+            pool.shutdown(wait=drained)
+
+    def __dispatch(self, pool, running, region_counts, service_counts):
+        waiting = deque()
+        while self.pending and len(running) < self.max_workers:
+            task = self.pending.popleft()
+            if not self.__can_start(task, region_counts, service_counts):
+                waiting.append(task)
+                continue
+            if task.region:
+                region_counts[task.region] = region_counts.get(task.region, 0) + 1
+            if task.service:
+                service_counts[task.service] = service_counts.get(task.service, 0) + 1
+            running[pool.submit(self.__run, task, self.stop)] = task
+        # Tasks held back by a limit go back to the front so submission order is kept
+        self.pending.extendleft(reversed(waiting))
+
+    @staticmethod
+    def __run(task, stop):
+        with telemetry_helper.recording(task.name, task.region, stop) as telemetry:
+            result = task.function(*task.args)
+            telemetry.items = telemetry_helper.count_items(result)
+        return result, telemetry
+
+    def __can_start(self, task, region_counts, service_counts):
+        if task.region and region_counts.get(task.region, 0) >= self.max_per_region:
+            return False
+        if task.service and service_counts.get(task.service, 0) >= self.max_per_service:
+            return False
+        return True
+
+    @staticmethod
+    def __release(task, region_counts, service_counts):
+        if task.region:
+            region_counts[task.region] -= 1
+        if task.service:
+            service_counts[task.service] -= 1
@@ -1,130 +1,152 @@
-import copy
-from datetime import datetime
+from datetime import datetime, timedelta
 
-from autobot_helpers import context_helper, boto3_helper
+from autobot_helpers import context_helper, boto3_helper, telemetry_helper
 from models import aws_intent_history, aws_datapoint_history
 from services.aws.autoscaling import AutoScaling
 from services.aws.budget import Budget
 from services.aws.cloud_trail import CloudTrail
+from services.aws.collector_executor import CollectorExecutor
 from services.aws.cost_explorer import CostExplorer
 from services.aws.ec2 import EC2
 from services.aws.elb import ELB
+from services.aws.fetch_checkpoint import FetchCheckpoint
+from services.aws import fetch_queue
+from services.aws.fetch_pipeline import FetchPipeline
+from services.aws.partial_refresh import PartialRefresh
 from services.aws.iam import IAM
-from services.aws.maintenance_analyser import MaintenanceAnalyser
+from services.aws.incremental_collection import IncrementalCollection
 from services.aws.rds import RDS
 from services.aws.s3 import S3
-from services.aws.security_analyser import SecurityAnalyser
+from services.aws.sharded_fetch import ShardedFetch
+from services.aws.unused_resources_analyser import UnusedResourcesAnalyser
 from services.aws.utils import Helpers, Constants
 from autobot_helpers.context_helper import app
-from multiprocessing import Process, Pipe
 from models import cloud_service_provider
+import json
+import time
 import traceback
 
 
-def fetch_ec2_data(region, conn):
-    ec2 = EC2(region_name=region)
-    datapoints = {}
-    datapoints['volumes'] = ec2.get_volume_details()
-    datapoints['eips'] = ec2.get_eip_details()
-    datapoints['snapshots'] = ec2.get_snapshot_details()
-    datapoints['securityGroups'] = ec2.get_security_groups_details()
-    datapoints['amis'] = ec2.get_ami_details()
-    datapoints['ec2s'] = ec2.get_instances_details()
-    conn.send([datapoints, region])
-    conn.close()
+def is_selected(datapoint, selected):
+    return not selected or datapoint in selected
 
 
-def fetch_vpc_data(region, conn):
+def fetch_ec2_data(region, selected=None):
+    ec2 = EC2(region_name=region)
+    # Partial refreshes list everything so remediated snapshots and AMIs are gone at once
+    incremental = IncrementalCollection(region, ec2) if not selected else None
+    datapoints = {}
+    if is_selected('volumes', selected):
+        datapoints['volumes'] = ec2.get_volume_details()
+    if is_selected('eips', selected):
+        datapoints['eips'] = ec2.get_eip_details()
+    if is_selected('snapshots', selected):
+        datapoints['snapshots'] = incremental.collect('snapshots') if incremental else ec2.get_snapshot_details()
+    if is_selected('securityGroups', selected):
+        datapoints['securityGroups'] = ec2.get_security_groups_details()
+    if is_selected('amis', selected):
+        datapoints['amis'] = incremental.collect('amis') if incremental else ec2.get_ami_details()
+    if is_selected('ec2s', selected):
+        datapoints['ec2s'] = ec2.get_instances_details()
+    return datapoints
+
+
+def fetch_vpc_data(region, selected=None):
     ec2 = EC2(region_name=region)
     datapoints = {}
-    datapoints['vpcs'] = ec2.get_vpc_details()
-    datapoints['vpcEndpoints'] = ec2.get_vpc_endpoint_details()
-    datapoints['enis'] = ec2.get_eni_details()
-    datapoints['routeTables'] = ec2.get_route_table_details()
-    datapoints['internetGateways'] = ec2.get_internet_gateway_details()
-    datapoints['vpnGateways'] = ec2.get_vpn_gateways()
+    if is_selected('vpcs', selected):
+        datapoints['vpcs'] = ec2.get_vpc_details()
+    if is_selected('vpcEndpoints', selected):
+        datapoints['vpcEndpoints'] = ec2.get_vpc_endpoint_details()
+    if is_selected('enis', selected):
+        datapoints['enis'] = ec2.get_eni_details()
+    if is_selected('routeTables', selected):
+        datapoints['routeTables'] = ec2.get_route_table_details()
+    if is_selected('internetGateways', selected):
+        datapoints['internetGateways'] = ec2.get_internet_gateway_details()
+    if is_selected('vpnGateways', selected):
+        datapoints['vpnGateways'] = ec2.get_vpn_gateways()
     # regional_data['datapoints']['subnets'] = ec2.get_subnet_details()
-    conn.send([datapoints, region])
-    conn.close()
+    return datapoints
 
 
-def fetch_elb_data(region, conn):
+def fetch_elb_data(region, selected=None):
     elb = ELB(region_name=region)
     datapoints = {}
-    datapoints['elbs'] = elb.get_elb_details()
-    datapoints['albs'] = elb.get_alb_details()
-    datapoints['targetGroups'] = elb.get_target_groups_details()
-    conn.send([datapoints, region])
-    conn.close()
+    if is_selected('elbs', selected):
+        datapoints['elbs'] = elb.get_elb_details()
+    if is_selected('albs', selected):
+        datapoints['albs'] = elb.get_alb_details()
+    if is_selected('targetGroups', selected):
+        datapoints['targetGroups'] = elb.get_target_groups_details()
+    return datapoints
 
 
-def fetch_rds_data(region, conn):
+def fetch_rds_data(region, selected=None):
     rds_client = RDS(region_name=region)
     datapoints = {}
-    datapoints['rdses'] = rds_client.get_rds_details()
-    datapoints['rdsManualSnapshots'] = rds_client.get_rds_manual_snapshot_details()
-    conn.send([datapoints, region])
-    conn.close()
+    if is_selected('rdses', selected):
+        datapoints['rdses'] = rds_client.get_rds_details()
+    if is_selected('rdsManualSnapshots', selected):
+        datapoints['rdsManualSnapshots'] = rds_client.get_rds_manual_snapshot_details()
+    return datapoints
 
 
-def fetch_autoscaling_data(region, conn):
+def fetch_autoscaling_data(region, selected=None):
     autoscaling_client = AutoScaling(region_name=region)
     datapoints = {}
-    datapoints['launchConfigs'] = autoscaling_client.get_launchconfig_details()
-    datapoints['autoScalingGroups'] = autoscaling_client.get_autoscaling_group_details()
-    conn.send([datapoints, region])
-    conn.close()
+    if is_selected('launchConfigs', selected):
+        datapoints['launchConfigs'] = autoscaling_client.get_launchconfig_details()
+    if is_selected('autoScalingGroups', selected):
+        datapoints['autoScalingGroups'] = autoscaling_client.get_autoscaling_group_details()
+    return datapoints
 
 
-def fetch_cloudtrail_data(region, conn):
+def fetch_cloudtrail_data(region, selected=None):
     cloudtrail_client = CloudTrail(region_name=region)
     datapoints = {}
     datapoints['cloudTrails'] = cloudtrail_client.get_cloud_trail_details()
-    conn.send([datapoints, region])
-    conn.close()
+    return datapoints
 
 # Global Data
 
 
-def fetch_iam_users(conn):
+def fetch_iam_users(selected=None):
     iam_client = IAM()
     datapoints = {}
     datapoints['users'] = iam_client.get_user_details()
-    conn.send([datapoints])
-    conn.close()
+    return datapoints
 
 
-def fetch_iam_roles(conn):
+def fetch_iam_roles(selected=None):
     iam_client = IAM()
     datapoints = {}
     datapoints['roles'] = iam_client.get_role_details()
-    conn.send([datapoints])
-    conn.close()
+    return datapoints
 
 
-def fetch_iam_groups(conn):
+def fetch_iam_groups(selected=None):
     iam_client = IAM()
     datapoints = {}
     datapoints['groups'] = iam_client.get_group_details()
-    conn.send([datapoints])
-    conn.close()
+    return datapoints
 
 
-def fetch_iam_others(conn):
+def fetch_iam_others(selected=None):
     iam_client = IAM()
     datapoints = {}
-    datapoints['accountSummary'] = iam_client.get_account_summary()
-    datapoints['passwordPolicy'] = iam_client.get_password_policy_score()
-    conn.send([datapoints])
-    conn.close()
+    if is_selected('accountSummary', selected):
+        datapoints['accountSummary'] = iam_client.get_account_summary()
+    if is_selected('passwordPolicy', selected):
+        datapoints['passwordPolicy'] = iam_client.get_password_policy_score()
+    return datapoints
 
 
-def fetch_s3_data(conn):
+def fetch_s3_data(selected=None):
     s3_client = S3()
     datapoints = {}
     datapoints['s3Buckets'] = s3_client.get_s3_bucket_details()
-    conn.send([datapoints])
-    conn.close()
+    return datapoints
 
 
 class DataFetchService:
@@ -135,170 +157,379 @@ class DataFetchService:
     # regional_function = [fetch_ec2_data]
     # global_function = []
 
+    # AWS service each collector talks to, used for the per service concurrency limit
+    collector_services = {
+        'fetch_ec2_data': 'ec2', 'fetch_vpc_data': 'ec2', 'fetch_elb_data': 'elb', 'fetch_rds_data': 'rds',
+        'fetch_autoscaling_data': 'autoscaling', 'fetch_cloudtrail_data': 'cloudtrail',
+        'fetch_iam_users': 'iam', 'fetch_iam_roles': 'iam', 'fetch_iam_groups': 'iam', 'fetch_iam_others': 'iam',
+        'fetch_s3_data': 's3'
+    }
+
+    # Datapoints each collector returns, used to run only the collectors a partial refresh needs
+    collector_datapoints = {
+        'fetch_ec2_data': ['volumes', 'eips', 'snapshots', 'securityGroups', 'amis', 'ec2s'],
+        'fetch_vpc_data': ['vpcs', 'vpcEndpoints', 'enis', 'routeTables', 'internetGateways', 'vpnGateways'],
+        'fetch_elb_data': ['elbs', 'albs', 'targetGroups'],
+        'fetch_rds_data': ['rdses', 'rdsManualSnapshots'],
+        'fetch_autoscaling_data': ['launchConfigs', 'autoScalingGroups'],
+        'fetch_cloudtrail_data': ['cloudTrails'],
+        'fetch_iam_users': ['users'],
+        'fetch_iam_roles': ['roles'],
+        'fetch_iam_groups': ['groups'],
+        'fetch_iam_others': ['accountSummary', 'passwordPolicy'],
+        'fetch_s3_data': ['s3Buckets']
+    }
+
+    default_fetch_config = {
+        'max_workers': 16,
+        'max_per_region': 4,
+        'max_per_service': 8,
+        'checkpoint_interval_seconds': 30,
+        'checkpoint_max_age_minutes': 360,
+        'deadline_margin_seconds': 60,
+        'max_resumes': 8,
+        'lease_seconds': 960,
+        'lease_renew_seconds': 60,
+        'shard_min_regions': 10
+    }
+
+    @staticmethod
+    def fetch_config():
+        config = dict(DataFetchService.default_fetch_config)
+        config.update(context_helper.app().config.get('DATA_FETCH_CONFIG') or {})
+        return config
+
+    default_snapshot_config = {
+        'delta_enabled': True,
+        'compact_after_days': 7,
+        'max_delta_ratio': 0.3
+    }
+
+    @staticmethod
+    def snapshot_config():
+        config = dict(DataFetchService.default_snapshot_config)
+        config.update(context_helper.app().config.get('DATAPOINT_SNAPSHOT_CONFIG') or {})
+        return config
+
+    default_schedule_config = {
+        'jobs_per_tick': 40,
+        'retry_after_minutes': 180
+    }
+
     @staticmethod
-    def fetch_data():
+    def schedule_config():
+        config = dict(DataFetchService.default_schedule_config)
+        config.update(context_helper.app().config.get('DATA_FETCH_SCHEDULE_CONFIG') or {})
+        return config
+
+    @staticmethod
+    def snapshot_base_timestamp(account_number, timestamp):
+        """
+        Returns the base snapshot the fetch should write a delta against, or None when it should write a new base.
+        A new base compacts the deltas once the base is older than compact_after_days, once the last delta grew past
+        max_delta_ratio of the items, or when the previous fetch was a full copy without content hashes or a snapshot
+        of an older SNAPSHOT_VERSION.
+        """
+        config = DataFetchService.snapshot_config()
+        if not config['delta_enabled']:
+            return None
+        last_intent = aws_intent_history.get_latest_by_account_id(account_number)
+        snapshot = last_intent.get('snapshot') if last_intent else None
+        if not snapshot or int(snapshot.get('version', 1)) < aws_datapoint_history.SNAPSHOT_VERSION:
+            return None
+        base_age = Helpers.fromisoformat(timestamp) - Helpers.fromisoformat(snapshot['baseTimestamp'])
+        if base_age >= timedelta(days=float(config['compact_after_days'])):
+            return None
+        if snapshot.get('type') == 'delta' and \
+                int(snapshot['deltaCount']) > int(snapshot['itemCount']) * float(config['max_delta_ratio']):
+            return None
+        return snapshot['baseTimestamp']
+
+    @staticmethod
+    def create_executor():
+        config = DataFetchService.fetch_config()
+        return CollectorExecutor(max_workers=config['max_workers'], max_per_region=config['max_per_region'],
+                                 max_per_service=config['max_per_service'])
+
+    @staticmethod
+    def fetch_data(deadline=None, lease=None):
+        """
+        Fetches and analyses the current account. With a deadline (epoch seconds) the fetch stops short of it once
+        the checkpoint is saved and returns resume=True, the next invocation carries on from the checkpoint. An
+        IndexLease held on the account is renewed while the collectors run.
+        """
         try:
             print("Data fetch service started")
             session = context_helper.get_current_session()
-            response = {'success': False, 'regionalData': {}, 'globalData': { 'datapoints': {} }}
             if session.get('attributes', None):
-                processes = []
-                regional_p_con = []
-                global_p_con = []
-
-                for region_name in session['attributes']['activeRegions']:
-                    region = boto3_helper.get_region_id(region_name)
-                    for rfunct in DataFetchService.regional_function:
-                        parent_conn, child_conn = Pipe()
-                        process = Process(target=rfunct, args=(region, child_conn,))
-                        processes.append(process)
-                        regional_p_con.append(parent_conn)
-                    app().logger.debug("Fetch completed for region=%s", region)
-                    response['regionalData'][region] = { 'datapoints': {} }
-
-                app().logger.debug("Fetch started for global data")
-                for rfunct in DataFetchService.global_function:
-                    parent_conn, child_conn = Pipe()
-                    process = Process(target=rfunct, args=(child_conn,))
-                    processes.append(process)
-                    global_p_con.append(parent_conn)
-                for process in processes:
-                    process.start()
-
-                for regional_con in regional_p_con:
-                    con_response = regional_con.recv()
-                    datapoints = con_response[0]
-                    region = con_response[1]
-                    for datapoint in datapoints:
-                        response['regionalData'][region]['datapoints'][datapoint] = datapoints[datapoint]
-                for global_con in global_p_con:
-                    datapoints = global_con.recv()[0]
-                    for datapoint in datapoints:
-                        response['globalData']['datapoints'][datapoint] = datapoints[datapoint]
-                for process in processes:
-                    process.join()
-                metadata = {}
-                print("Data Analysis Stated")
-                metadata['unusedResources'] = DataFetchService.analyze_data_for_unused_resources(response)
-                metadata['securityIssues'] = SecurityAnalyser.analyse_data_for_security(response)
-                metadata['maintenance'] = MaintenanceAnalyser.analyse_data(response)
-                response['metadata'] = metadata
-                print("Data Analysis Ended")
-                print("Datapoint Save started")
-                DataFetchService.save_datapoints(response, metadata)
-                print("Datapoint Save ended")
-                response['success'] = True
+                account_number = session['attributes']['accountNumber']
+                config = DataFetchService.fetch_config()
+                checkpoint = FetchCheckpoint.load(account_number, config['checkpoint_max_age_minutes'])
+                if checkpoint:
+                    if checkpoint.resume_count >= config['max_resumes']:
+                        checkpoint.delete()
+                        return {'success': False, 'error_code': 'RESUME_LIMIT',
+                                'message': 'Fetch started at ' + checkpoint.timestamp + ' did not finish after ' +
+                                           str(checkpoint.resume_count) + ' resumes'}
+                    checkpoint.resume_count += 1
+                    print("Resuming fetch started at %s with %s units done" % (checkpoint.timestamp,
+                                                                              len(checkpoint.completed_units)))
+                else:
+                    timestamp = datetime.utcnow().isoformat()
+                    base_timestamp = DataFetchService.snapshot_base_timestamp(account_number, timestamp)
+                    regions = DataFetchService.active_region_ids(session)
+                    if config['shard_min_regions'] and len(regions) >= config['shard_min_regions']:
+                        return DataFetchService.start_sharded_fetch(account_number, timestamp, base_timestamp,
+                                                                    regions, lease)
+                    checkpoint = FetchCheckpoint(account_number, timestamp, base_timestamp)
+                timestamp = checkpoint.timestamp
+                executor = DataFetchService.create_executor()
+                with aws_datapoint_history.SnapshotWriter(account_number, timestamp, checkpoint.base_timestamp,
+                                                          checkpoint.item_count, checkpoint.delta_count) as writer:
+                    pipeline = FetchPipeline(account_number, timestamp, writer, checkpoint.completed_units,
+                                             checkpoint.metadata, checkpoint.telemetry)
+                    checkpoint.skip_saved_groups(writer)
+                    # Global collectors go first as they only count as done once all of them are in
+                    global_functions = [gfunct for gfunct in DataFetchService.global_function
+                                        if not pipeline.is_completed(gfunct.__name__)]
+                    pipeline.expect(len(global_functions))
+                    for gfunct in global_functions:
+                        executor.submit(gfunct.__name__, gfunct,
+                                        service=DataFetchService.collector_services.get(gfunct.__name__))
+
+                    for region in DataFetchService.active_region_ids(session):
+                        for rfunct in DataFetchService.regional_function:
+                            if pipeline.is_completed(rfunct.__name__, region):
+                                continue
+                            executor.submit(rfunct.__name__, rfunct, args=(region,), region=region,
+                                            service=DataFetchService.collector_services.get(rfunct.__name__))
+
+                    print("Datapoint fetch and save started")
+                    interrupted = False
+                    stop_at = deadline - config['deadline_margin_seconds'] if deadline else None
+                    for task, datapoints in executor.as_completed(stop_at):
+                        pipeline.add(task.name, task.region, datapoints, executor.last_telemetry.to_dict())
+                        if stop_at and time.time() >= stop_at:
+                            interrupted = True
+                            break
+                        if checkpoint.is_due(config['checkpoint_interval_seconds']):
+                            checkpoint.save(pipeline, writer)
+                        if lease and not lease.renew_if_due():
+                            checkpoint.save(pipeline, writer)
+                            return {'success': False, 'error_code': 'LEASE_LOST',
+                                    'message': 'Another fetch took over the account'}
+                    if interrupted or executor.timed_out:
+                        checkpoint.save(pipeline, writer)
+                        print("Fetch stopped at the deadline with %s units done" % len(pipeline.completed_units))
+                        return {'success': False, 'error_code': 'INCOMPLETE', 'resume': True,
+                                'message': 'Fetch stopped at the deadline, it will be resumed'}
+                    print("Datapoint fetch and save ended")
+                    metadata = pipeline.finish()
+                    snapshot = writer.finish()
+                print("Saved %s snapshot with %s of %s items written" % (snapshot['type'], snapshot['deltaCount'],
+                                                                         snapshot['itemCount']))
+                telemetry = {'collectors': pipeline.telemetry, 'totals': telemetry_helper.summarise(pipeline.telemetry),
+                             'invocations': checkpoint.resume_count + 1}
+                aws_intent_history.save(account_number, Constants.Intents.ALL_RESOURCES.value, timestamp, metadata,
+                                        snapshot, telemetry)
+                checkpoint.delete()
             app().logger.debug("Data fetch service ended")
             return {'success': True}
         except BaseException as e:
             context_helper.logger().exception("Some exception occurred while fetching data", e)
             return {'success': False, 'error_code': 'EXCEPTION', 'message': traceback.format_exc()}
 
+    @staticmethod
+    def start_sharded_fetch(account_number, timestamp, base_timestamp, regions, lease=None):
+        """ Queues one job per region and one for the global datapoints, the shards hold the lease on to the end """
+        session = context_helper.get_current_session()
+        sharded = ShardedFetch.start(account_number, timestamp, base_timestamp, regions,
+                                     lease.owner if lease else None)
+        messages = [(session['attributes']['email'],
+                     json.dumps({'accountId': account_number, 'shard': shard, 'timestamp': timestamp,
+                                 'leaseOwner': sharded.lease_owner}))
+                    for shard in sharded.shards]
+        failed = fetch_queue.get_queue().publish_batch(messages)
+        if failed:
+            sharded.delete()
+            return {'success': False, 'error_code': 'EXCEPTION',
+                    'message': 'Could not queue %s of %s fetch shards' % (len(failed), len(messages))}
+        print("Sharded fetch started at %s over %s shards" % (timestamp, len(messages)))
+        return {'success': True, 'sharded': True, 'shards': len(messages)}
 
     @staticmethod
-    def analyze_data_for_unused_resources(dataset):
-        unused_resources = copy.deepcopy(Constants.default_unused_dict)
-        for region in dataset['regionalData']:
-            for datapoint in dataset['regionalData'][region]['datapoints']:
-                if dataset['regionalData'][region]['datapoints'][datapoint] is not None and len(
-                        dataset['regionalData'][region]['datapoints'][datapoint]) > 0 and unused_resources.get(datapoint):
-                    # Set the total
-                    unused_resources[datapoint]['total'] += len(dataset['regionalData'][region]['datapoints'][datapoint]) if \
-                        dataset['regionalData'][region]['datapoints'].get(datapoint, None) else 0
-
-                    if datapoint == 'volumes':
-                        count, unused_list, cost = EC2.get_unused_volume_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                        unused_resources[datapoint]['costSaving'] += cost
-                    elif datapoint == 'snapshots':
-                        unused_count, unused_list = EC2.get_unused_snapshots_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint],
-                            dataset['regionalData'][region]['datapoints']['volumes'],
-                            dataset['regionalData'][region]['datapoints']['amis'])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'enis':
-                        unused_count, unused_sec_groups = EC2.get_unused_enis_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_sec_groups)
-                    elif datapoint == 'securityGroups':
-                        unused_count, unused_sec_groups = EC2.get_unused_security_group_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint], dataset['regionalData'][region]['datapoints']['ec2s'])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_sec_groups)
-                    elif datapoint == 'eips':
-                        unused_count, unused_sec_groups, cost = EC2.get_unused_eips_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_sec_groups)
-                        unused_resources[datapoint]['costSaving'] += cost
-                    elif datapoint == 'amis':
-                        unused_count, unused_list = EC2.get_unused_amis_count(dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'ec2s':
-                        unused_count, unused_list = EC2.get_stopped_instance_count(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'elbs':
-                        unused_count, unused_list, cost = ELB.get_unused_elb_count(dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                        unused_resources[datapoint]['costSaving'] += cost
-                    elif datapoint == 'albs':
-                        unused_count, unused_list, cost = ELB.get_unused_alb_count(dataset['regionalData'][region]['datapoints'][datapoint],
-                                                                             dataset['regionalData'][region]['datapoints'][
-                                                                                 'targetGroups'])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                        unused_resources[datapoint]['costSaving'] += cost
-                    elif datapoint == 'autoScalingGroups':
-                        unused_count, unused_list = AutoScaling.get_unused_autoscaling_groups(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'launchConfigs':
-                        unused_count, unused_list = AutoScaling.get_unused_lanuchconfigs(
-                            dataset['regionalData'][region]['datapoints'][datapoint], dataset['regionalData'][region]['datapoints']['autoScalingGroups'])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'routeTables':
-                        unused_count, unused_list = EC2.get_unused_route_tables(dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'internetGateways':
-                        unused_count, unused_list = EC2.get_unused_internet_gateways(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                    elif datapoint == 'vpnGateways':
-                        unused_count, unused_list, cost = EC2.get_unused_vpn_gateways(dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                        unused_resources[datapoint]['costSaving'] += cost
-                    elif datapoint == 'rdses':
-                        unused_count, unused_list, cost = RDS.get_unused_rds_snapshots(dataset['regionalData'][region]['datapoints'][datapoint])
-                        unused_resources[datapoint]['unused'] += unused_count
-                        unused_resources[datapoint]['itemList'].extend(unused_list)
-                        unused_resources[datapoint]['costSaving'] += cost
-        for datapoint in unused_resources:
-            if unused_resources[datapoint].get('costSaving'):
-                unused_resources[datapoint]['costSaving'] = int(round(unused_resources[datapoint].get('costSaving')))
-        return unused_resources
+    def fetch_shard(timestamp, shard, lease=None):
+        """
+        Fetches one region, or the global datapoints, of a sharded fetch into its snapshot. The shard completing
+        the fetch aggregates it and returns aggregated=True with the outcome of the whole fetch.
+        """
+        session = context_helper.get_current_session()
+        account_number = session['attributes']['accountNumber']
+        sharded = ShardedFetch.load(account_number, timestamp)
+        if not sharded or shard not in sharded.shards:
+            return {'success': False, 'error_code': 'STALE_SHARD', 'aggregated': False,
+                    'message': 'Fetch started at ' + timestamp + ' is no longer running'}
+        try:
+            print("Fetching shard %s of fetch started at %s" % (shard, timestamp))
+            region = None if shard == ShardedFetch.GLOBAL_SHARD else shard
+            functions = DataFetchService.regional_function if region else DataFetchService.global_function
+            executor = DataFetchService.create_executor()
+            for funct in functions:
+                executor.submit(funct.__name__, funct, args=(region,) if region else (), region=region,
+                                service=DataFetchService.collector_services.get(funct.__name__))
+            report = {'status': 'done', 'telemetry': [], 'globalData': {}}
+            with aws_datapoint_history.SnapshotWriter(account_number, timestamp, sharded.base_timestamp,
+                                                      regions=[shard]) as writer:
+                for task, datapoints in executor.as_completed():
+                    for datapoint, items in datapoints.items():
+                        if items is None or isinstance(items, list):
+                            writer.save(datapoint, shard, items)
+                        else:
+                            report['globalData'][datapoint] = items
+                    report['telemetry'].append(executor.last_telemetry.to_dict())
+                    if lease:
+                        lease.renew_if_due()
+                snapshot = writer.finish()
+            report['itemCount'] = snapshot['itemCount']
+            report['deltaCount'] = snapshot['deltaCount']
+        except BaseException as e:
+            context_helper.logger().exception("Some exception occurred while fetching shard=%s", shard)
+            report = {'status': 'failed', 'error': repr(e)}
+        Helpers.clean_dict_for_dynamo(report)
+        if not sharded.report(shard, report):
+            return {'success': report['status'] == 'done', 'aggregated': False}
+        return DataFetchService.finish_sharded_fetch(sharded)
 
     @staticmethod
-    def save_datapoints(dataset, metadata):
-        timestamp = datetime.utcnow().isoformat()
-        account_number = context_helper.get_current_session()['attributes']['accountNumber']
-        Helpers.clean_dict_for_dynamo(dataset)
-        Helpers.clean_dict_for_dynamo(metadata)
-        aws_datapoint_history.save_all_resources(account_number=account_number, timestamp=timestamp,
-                                                        dataset=dataset)
-        aws_intent_history.save(account_number, Constants.Intents.ALL_RESOURCES.value, timestamp, metadata)
+    def finish_sharded_fetch(sharded):
+        try:
+            failures = sharded.failures()
+            if failures:
+                return {'success': False, 'aggregated': True, 'error_code': 'SHARD_FAILED',
+                        'message': '; '.join(shard + ': ' + str(error) for shard, error in failures.items())}
+            print("Aggregating fetch started at %s" % sharded.timestamp)
+            regional_datapoints = [datapoint for funct in DataFetchService.regional_function
+                                   for datapoint in DataFetchService.collector_datapoints[funct.__name__]]
+            global_datapoints = [datapoint for funct in DataFetchService.global_function
+                                 for datapoint in DataFetchService.collector_datapoints[funct.__name__]]
+            metadata, snapshot = sharded.aggregate(regional_datapoints, global_datapoints)
+            aws_intent_history.save(sharded.account_number, Constants.Intents.ALL_RESOURCES.value, sharded.timestamp,
+                                    metadata, snapshot, sharded.telemetry_summary())
+            print("Saved %s snapshot with %s of %s items written" % (snapshot['type'], snapshot['deltaCount'],
+                                                                     snapshot['itemCount']))
+            return {'success': True, 'aggregated': True}
+        except BaseException as e:
+            context_helper.logger().exception("Some exception occurred while aggregating the fetch")
+            return {'success': False, 'aggregated': True, 'error_code': 'EXCEPTION', 'message': traceback.format_exc()}
+        finally:
+            sharded.delete()
+
+    @staticmethod
+    def refresh_data(datapoints, regions=None, lease=None):
+        """
+        Re-collects the given datapoints, in the given regions or all active ones, and merges them into the latest
+        snapshot. Accounts without a snapshot that can be merged into get a full fetch instead.
+        """
+        try:
+            print("Partial data refresh started for %s" % ', '.join(datapoints))
+            session = context_helper.get_current_session()
+            account_number = session['attributes']['accountNumber']
+            known_datapoints = DataFetchService.known_datapoints()
+            unknown_datapoints = [datapoint for datapoint in datapoints if datapoint not in known_datapoints]
+            if unknown_datapoints:
+                return {'success': False, 'error_code': 'INVALID_PARAMS',
+                        'message': 'Unknown datapoints ' + ', '.join(unknown_datapoints)}
+            last_intent = aws_intent_history.get_latest_by_account_id(account_number)
+            if not last_intent or int((last_intent.get('snapshot') or {}).get('version', 1)) < \
+                    aws_datapoint_history.SNAPSHOT_VERSION:
+                print("No snapshot to merge into, running a full fetch")
+                return DataFetchService.fetch_data(lease=lease)
+
+            active_regions = DataFetchService.active_region_ids(session)
+            region_ids = [region for region in DataFetchService.region_ids(regions) if region in active_regions] \
+                if regions else active_regions
+            refresh = PartialRefresh(account_number, last_intent['timestamp'], datapoints, region_ids, active_regions)
+            executor = DataFetchService.create_executor()
+            for rfunct in DataFetchService.regional_function:
+                selected = [datapoint for datapoint in DataFetchService.collector_datapoints[rfunct.__name__]
+                            if datapoint in datapoints]
+                if selected:
+                    for region in region_ids:
+                        executor.submit(rfunct.__name__, rfunct, args=(region, selected), region=region,
+                                        service=DataFetchService.collector_services.get(rfunct.__name__))
+            for gfunct in DataFetchService.global_function:
+                selected = [datapoint for datapoint in DataFetchService.collector_datapoints[gfunct.__name__]
+                            if datapoint in datapoints]
+                if selected:
+                    executor.submit(gfunct.__name__, gfunct, args=(selected,),
+                                    service=DataFetchService.collector_services.get(gfunct.__name__))
+            for task, result in executor.as_completed():
+                refresh.add(task.region, result, executor.last_telemetry.to_dict())
+
+            changes = refresh.merge()
+            updates = refresh.analyse(last_intent['data'])
+            aws_intent_history.update_metadata_keys(last_intent['timestamp'], account_number, updates, {
+                'timestamp': datetime.utcnow().isoformat(),
+                'datapoints': list(datapoints),
+                'regions': region_ids,
+                'changes': changes,
+                'telemetry': telemetry_helper.summarise(refresh.telemetry)
+            })
+            print("Partial data refresh ended with %s items changed" % changes)
+            return {'success': True, 'timestamp': last_intent['timestamp'], 'changes': changes}
+        except BaseException as e:
+            context_helper.logger().exception("Some exception occurred while refreshing data")
+            return {'success': False, 'error_code': 'EXCEPTION', 'message': traceback.format_exc()}
+
+    @staticmethod
+    def known_datapoints():
+        return [datapoint for collector in DataFetchService.collector_datapoints.values() for datapoint in collector]
+
+    @staticmethod
+    def validate_fetch_request(session, datapoints=None, regions=None):
+        """
+        Error response for datapoints and regions a fetch can't be scheduled with, None when they are fine.
+        Regions only narrow down a partial refresh, a full fetch always covers every active region.
+        """
+        if datapoints and not isinstance(datapoints, list) or regions and not isinstance(regions, list):
+            return {'success': False, 'error_code': 'INVALID_PARAMS',
+                    'message': 'datapoints and regions have to be lists'}
+        known_datapoints = DataFetchService.known_datapoints()
+        unknown_datapoints = [str(datapoint) for datapoint in datapoints or [] if datapoint not in known_datapoints]
+        if unknown_datapoints:
+            return {'success': False, 'error_code': 'INVALID_PARAMS',
+                    'message': 'Unknown datapoints ' + ', '.join(unknown_datapoints)}
+        if regions and not datapoints:
+            return {'success': False, 'error_code': 'INVALID_PARAMS',
+                    'message': 'Regions can only be given with the datapoints to refresh'}
+        region_ids = dict([(region['id'], region['id']) for region in boto3_helper.regions] +
+                          [(region['name'], region['id']) for region in boto3_helper.regions])
+        active_regions = DataFetchService.active_region_ids(session)
+        inactive_regions = [str(region) for region in regions or []
+                            if not isinstance(region, str) or region_ids.get(region) not in active_regions]
+        if inactive_regions:
+            return {'success': False, 'error_code': 'INVALID_PARAMS',
+                    'message': 'Unknown or inactive regions ' + ', '.join(inactive_regions)}
+        return None
+
+    @staticmethod
+    def region_ids(regions):
+        """ Region ids for a list of region ids or names """
+        known_ids = [region['id'] for region in boto3_helper.regions]
+        return [region if region in known_ids else boto3_helper.get_region_id(region) for region in regions]
+
+    @staticmethod
+    def active_region_ids(session):
+        region_ids = []
+        for region_name in session['attributes']['activeRegions']:
+            region = boto3_helper.get_region_id(region_name)
+            if region not in region_ids:
+                region_ids.append(region)
+        return region_ids
+
+    @staticmethod
+    def analyze_data_for_unused_resources(dataset):
+        return UnusedResourcesAnalyser.analyse_data(dataset)
 
     @staticmethod
     def get_ri_details():
@@ -404,15 +635,18 @@ class DataFetchService:
             print("Some exception occurred while disabling the user"+repr(e))
 
     @staticmethod
-    def schedule_data_fetch_for_account(email, account_id):
+    def schedule_data_fetch_for_account(email, account_id, datapoints=None, regions=None, lease_owner=None):
+        """
+        Queues a fetch of the account, a partial refresh when datapoints are given. A resumed fetch passes on the
+        owner of its indexing lease.
+        """
         try:
-            sns_client = boto3_helper.get_client('sns', autobot_resources=True)
             context_helper.logger().info("Indexing account with email id = " + account_id)
-            response = sns_client.publish(
-                TopicArn='arn:aws:sns:us-east-1:480805696776:DataFetch-' + context_helper.app().config["ENVIRONMENT"],
-                Message=account_id,
-                Subject=email,
-            )
+            message = account_id
+            if datapoints or lease_owner:
+                message = json.dumps({'accountId': account_id, 'datapoints': datapoints, 'regions': regions,
+                                      'leaseOwner': lease_owner})
+            response = fetch_queue.get_queue().publish(email, message)
             context_helper.logger().info("Indexing queued for account = " + str(response))
             print('indexing started for user ' + account_id)
             return {'success': True}
@@ -421,6 +655,14 @@ class DataFetchService:
             print("Some exception occurred while scheduling fetch for email"+repr(e))
             return {'success': False, 'error_message': repr(e)}
 
+    @staticmethod
+    def schedule_data_fetch_for_accounts(accounts):
+        """ Queues a full fetch of every account in batches """
+        failed = fetch_queue.get_queue().publish_batch([(account['userId'], account['accountId'])
+                                                        for account in accounts])
+        return {'success': not failed, 'published': len(accounts) - len(failed),
+                'failed': [accounts[index]['accountId'] for index in failed]}
+
     @staticmethod
     def test():
         iam = IAM()
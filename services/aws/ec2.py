@@ -1,13 +1,20 @@
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 
 import dateutil.parser
 from botocore.exceptions import ClientError
-from autobot_helpers import context_helper, boto3_helper, policy_helper
+from autobot_helpers import context_helper, boto3_helper, policy_helper, telemetry_helper
+from services.aws import records
+from services.aws.region_index import RegionIndex
 from services.aws.utils import Constants, Helpers
 
 
 
 class EC2:
+    # Concurrent per resource lookups like describe_instance_attribute per region, the rate limiter paces them
+    lookup_workers = 8
+    # MaxResults of the describe calls that allow 1000 items a page, the others pass their own maximum
+    page_size = 1000
 
     def __init__(self, region_name=Constants.AWSRegions.VIRGINIA.value):
         self.client = boto3_helper.get_client('ec2', region_name=region_name)
@@ -15,31 +22,22 @@ class EC2:
         self.region_name = region_name
 
     def get_instances_details(self, instance_ids=None):
-        results = []
         filters = []
         if instance_ids:
             if not isinstance(instance_ids, list):
                 instance_ids = [instance_ids]
             filters = [{'Name': 'instance-id', 'Values': instance_ids}]
-        response = self.client.describe_instances(Filters=filters)
-        results.extend(response['Reservations'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_instances(NextToken=next_token)
-            results.extend(response['Reservations'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
-
-        autoscaling_instances = self.autoscaling_client.describe_auto_scaling_instances()
         instance_data_list = []
 
-        for reservation in results:
+        for reservation in boto3_helper.paginate(self.client, 'describe_instances', 'Reservations',
+                                                 page_size=EC2.page_size, Filters=filters):
             for instance in reservation['Instances']:
                 try:
-                    instance_data = {'id': instance['InstanceId'], 'isTerminationProtected': False,
-                                     'launchedOn': instance['LaunchTime'].isoformat(),
-                                     'state': instance['State']['Name'],
-                                     'isEbsOptimized': instance['EbsOptimized'],
-                                     'securityGroups': [], 'region': self.region_name}
+                    instance_data = records.Instance(id=instance['InstanceId'], isTerminationProtected=False,
+                                                     launchedOn=instance['LaunchTime'].isoformat(),
+                                                     state=instance['State']['Name'],
+                                                     isEbsOptimized=instance['EbsOptimized'],
+                                                     securityGroups=[], region=self.region_name)
                     if 'StateTransitionReason' in instance and instance['StateTransitionReason']:
                         state_trans_reason = instance['StateTransitionReason']
                         instance_data['isLastStateChangeUserInitiated'] = \
@@ -69,40 +67,72 @@ class EC2:
                                                                              'Message')}
                     if 'IamInstanceProfile' in instance:
                         instance_data['iamProfileId'] = instance['IamInstanceProfile']
-                    ec2_protection = self.client.describe_instance_attribute(Attribute='disableApiTermination',
-                                                                             InstanceId=instance['InstanceId'])
-                    if ec2_protection['DisableApiTermination']['Value']:
-                        instance_autoscaling = next((asg_instance for asg_instance in
-                                                     autoscaling_instances['AutoScalingInstances']
-                                                     if asg_instance["InstanceId"] == instance['InstanceId']), None)
-
-                        if not instance_autoscaling:
-                            instance_data['isTerminationProtected'] = ec2_protection['DisableApiTermination']['Value']
-                        else:
-                            instance_data['autoScaled'] = True
-                            instance_data['autoScalingGroupName'] = instance_autoscaling['AutoScalingGroupName']
-                            instance_data['autoScalingHealthStatus'] = instance_autoscaling['HealthStatus']
                     instance_data_list.append(instance_data)
                 except BaseException as e:
                     context_helper.logger().exception("Some exception occurred while getting Ec2Instance=%s, %s",
                                                       instance['InstanceId'], e)
-        return instance_data_list if instance_data_list else None
+
+        # Terminated instances can't be protected, no need to ask
+        protections = self.get_termination_protections([instance_data['id'] for instance_data in instance_data_list
+                                                        if instance_data['state'] != 'terminated'])
+        autoscaling_instances = self.get_auto_scaling_instances() \
+            if any(protection is True for protection in protections.values()) else {}
+        instances = []
+        for instance_data in instance_data_list:
+            protection = protections.get(instance_data['id'], False)
+            if isinstance(protection, BaseException):
+                # Keep the instance unprotected rather than dropping it from the snapshot
+                context_helper.logger().error("Some exception occurred while getting termination protection of "
+                                              "Ec2Instance=%s, %s", instance_data['id'], protection)
+            elif protection:
+                instance_autoscaling = autoscaling_instances.get(instance_data['id'])
+
+                if not instance_autoscaling:
+                    instance_data['isTerminationProtected'] = protection
+                else:
+                    instance_data['autoScaled'] = True
+                    instance_data['autoScalingGroupName'] = instance_autoscaling['AutoScalingGroupName']
+                    instance_data['autoScalingHealthStatus'] = instance_autoscaling['HealthStatus']
+            instances.append(instance_data)
+        return instances if instances else None
+
+    @staticmethod
+    def lookup_concurrently(function, keys):
+        """ Returns {key: function(key)} computed on a thread pool, a failed lookup maps to its exception """
+        def lookup(key):
+            try:
+                return function(key)
+            except BaseException as e:
+                return e
+        if not keys:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(EC2.lookup_workers, len(keys))) as pool:
+            return dict(zip(keys, pool.map(telemetry_helper.propagate(lookup), keys)))
+
+    def get_termination_protections(self, instance_ids):
+        """ Returns {instance id: disableApiTermination} looked up concurrently """
+        def lookup(instance_id):
+            response = self.client.describe_instance_attribute(Attribute='disableApiTermination',
+                                                               InstanceId=instance_id)
+            return response['DisableApiTermination']['Value']
+        return EC2.lookup_concurrently(lookup, instance_ids)
+
+    def get_auto_scaling_instances(self):
+        """ Returns the region's Auto Scaling instances by instance id """
+        autoscaling_instances = {}
+        for asg_instance in boto3_helper.paginate(self.autoscaling_client, 'describe_auto_scaling_instances',
+                                                  'AutoScalingInstances', page_size=50):
+            autoscaling_instances[asg_instance['InstanceId']] = asg_instance
+        return autoscaling_instances
 
     def get_security_groups_details(self):
-        results = []
-        response = self.client.describe_security_groups()
-        results.extend(response['SecurityGroups'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_security_groups(NextToken=next_token)
-            results.extend(response['SecurityGroups'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
         security_groups = []
-        for sec_group in results:
+        for sec_group in boto3_helper.paginate(self.client, 'describe_security_groups', 'SecurityGroups',
+                                               page_size=EC2.page_size):
             try:
-                security_group = {'id': sec_group['GroupId'], 'name': sec_group['GroupName'],
-                                  'tags': None, 'vpcId': None, 'region': self.region_name, 'ingressRules': [],
-                                  'egressRules': []}
+                security_group = records.SecurityGroup(id=sec_group['GroupId'], name=sec_group['GroupName'],
+                                                       tags=None, vpcId=None, region=self.region_name, ingressRules=[],
+                                                       egressRules=[])
                 if 'Tags' in sec_group:
                     security_group['tags'] = sec_group['Tags']
                 if 'VpcId' in sec_group:
@@ -111,12 +141,18 @@ class EC2:
                     security_group['ingressRules'].append(
                         {'fromPort': ingress.get('FromPort') if ingress.get('FromPort') else None,
                          'toPort': ingress.get('ToPort') if ingress.get('ToPort') else None,
-                         'ipRange': ingress['IpRanges']})
+                         'protocol': ingress.get('IpProtocol'),
+                         'ipRange': ingress['IpRanges'],
+                         'sourceGroups': [pair['GroupId'] for pair in ingress.get('UserIdGroupPairs', [])
+                                          if 'GroupId' in pair]})
                 for egress in sec_group['IpPermissionsEgress']:
                     security_group['egressRules'].append(
                         {'fromPort': egress.get('FromPort') if egress.get('FromPort') else None,
                          'toPort': egress.get('ToPort') if egress.get('ToPort') else None,
-                         'ipRange': egress['IpRanges'] if egress['IpRanges'] else None})
+                         'protocol': egress.get('IpProtocol'),
+                         'ipRange': egress['IpRanges'] if egress['IpRanges'] else None,
+                         'sourceGroups': [pair['GroupId'] for pair in egress.get('UserIdGroupPairs', [])
+                                          if 'GroupId' in pair]})
                 security_groups.append(security_group)
             except BaseException as e:
                 context_helper.logger().exception("Some exception occurred while getting SecurityGroup=%s, %s",
@@ -124,35 +160,20 @@ class EC2:
         return security_groups if security_groups else None
 
     def get_stale_security_groups(self, vpc_id):
-        results = []
-        response = self.client.describe_stale_security_groups(VpcId=vpc_id)
-        results.extend(response['StaleSecurityGroupSet'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_stale_security_groups(VpcId=vpc_id, NextToken=next_token)
-            results.extend(response['StaleSecurityGroupSet'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
         stale_sg_list = []
-        for stale_sg in results:
+        for stale_sg in boto3_helper.paginate(self.client, 'describe_stale_security_groups', 'StaleSecurityGroupSet',
+                                              page_size=255, VpcId=vpc_id):
             stale_sg_list.append({'id': stale_sg['GroupId'], 'name': stale_sg['GroupName'], 'region': self.region_name})
         return stale_sg_list
 
     def get_volume_details(self):
-        results = []
-        response = self.client.describe_volumes()
-        results.extend(response['Volumes'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_volumes(NextToken=next_token)
-            results.extend(response['Volumes'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
         volumes_data = []
-        for volume in results:
+        for volume in boto3_helper.paginate(self.client, 'describe_volumes', 'Volumes', page_size=500):
             try:
-                volume_data = {'id': volume['VolumeId'], 'type': volume['VolumeType'], 'size': volume['Size'],
-                               'availabilityZone': volume['AvailabilityZone'],
-                               'createdOn': volume['CreateTime'].isoformat(),
-                               'attachments': [], 'region': self.region_name, 'isEncrypted': volume['Encrypted']}
+                volume_data = records.Volume(id=volume['VolumeId'], type=volume['VolumeType'], size=volume['Size'],
+                                             availabilityZone=volume['AvailabilityZone'],
+                                             createdOn=volume['CreateTime'].isoformat(),
+                                             attachments=[], region=self.region_name, isEncrypted=volume['Encrypted'])
                 if 'Iops' in volume:
                     volume_data['iops'] = volume['Iops']
                 if 'Tags' in volume:
@@ -169,24 +190,30 @@ class EC2:
                                                   volume['VolumeId'], e)
         return volumes_data if volumes_data else None
 
-    def get_snapshot_details(self):
-        results = []
-        response = self.client.describe_snapshots(
-            OwnerIds=[context_helper.get_current_session()['attributes']['accountNumber']])
-        results.extend(response['Snapshots'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_snapshots(
-                OwnerIds=[context_helper.get_current_session()['attributes']['accountNumber']], NextToken=next_token)
-            results.extend(response['Snapshots'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
+    @staticmethod
+    def created_since_filter(name, since):
+        """ Filter matching a creation time attribute to the days from since to today, EC2 only compares patterns """
+        days = (datetime.utcnow().date() - since.date()).days
+        return {'Name': name, 'Values': [(since.date() + timedelta(days=day)).isoformat() + '*'
+                                         for day in range(max(days, 0) + 1)]}
+
+    @staticmethod
+    def id_filters(name, ids):
+        """ Filters matching the given ids, split as EC2 takes up to 200 values a filter """
+        ids = list(ids)
+        return [[{'Name': name, 'Values': ids[start:start + 200]}] for start in range(0, len(ids), 200)]
+
+    def get_snapshot_details(self, filters=None):
         snapshots = []
-        for snapshot in results:
+        for snapshot in boto3_helper.paginate(
+                self.client, 'describe_snapshots', 'Snapshots', page_size=EC2.page_size,
+                OwnerIds=[context_helper.get_current_session()['attributes']['accountNumber']],
+                Filters=filters or []):
             try:
-                snapshot_data = {'id': snapshot['SnapshotId'], 'volumeId': snapshot['VolumeId'],
-                                 'isEncrypted': snapshot['Encrypted'], 'volumeSize': snapshot['VolumeSize'],
-                                 'createdOn': snapshot['StartTime'].isoformat(),
-                                 'description': snapshot['Description'], 'region': self.region_name}
+                snapshot_data = records.Snapshot(id=snapshot['SnapshotId'], volumeId=snapshot['VolumeId'],
+                                                 isEncrypted=snapshot['Encrypted'], volumeSize=snapshot['VolumeSize'],
+                                                 createdOn=snapshot['StartTime'].isoformat(),
+                                                 description=snapshot['Description'], region=self.region_name)
                 if 'Tags' in snapshot:
                     snapshot_data['tags'] = snapshot['Tags']
                     for tag in snapshot_data['tags']:
@@ -199,12 +226,11 @@ class EC2:
         return snapshots if snapshots else None
 
     def get_eip_details(self):
-        addresses = self.client.describe_addresses()
         eips = []
-        for address in addresses['Addresses']:
+        for address in boto3_helper.paginate(self.client, 'describe_addresses', 'Addresses'):
             try:
-                eip = {'ip': address['PublicIp'], 'domain': address['Domain'], 'allocationId': None,
-                       'region': self.region_name, 'id': address['PublicIp']}
+                eip = records.ElasticIp(ip=address['PublicIp'], domain=address['Domain'], allocationId=None,
+                                        region=self.region_name, id=address['PublicIp'])
                 if address['Domain'] == 'vpc':
                     eip['allocationId'] = address['AllocationId']
                     if 'AssociationId' in address:
@@ -223,15 +249,18 @@ class EC2:
         return eips if eips else None
 
     def get_eni_details(self):
-        response = self.client.describe_network_interfaces()
         enis = []
 
-        for interface in response['NetworkInterfaces']:
+        for interface in boto3_helper.paginate(self.client, 'describe_network_interfaces', 'NetworkInterfaces',
+                                               page_size=EC2.page_size):
             try:
-                eni = {'id': interface['NetworkInterfaceId'], 'status': interface['Status'],
-                       'subnetId': interface['SubnetId'], 'availabilityZone': interface['AvailabilityZone'],
-                       'association': None, 'attachment': None,
-                       'type': interface['InterfaceType'], 'region': self.region_name}
+                eni = records.NetworkInterface(id=interface['NetworkInterfaceId'], status=interface['Status'],
+                                               subnetId=interface['SubnetId'],
+                                               availabilityZone=interface['AvailabilityZone'],
+                                               association=None, attachment=None,
+                                               type=interface['InterfaceType'], region=self.region_name,
+                                               securityGroups=[group['GroupId'] for group in
+                                                               interface.get('Groups', [])])
                 if interface['Description']:
                     eni['description'] = interface['Description']
                 if 'TagSet' in interface:
@@ -258,15 +287,7 @@ class EC2:
         return enis if enis else None
 
     def __get_vpc_nat_gateways(self):
-        results = []
-        response = self.client.describe_nat_gateways()
-        results.extend(response['NatGateways'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_nat_gateways(NextToken=next_token)
-            results.extend(response['NatGateways'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
-        return results
+        return boto3_helper.paginate(self.client, 'describe_nat_gateways', 'NatGateways', page_size=EC2.page_size)
 
     def get_vpc_endpoint_details(self):
         '''
@@ -281,21 +302,14 @@ class EC2:
           }
         ]
         '''
-        results = []
-        response = self.client.describe_vpc_endpoints(Filters=[{'Name': 'vpc-endpoint-state', 'Values': ['available']}])
-        results.extend(response['VpcEndpoints'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_vpc_endpoints(Filters=[{'Name': 'vpc-endpoint-state',
-                                                                    'Values': ['available']}], NextToken=next_token)
-            results.extend(response['VpcEndpoints'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
         vpc_end_points = []
-        for endpoint in results:
+        for endpoint in boto3_helper.paginate(self.client, 'describe_vpc_endpoints', 'VpcEndpoints',
+                                              page_size=EC2.page_size,
+                                              Filters=[{'Name': 'vpc-endpoint-state', 'Values': ['available']}]):
             try:
-                endpoint_detail = {'id': endpoint['VpcEndpointId'], 'vpcId': endpoint['VpcId'],
-                                   'serviceName': endpoint['ServiceName'], 'status': endpoint['State'],
-                                   'type': endpoint['VpcEndpointType']}
+                endpoint_detail = records.VpcEndpoint(id=endpoint['VpcEndpointId'], vpcId=endpoint['VpcId'],
+                                                      serviceName=endpoint['ServiceName'], status=endpoint['State'],
+                                                      type=endpoint['VpcEndpointType'])
                 vpc_end_points.append(endpoint_detail)
             except BaseException as e:
                 context_helper.logger().exception("Some exception occurred while getting VPCEndpoint=%s, %s",
@@ -303,39 +317,31 @@ class EC2:
         return vpc_end_points
 
     def __get_egress_only_gateways(self):
-        results = []
-        response = self.client.describe_egress_only_internet_gateways()
-        results.extend(response['EgressOnlyInternetGateways'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_egress_only_internet_gateways(NextToken=next_token)
-            results.extend(response['EgressOnlyInternetGateways'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
-        return results
+        return boto3_helper.paginate(self.client, 'describe_egress_only_internet_gateways',
+                                     'EgressOnlyInternetGateways', page_size=255)
 
     def __describe_flow_logs(self):
-        results = []
-        response = self.client.describe_flow_logs()
-        results.extend(response['FlowLogs'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_flow_logs(NextToken=next_token)
-            results.extend(response['FlowLogs'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
-        return results
+        return boto3_helper.paginate(self.client, 'describe_flow_logs', 'FlowLogs', page_size=EC2.page_size)
+
+    def get_vpc_relationships(self):
+        """ Returns the region's NAT gateways, egress only internet gateways and flow logs grouped by VPC id """
+        return {
+            'natGateways': Helpers.group_by(self.__get_vpc_nat_gateways(), lambda gateway: gateway.get('VpcId')),
+            'egressOnlyGateways': Helpers.group_by(
+                self.__get_egress_only_gateways(),
+                lambda gateway: gateway['Attachments'][0]['VpcId'] if gateway.get('Attachments') else None),
+            'flowLogs': Helpers.group_by(self.__describe_flow_logs(), lambda flow_log: flow_log.get('ResourceId'))
+        }
 
     def get_vpc_details(self):
-        vpcs = self.client.describe_vpcs()
-        vpc_gateways = self.__get_vpc_nat_gateways()
-        egress_only_gateways = self.__get_egress_only_gateways()
-        flow_logs = self.__describe_flow_logs()
+        relationships = self.get_vpc_relationships()
 
         vpc_data_list = []
-        for vpc in vpcs['Vpcs']:
+        for vpc in boto3_helper.paginate(self.client, 'describe_vpcs', 'Vpcs', page_size=EC2.page_size):
             try:
-                vpc_data = {'id': vpc['VpcId'], 'hasIPv6Association': False, 'isDefault': vpc['IsDefault'],
-                            'hasEgressOnlyInternetGateways': False, 'region': self.region_name, 'natGateways': [],
-                            'flowLogs': []}
+                vpc_data = records.Vpc(id=vpc['VpcId'], hasIPv6Association=False, isDefault=vpc['IsDefault'],
+                                       hasEgressOnlyInternetGateways=False, region=self.region_name, natGateways=[],
+                                       flowLogs=[])
                 try:
                     if vpc['Ipv6CidrBlockAssociationSet']:
                         vpc_data['hasIPv6Association'] = True
@@ -346,50 +352,52 @@ class EC2:
                     for tag in vpc_data['tags']:
                         if tag['Key'].lower() == 'name':
                             vpc_data['name'] = tag['Value']
-                vpc_data['staleSecurityGroups'] = self.get_stale_security_groups(vpc['VpcId'])
-                for vpc_gateway in vpc_gateways:
-                    if vpc_gateway["VpcId"] == vpc['VpcId']:
-                        nat_gateway = {'id': vpc_gateway['NatGatewayId'],
-                                       'createdOn': vpc_gateway['CreateTime'].isoformat()}
-                        if 'State' in vpc_gateway:
-                            nat_gateway['state'] = vpc_gateway['State']
-                        vpc_data['natGateways'].append(nat_gateway)
-
-                for egress_only_gateway in egress_only_gateways:
-                    if egress_only_gateway['Attachments'][0]['VpcId'] == vpc['VpcId']:
-                        vpc_data['hasEgressOnlyInternetGateways'] = True
-
-                for flow_log in flow_logs:
-                    if flow_log["ResourceId"] == vpc['VpcId']:
-                        vpc_data['flowLogs'].append({'id': flow_log['FlowLogId'], 'name': flow_log['LogGroupName'],
-                                                     'status': flow_log['FlowLogStatus'],
-                                                     'hasError': True if (
-                                                             'DeliverLogsErrorMessage' in flow_log) else False})
+                for vpc_gateway in relationships['natGateways'].get(vpc['VpcId'], []):
+                    nat_gateway = {'id': vpc_gateway['NatGatewayId'],
+                                   'createdOn': vpc_gateway['CreateTime'].isoformat()}
+                    if 'State' in vpc_gateway:
+                        nat_gateway['state'] = vpc_gateway['State']
+                    vpc_data['natGateways'].append(nat_gateway)
+
+                if relationships['egressOnlyGateways'].get(vpc['VpcId']):
+                    vpc_data['hasEgressOnlyInternetGateways'] = True
+
+                for flow_log in relationships['flowLogs'].get(vpc['VpcId'], []):
+                    vpc_data['flowLogs'].append({'id': flow_log['FlowLogId'], 'name': flow_log['LogGroupName'],
+                                                 'status': flow_log['FlowLogStatus'],
+                                                 'hasError': True if (
+                                                         'DeliverLogsErrorMessage' in flow_log) else False})
                 vpc_data_list.append(vpc_data)
             except BaseException as e:
                 context_helper.logger().exception("Some exception occurred while getting VPC=%s, %s", vpc['VpcId'], e)
-        return vpc_data_list if vpc_data_list else None
+
+        stale_security_groups = EC2.lookup_concurrently(self.get_stale_security_groups,
+                                                        [vpc_data['id'] for vpc_data in vpc_data_list])
+        checked_vpcs = []
+        for vpc_data in vpc_data_list:
+            if isinstance(stale_security_groups[vpc_data['id']], BaseException):
+                context_helper.logger().error("Some exception occurred while getting VPC=%s, %s", vpc_data['id'],
+                                              stale_security_groups[vpc_data['id']])
+                continue
+            vpc_data['staleSecurityGroups'] = stale_security_groups[vpc_data['id']]
+            checked_vpcs.append(vpc_data)
+        return checked_vpcs if checked_vpcs else None
 
     def get_subnet_details(self):
-        response = self.client.describe_subnets()
         subnets = []
-        for subnet in response['Subnets']:
+        for subnet in boto3_helper.paginate(self.client, 'describe_subnets', 'Subnets', page_size=EC2.page_size):
             subnet_data = {'id': subnet['SubnetId'], 'vpcId': subnet['VpcId'],
                            'availabilityZone': subnet['AvailabilityZone'], 'state': subnet['State']}
             subnets.append(subnet_data)
         return subnets
 
     def get_route_table_details(self):
-        response = self.client.describe_route_tables(Filters=[
-            {
-                'Name': 'association.main',
-                'Values': ['false']
-            }
-        ])
         route_table_list = []
-        for route in response['RouteTables']:
+        for route in boto3_helper.paginate(self.client, 'describe_route_tables', 'RouteTables', page_size=100,
+                                           Filters=[{'Name': 'association.main', 'Values': ['false']}]):
             try:
-                route_table_detail = {'id': route['RouteTableId'], 'associations': [], 'region': self.region_name}
+                route_table_detail = records.RouteTable(id=route['RouteTableId'], associations=[],
+                                                        region=self.region_name)
                 if 'VpcId' in route:
                     route_table_detail['vpcId'] = route['VpcId']
                 if 'Tags' in route:
@@ -406,11 +414,11 @@ class EC2:
         return route_table_list if route_table_list else None
 
     def get_internet_gateway_details(self):
-        response = self.client.describe_internet_gateways()
         internet_gateways = []
-        for igw in response['InternetGateways']:
+        for igw in boto3_helper.paginate(self.client, 'describe_internet_gateways', 'InternetGateways',
+                                         page_size=EC2.page_size):
             try:
-                internet_gateway = {'id': igw['InternetGatewayId'], 'region': self.region_name}
+                internet_gateway = records.InternetGateway(id=igw['InternetGatewayId'], region=self.region_name)
                 if 'Tags' in igw:
                     internet_gateway['tags'] = igw['Tags']
                     for tag in internet_gateway['tags']:
@@ -425,12 +433,11 @@ class EC2:
         return internet_gateways if internet_gateways else None
 
     def get_vpn_gateways(self):
-        response = self.client.describe_vpn_gateways()
         vpn_gateways = []
-        for vpngw in response['VpnGateways']:
+        for vpngw in boto3_helper.paginate(self.client, 'describe_vpn_gateways', 'VpnGateways'):
             try:
-                vpn_gateway = {'id': vpngw['VpnGatewayId'], 'state': vpngw['State'], 'type': vpngw['Type'],
-                               'region': self.region_name}
+                vpn_gateway = records.VpnGateway(id=vpngw['VpnGatewayId'], state=vpngw['State'], type=vpngw['Type'],
+                                                 region=self.region_name)
                 if 'AvailabilityZone' in vpngw:
                     vpn_gateway['availabilityZone'] = vpngw['AvailabilityZone']
                 if 'VpcAttachments' in vpngw:
@@ -446,17 +453,14 @@ class EC2:
                                                   vpngw['VpnGatewayId'], e)
         return vpn_gateways if vpn_gateways else None
 
-    def get_ami_details(self):
-        response = self.client.describe_images(Filters=[
-            {
-                'Name': 'owner-id',
-                'Values': [context_helper.get_current_session()['attributes']['accountNumber']]
-            }
-        ])
+    def get_ami_details(self, filters=None):
         amis = []
-        for image in response['Images']:
+        for image in boto3_helper.paginate(
+                self.client, 'describe_images', 'Images', page_size=EC2.page_size,
+                Owners=[context_helper.get_current_session()['attributes']['accountNumber']],
+                Filters=filters or []):
             try:
-                ami = {'id': image['ImageId'], 'state': image['State'], 'region': self.region_name, 'snapshots': []}
+                ami = records.Ami(id=image['ImageId'], state=image['State'], region=self.region_name, snapshots=[])
                 if 'Tags' in image:
                     ami['tags'] = image['Tags']
                     for tag in ami['tags']:
@@ -959,24 +963,16 @@ class EC2:
         return unused_count, unused_list
 
     @staticmethod
-    def get_unused_security_group_count(security_groups, instances):
+    def get_unused_security_group_count(security_groups, instances, index=None):
         unused_count = 0
         unused_security_groups = []
-
-        def is_security_group_used(instances, sec_group_id):
-            if instances:
-                for instance in instances:
-                    for security_group in instance['securityGroups']:
-                        if security_group['id'] == sec_grp['id']:
-                            return True
-            return False
-
+        index = index if index else RegionIndex({'securityGroups': security_groups, 'ec2s': instances})
+        graph = index.security_group_graph()
         for sec_grp in security_groups:
-            if sec_grp['name'] != 'default' and not is_security_group_used(instances, sec_grp['id']) and \
+            if sec_grp['name'] != 'default' and not graph.is_used(sec_grp['id']) and \
                     'ElasticMapReduce' not in sec_grp['name']:
                 unused_security_groups.append(sec_grp['id'])
                 unused_count += 1
-
         return unused_count, unused_security_groups
 
     @staticmethod
@@ -991,34 +987,18 @@ class EC2:
         return unused_count, unused_list
 
     @staticmethod
-    def get_unused_snapshots_count(snapshots, volumes, amis):
+    def get_unused_snapshots_count(snapshots, volumes, amis, index=None):
         unused_count = 0
         unused_list = []
-
-        def find_volume(volume_id):
-            if volumes:
-                for vlm in volumes:
-                    if vlm['id'] == volume_id:
-                        return vlm
-            return False
-
-        def find_image(ami_id):
-            if amis:
-                for ami in amis:
-                    if ami['id'] == ami_id:
-                        return ami
-            return False
-
+        index = index if index else RegionIndex({'volumes': volumes, 'amis': amis})
+        volumes_by_id = index.by('volumes')
+        amis_by_id = index.by('amis')
         for snapshot in snapshots:
             instance_id, image_id = Helpers.parse_snapshot_description(snapshot['description'])
-            image = None
-            if image_id:
-                image = find_image(image_id)
-            volume = find_volume(snapshot['volumeId'])
-            if (image_id and not image) and not volume:
+            if image_id and image_id not in amis_by_id and snapshot['volumeId'] not in volumes_by_id:
                 unused_count += 1
                 unused_list.append(snapshot['id'])
-        return unused_count, unused_list;
+        return unused_count, unused_list
 
     @staticmethod
     def get_unused_route_tables(route_tables):
@@ -1063,40 +1043,30 @@ class EC2:
         return count, item_list
 
     @staticmethod
-    def get_security_groups_with_insecure_open_ports(security_groups):
-        count = 0
-        item_list = []
-        for security_group in security_groups:
-            if EC2.__check_sg_has_vulnerable_open_port(security_group,
-                                                       policy_helper.get_policy().common_vulnerable_open_ports()):
-                count += 1
-                item_list.append(security_group['id'])
-        return count, item_list
+    def get_security_groups_with_insecure_open_ports(security_groups, index=None):
+        return EC2.__get_security_groups_with_open_ports(security_groups, 'vulnerableOpenPorts', index)
 
     @staticmethod
-    def get_security_groups_with_open_ssh_port(security_groups):
+    def get_security_groups_with_open_ssh_port(security_groups, index=None):
+        return EC2.__get_security_groups_with_open_ports(security_groups, 'openSSHPort', index)
+
+    @staticmethod
+    def open_port_policies():
+        """ Ports that shouldn't be open to the internet, by check """
+        return {'vulnerableOpenPorts': policy_helper.get_policy().common_vulnerable_open_ports(), 'openSSHPort': [22]}
+
+    @staticmethod
+    def __get_security_groups_with_open_ports(security_groups, policy_name, index):
         count = 0
         item_list = []
+        index = index if index else RegionIndex({'securityGroups': security_groups})
+        exposed = index.open_ports().exposed(EC2.open_port_policies())[policy_name]
         for security_group in security_groups:
-            if EC2.__check_sg_has_vulnerable_open_port(security_group,
-                                                       [22]):
+            if security_group['id'] in exposed:
                 count += 1
                 item_list.append(security_group['id'])
         return count, item_list
 
-    @staticmethod
-    def __check_sg_has_vulnerable_open_port(security_group, ports):
-        if 'ingressRules' in security_group:
-            for ingress_rule in security_group['ingressRules']:
-                if 'ipRange' in ingress_rule and ingress_rule['ipRange']:
-                    for ip_range in ingress_rule['ipRange']:
-                        if 'CidrIp' in ip_range and ip_range['CidrIp'] == '0.0.0.0/0':
-                            if (ingress_rule['fromPort'] or ingress_rule['toPort']) and \
-                                    (ingress_rule['fromPort'] == '-1' or ingress_rule['toPort'] == "-1" or
-                                     ingress_rule['fromPort'] in ports or ingress_rule['toPort'] in ports):
-                                return True
-        return False
-
     @staticmethod
     def get_ec2s_without_TP(ec2s):
         count = 0
@@ -1182,15 +1152,10 @@ class EC2:
     def get_vpcs_without_s3_endpoints(vpcs, vpc_endpoints):
         count = 0
         item_list = []
-
-        def vpc_has_endpoint(vpc_id, vpc_endpoints):
-            for endpoint in vpc_endpoints:
-                if endpoint['vpcId'] == vpc_id:
-                    return True
-            return False
+        vpc_endpoints_by_vpc = Helpers.group_by(vpc_endpoints or [], lambda endpoint: endpoint['vpcId'])
 
         for vpc in vpcs:
-            if not vpc_has_endpoint(vpc['id'], vpc_endpoints):
+            if vpc['id'] not in vpc_endpoints_by_vpc:
                 count += 1
                 item_list.append(vpc['id'])
         return count, item_list
@@ -1,5 +1,7 @@
 from autobot_helpers import context_helper, boto3_helper
 from datetime import datetime
+from services.aws import records
+from services.aws.region_index import RegionIndex
 from services.aws.utils import Constants
 
 class ELB:
@@ -9,20 +11,12 @@ class ELB:
         self.client_v2 = boto3_helper.get_client('elbv2', region_name=region_name)
 
     def get_elb_details(self):
-        results = []
-        response = self.client_v1.describe_load_balancers()
-        results.extend(response['LoadBalancerDescriptions'])
-        while 'NextMarker' in response:
-            next_token = response['NextMarker']
-            response = self.client_v1.describe_load_balancers(Marker=next_token)
-            results.extend(response['LoadBalancerDescriptions'])
-            next_token = response['NextMarker'] if response.get('NextMarker') else False
-
         clbs = []
-        for elb in results:
+        for elb in boto3_helper.paginate(self.client_v1, 'describe_load_balancers', 'LoadBalancerDescriptions',
+                                         page_size=400):
             try:
-                elb_detail = {'id': elb['LoadBalancerName'], 'name': elb['LoadBalancerName'],
-                              'createdOn': elb['CreatedTime'].isoformat(), 'version': 'v1'}
+                elb_detail = records.ClassicLoadBalancer(id=elb['LoadBalancerName'], name=elb['LoadBalancerName'],
+                                                         createdOn=elb['CreatedTime'].isoformat(), version='v1')
 
                 if 'VPCId' in elb:
                     elb_detail['vpcId'] = elb['VPCId']
@@ -38,9 +32,9 @@ class ELB:
         return clbs if clbs else None
 
     def __get_listener_detail_for_elb(self, elb_arn):
-        response = self.client_v2.describe_listeners(LoadBalancerArn=elb_arn)
         listeners = []
-        for listener in response['Listeners']:
+        for listener in boto3_helper.paginate(self.client_v2, 'describe_listeners', 'Listeners', page_size=400,
+                                              LoadBalancerArn=elb_arn):
             try:
                 listener_detail = {'arn': listener['ListenerArn'], 'port': listener['Port'],
                                    'protocol': listener['Protocol'], 'targetGroups': []}
@@ -52,20 +46,13 @@ class ELB:
         return listeners
 
     def get_alb_details(self):
-        results = []
-        response = self.client_v2.describe_load_balancers()
-        results.extend(response['LoadBalancers'])
-        while 'NextMarker' in response:
-            next_token = response['NextMarker']
-            response = self.client_v2.describe_load_balancers(Marker=next_token)
-            results.extend(response['LoadBalancers'])
-            next_token = response['NextMarker'] if response.get('NextMarker') else False
         albs = []
-        for elb in response['LoadBalancers']:
+        for elb in boto3_helper.paginate(self.client_v2, 'describe_load_balancers', 'LoadBalancers', page_size=400):
             try:
-                elb_detail = {'id': elb['LoadBalancerName'], 'name': elb['LoadBalancerName'],
-                              'createdOn': elb['CreatedTime'].isoformat(), 'arn': elb['LoadBalancerArn'],
-                              'state': elb['State'], 'type': elb['Type'], 'version': 'v2'}
+                elb_detail = records.LoadBalancer(id=elb['LoadBalancerName'], name=elb['LoadBalancerName'],
+                                                  createdOn=elb['CreatedTime'].isoformat(),
+                                                  arn=elb['LoadBalancerArn'],
+                                                  state=elb['State'], type=elb['Type'], version='v2')
 
                 if 'VpcId' in elb:
                     elb_detail['vpcId'] = elb['VpcId']
@@ -81,14 +68,17 @@ class ELB:
         return albs if albs else None
 
     def get_target_groups_details(self):
-        response = self.client_v2.describe_target_groups()
         target_groups = []
-        for target_group in response['TargetGroups']:
+        for target_group in boto3_helper.paginate(self.client_v2, 'describe_target_groups', 'TargetGroups',
+                                                  page_size=400):
             try:
-                target_group_detail = {'id': target_group['TargetGroupName'], 'name': target_group['TargetGroupName'],
-                                       'vpcId': target_group['VpcId'], 'arn': target_group['TargetGroupArn'],
-                                       'loadBalancerArns': target_group['LoadBalancerArns'], 'instanceHealth': [],
-                                       'protocol': target_group['Protocol'], 'port': target_group['Port']}
+                target_group_detail = records.TargetGroup(id=target_group['TargetGroupName'],
+                                                          name=target_group['TargetGroupName'],
+                                                          vpcId=target_group['VpcId'],
+                                                          arn=target_group['TargetGroupArn'],
+                                                          loadBalancerArns=target_group['LoadBalancerArns'],
+                                                          instanceHealth=[], protocol=target_group['Protocol'],
+                                                          port=target_group['Port'])
                 target_group_healths = self.client_v2.describe_target_health(TargetGroupArn=target_group['TargetGroupArn'])
                 for target_group_health in target_group_healths['TargetHealthDescriptions']:
                     tg_health_detail = {'instanceId': target_group_health['Target']['Id'],
@@ -142,23 +132,25 @@ class ELB:
 
 
     @staticmethod
-    def get_unused_alb_count(albs, target_groups):
+    def get_unused_alb_count(albs, target_groups, index=None):
         unused_count = 0
         unused_list = []
         cost = 0
+        index = index if index else RegionIndex({'targetGroups': target_groups})
+        target_groups_by_arn = index.by('targetGroups', 'arn')
         for alb in albs:
             unused_tg_count = 0
             total_listeners = len(alb['listeners'])
             if alb['listeners']:
                 for listener in alb['listeners']:
                     for target_group in listener['targetGroups']:
-                        for tg_group in target_groups:
-                            if target_group['arn'] == tg_group['arn'] and not tg_group['instanceHealth']:
-                                unused_tg_count = unused_tg_count + 1
-                                if unused_tg_count >= total_listeners:
-                                    unused_count += 1
-                                    unused_list.append(alb['id'])
-                                    cost += Constants.cost_matrix['albs']
+                        tg_group = target_groups_by_arn.get(target_group['arn'])
+                        if tg_group and not tg_group['instanceHealth']:
+                            unused_tg_count = unused_tg_count + 1
+                            if unused_tg_count >= total_listeners:
+                                unused_count += 1
+                                unused_list.append(alb['id'])
+                                cost += Constants.cost_matrix['albs']
             else:
                 unused_count += 1
                 unused_list.append(alb['id'])
@@ -0,0 +1,83 @@
+import time
+from datetime import datetime, timedelta
+
+from autobot_helpers import context_helper
+from models import aws_index_checkpoint
+from services.aws.utils import Helpers
+
+
+class FetchCheckpoint:
+    """
+    Progress of an account fetch that may take several invocations to finish.
+
+    The checkpoint keeps the fetch timestamp and snapshot base so every invocation writes into the same snapshot,
+    the (region, collector) units already written and analysed along with the datapoints they reported, the
+    metadata and telemetry records those units produced and the writer's item counts. It is saved between units
+    only, so it never holds a half analysed unit, and the datapoint items of a saved unit are flushed before the
+    checkpoint is.
+    """
+
+    def __init__(self, account_number, timestamp, base_timestamp=None, completed_units=None, metadata=None,
+                 item_count=0, delta_count=0, resume_count=0, telemetry=None):
+        self.account_number = account_number
+        self.timestamp = timestamp
+        self.base_timestamp = base_timestamp
+        self.completed_units = completed_units or {}
+        self.metadata = metadata
+        self.telemetry = telemetry or []
+        self.item_count = item_count
+        self.delta_count = delta_count
+        self.resume_count = resume_count
+        self.saved = False
+        self.last_saved_at = time.time()
+
+    @staticmethod
+    def load(account_number, max_age_minutes):
+        item = aws_index_checkpoint.get(account_number)
+        if not item:
+            return None
+        item = Helpers.from_dynamo(item)
+        if datetime.utcnow() - Helpers.fromisoformat(item['timestamp']) > timedelta(minutes=max_age_minutes):
+            context_helper.logger().info("Discarding checkpoint of fetch started at %s", item['timestamp'])
+            aws_index_checkpoint.delete(account_number)
+            return None
+        checkpoint = FetchCheckpoint(account_number, item['timestamp'], item.get('baseTimestamp'),
+                                     item.get('completedUnits'), item.get('metadata'), item.get('itemCount', 0),
+                                     item.get('deltaCount', 0), item.get('resumeCount', 0), item.get('telemetry'))
+        checkpoint.saved = True
+        return checkpoint
+
+    def skip_saved_groups(self, writer):
+        """ Keeps the writer from tombstoning the groups written by earlier invocations """
+        for unit_key, datapoints in self.completed_units.items():
+            region = unit_key.split('#', 1)[0]
+            for datapoint in datapoints:
+                writer.skip(datapoint, region)
+
+    def is_due(self, interval_seconds):
+        return time.time() - self.last_saved_at >= interval_seconds
+
+    def save(self, pipeline, writer):
+        writer.flush()
+        self.completed_units = pipeline.completed_units
+        self.telemetry = pipeline.telemetry
+        self.item_count = writer.item_count
+        self.delta_count = writer.delta_count
+        aws_index_checkpoint.save(self.account_number, Helpers.to_dynamo({
+            'timestamp': self.timestamp,
+            'baseTimestamp': self.base_timestamp,
+            'completedUnits': self.completed_units,
+            'metadata': Helpers.cleaned_for_dynamo(pipeline.metadata),
+            'itemCount': self.item_count,
+            'deltaCount': self.delta_count,
+            'resumeCount': self.resume_count,
+            'telemetry': self.telemetry
+        }))
+        self.saved = True
+        self.last_saved_at = time.time()
+        context_helper.logger().debug("Checkpoint saved with %s completed units", len(self.completed_units))
+
+    def delete(self):
+        if self.saved:
+            aws_index_checkpoint.delete(self.account_number)
+            self.saved = False
@@ -0,0 +1,139 @@
+import copy
+
+from autobot_helpers import context_helper
+from models import aws_datapoint_history
+from services.aws.maintenance_analyser import MaintenanceAnalyser
+from services.aws.region_index import SecurityGroupGraph
+from services.aws.security_analyser import SecurityAnalyser
+from services.aws.unused_resources_analyser import UnusedResourcesAnalyser
+from services.aws.utils import Constants, Helpers
+
+
+class FetchPipeline:
+    """
+    Streams collector output into aws_datapoint_history while the fetch is still running.
+
+    Every finished collector batch is handed to the snapshot writer straight away and a regional batch is analysed
+    into the running unusedResources / securityIssues / maintenance metadata as soon as it arrives. Most regional
+    checks only combine datapoints returned by the same collector (snapshots with volumes and amis, albs with
+    targetGroups, ...), so a (region, collector) unit is complete on its own and is released right after. The
+    unused security group check is the exception: groups are used by instances, network interfaces, load
+    balancers and RDS instances, which come from four collectors, so those datapoints are held per region and the
+    check runs once all of them have reported. Global datapoints are held until all global collectors have
+    reported as the IAM checks need users and groups together.
+
+    The completed units, the metadata they produced and their telemetry records are what a checkpoint stores,
+    a resumed fetch starts from them and skips those units. The held datapoints are not stored, a resumed fetch
+    reads the ones reported before it back from the snapshot.
+    """
+    # Datapoints the unused security group check needs and the pseudo unit recording it ran for a region
+    security_group_datapoints = ('securityGroups',) + SecurityGroupGraph.members
+    security_group_unit = 'securityGroupUsage'
+
+    def __init__(self, account_number, timestamp, writer, completed_units=None, metadata=None, telemetry=None):
+        self.account_number = account_number
+        self.timestamp = timestamp
+        self.writer = writer
+        self.completed_units = completed_units or {}
+        self.telemetry = telemetry or []
+        self.global_data = {'datapoints': {}}
+        self.global_units = {}
+        self.global_telemetry = []
+        self.pending_global_units = 0
+        self.security_group_data = {}
+        self.metadata = metadata or {
+            'unusedResources': copy.deepcopy(Constants.default_unused_dict),
+            'securityIssues': copy.deepcopy(Constants.default_security_dict),
+            'maintenance': copy.deepcopy(Constants.default_bp_maintenance_dict)
+        }
+
+    @staticmethod
+    def unit_key(name, region=None):
+        return (region if region else 'global') + '#' + name
+
+    def is_completed(self, name, region=None):
+        return FetchPipeline.unit_key(name, region) in self.completed_units
+
+    def expect(self, unit_count):
+        """ Registers how many global collector batches will be reported """
+        self.pending_global_units += unit_count
+
+    def add(self, name, region, datapoints, telemetry=None):
+        """ Writes one collector batch and analyses it, global batches are analysed once all of them are in """
+        for datapoint in datapoints:
+            self.writer.save(datapoint, region if region else 'global', datapoints[datapoint])
+        if region:
+            self.__analyse_region(region, {'datapoints': datapoints})
+            self.completed_units[FetchPipeline.unit_key(name, region)] = list(datapoints)
+            if telemetry:
+                self.telemetry.append(telemetry)
+            self.__hold_security_group_data(region, datapoints)
+        else:
+            self.global_data['datapoints'].update(datapoints)
+            self.global_units[FetchPipeline.unit_key(name)] = list(datapoints)
+            if telemetry:
+                self.global_telemetry.append(telemetry)
+            self.pending_global_units -= 1
+            if not self.pending_global_units:
+                self.__analyse_global()
+
+    def __analyse_region(self, region, regional_data):
+        context_helper.logger().debug("Analysing data for region=%s", region)
+        # Unused security groups are left to __analyse_security_groups
+        unit_data = {'datapoints': dict((datapoint, records) for datapoint, records
+                                        in regional_data['datapoints'].items() if datapoint != 'securityGroups')}
+        UnusedResourcesAnalyser.analyse_regional_data(region, unit_data, self.metadata['unusedResources'])
+        SecurityAnalyser.analyse_regional_data(region, regional_data, self.metadata['securityIssues'])
+        MaintenanceAnalyser.analyse_regional_data(region, regional_data, self.metadata['maintenance'])
+
+    def __reported(self, region):
+        """ Datapoints of the region reported by completed units, this invocation's or earlier ones' """
+        prefix = region + '#'
+        return set(datapoint for unit_key, datapoints in self.completed_units.items()
+                   if unit_key.startswith(prefix) for datapoint in datapoints)
+
+    def __hold_security_group_data(self, region, datapoints):
+        if self.is_completed(FetchPipeline.security_group_unit, region):
+            return
+        held = dict((datapoint, records) for datapoint, records in datapoints.items()
+                    if datapoint in FetchPipeline.security_group_datapoints)
+        if not held:
+            return
+        self.security_group_data.setdefault(region, {}).update(held)
+        if self.__reported(region).issuperset(FetchPipeline.security_group_datapoints):
+            self.__analyse_security_groups(region)
+
+    def __analyse_security_groups(self, region):
+        datapoints = self.security_group_data.pop(region, {})
+        missing = [datapoint for datapoint in FetchPipeline.security_group_datapoints
+                   if datapoint not in datapoints and datapoint in self.__reported(region)]
+        if missing:
+            # Reported by an invocation before the fetch was resumed
+            datapoints.update(aws_datapoint_history.read_snapshot_region(
+                self.account_number, self.timestamp, self.writer.base_timestamp, region, missing))
+        context_helper.logger().debug("Analysing security group usage for region=%s", region)
+        UnusedResourcesAnalyser.analyse_security_groups(datapoints, self.metadata['unusedResources'])
+        self.completed_units[FetchPipeline.unit_key(FetchPipeline.security_group_unit, region)] = []
+
+    def __analyse_global(self):
+        context_helper.logger().debug("Analysing global data")
+        SecurityAnalyser.analyse_global_data(self.global_data, self.metadata['securityIssues'])
+        MaintenanceAnalyser.analyse_global_data(self.global_data, self.metadata['maintenance'])
+        self.completed_units.update(self.global_units)
+        self.telemetry.extend(self.global_telemetry)
+        self.global_data = {'datapoints': {}}
+        self.global_units = {}
+        self.global_telemetry = []
+
+    def finish(self):
+        """ Returns the metadata to be saved with the intent """
+        if self.pending_global_units:
+            raise RuntimeError("Fetch pipeline finished before all collectors reported")
+        # Regions where a collector reported without some of the datapoints, checked with what there is
+        for region in set(unit_key.split('#', 1)[0] for unit_key, datapoints in self.completed_units.items()
+                          if 'securityGroups' in datapoints):
+            if not self.is_completed(FetchPipeline.security_group_unit, region):
+                self.__analyse_security_groups(region)
+        UnusedResourcesAnalyser.finalise(self.metadata['unusedResources'])
+        Helpers.clean_dict_for_dynamo(self.metadata)
+        return self.metadata
@@ -0,0 +1,107 @@
+from collections import deque
+
+from autobot_helpers import boto3_helper, context_helper
+
+
+class SnsFetchQueue:
+    """ The DataFetch SNS topic the fetch_data Lambda is subscribed to """
+
+    def topic_arn(self):
+        return 'arn:aws:sns:us-east-1:480805696776:DataFetch-' + context_helper.app().config["ENVIRONMENT"]
+
+    def publish(self, subject, message):
+        sns_client = boto3_helper.get_client('sns', autobot_resources=True)
+        return sns_client.publish(
+            TopicArn=self.topic_arn(),
+            Message=message,
+            Subject=subject,
+        )
+
+    def publish_batch(self, messages):
+        """ Publishes (subject, message) pairs 10 to a request, returns the indexes of the ones not published """
+        sns_client = boto3_helper.get_client('sns', autobot_resources=True)
+        if not hasattr(sns_client, 'publish_batch'):
+            # PublishBatch came with botocore 1.23
+            return self.__publish_each(sns_client, messages)
+        failed = []
+        for start in range(0, len(messages), 10):
+            chunk = messages[start:start + 10]
+            try:
+                response = sns_client.publish_batch(
+                    TopicArn=self.topic_arn(),
+                    PublishBatchRequestEntries=[{
+                        'Id': str(start + index),
+                        'Message': message,
+                        'Subject': subject
+                    } for index, (subject, message) in enumerate(chunk)]
+                )
+            except BaseException as e:
+                context_helper.logger().exception("Some error occured while publishing a fetch batch")
+                failed.extend(range(start, start + len(chunk)))
+                continue
+            for entry in response.get('Failed', []):
+                context_helper.logger().error("Fetch job %s not published: %s", entry['Id'], entry.get('Message'))
+                failed.append(int(entry['Id']))
+        return failed
+
+    def __publish_each(self, sns_client, messages):
+        failed = []
+        for index, (subject, message) in enumerate(messages):
+            try:
+                sns_client.publish(TopicArn=self.topic_arn(), Message=message, Subject=subject)
+            except BaseException as e:
+                context_helper.logger().exception("Some error occured while publishing fetch job %s", index)
+                failed.append(index)
+        return failed
+
+
+class LocalFetchQueue:
+    """
+    In-process stand-in for the DataFetch topic. Published jobs are handed to the handler, data_fetcher.fetch by
+    default, in publishing order once the outermost publish returns to the queue, so a sharded fetch runs its
+    coordinator, shards and aggregation one after another in the current process.
+    """
+
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.messages = deque()
+        self.results = []
+        self.running = False
+
+    def publish(self, subject, message):
+        self.messages.append((subject, message))
+        self.run()
+        return {'MessageId': str(len(self.results) + len(self.messages))}
+
+    def publish_batch(self, messages):
+        self.messages.extend(messages)
+        self.run()
+        return []
+
+    def run(self):
+        if self.running:
+            return
+        handler = self.handler
+        if handler is None:
+            from data_fetcher import fetch as handler
+        self.running = True
+        try:
+            while self.messages:
+                subject, message = self.messages.popleft()
+                event = {'Records': [{'Sns': {'Subject': subject, 'Message': message}}]}
+                self.results.append(handler(event, None))
+        finally:
+            self.running = False
+
+
+__local_queue = None
+
+
+def get_queue():
+    """ Queue fetch jobs go to, DATA_FETCH_QUEUE 'local' runs them in process """
+    global __local_queue
+    if context_helper.app().config.get('DATA_FETCH_QUEUE') == 'local':
+        if __local_queue is None:
+            __local_queue = LocalFetchQueue()
+        return __local_queue
+    return SnsFetchQueue()
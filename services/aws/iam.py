@@ -1,6 +1,7 @@
 from datetime import datetime
 
 from autobot_helpers import boto3_helper, policy_helper, context_helper
+from services.aws import records
 from services.aws.utils import Helpers
 from models.aws_access_policy_docs import  AwsAccessPolicyDoc
 import json
@@ -8,21 +9,14 @@ import traceback
 
 
 class IAM:
+    # MaxItems of the list calls, IAM allows up to 1000 a page
+    page_size = 1000
 
     def __init__(self):
         self.client = boto3_helper.get_client('iam')
 
     def get_user_details(self):
         context_helper.logger().debug("Started")
-        results = []
-        response = self.client.list_users()
-        results.extend(response['Users'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_users(Marker=next_token)
-            results.extend(response['Users'])
-            next_token = response['Marker'] if response.get('Marker') else False
-
         user_virtual_mfa = self.__get_virtual_mfa_details()
 
         vmfa_enabled_users = []
@@ -31,10 +25,10 @@ class IAM:
                 vmfa_enabled_users.append(virtual['User']['Arn'])
 
         users_list = []
-        for user in results:
+        for user in boto3_helper.paginate(self.client, 'list_users', 'Users', page_size=IAM.page_size):
             try:
-                user_data = {'name': user['UserName'], 'accessKeys': [], 'hasMFAEnabled': True, 'hasAdminAccess': False,
-                             'arn': user['Arn'], 'id': user['UserName'], 'policies': []}
+                user_data = records.User(name=user['UserName'], accessKeys=[], hasMFAEnabled=True, hasAdminAccess=False,
+                                         arn=user['Arn'], id=user['UserName'], policies=[])
 
                 user_policies = self.__get_user_policies(user['UserName'])
                 user_data['policies'] = user_policies
@@ -66,63 +60,35 @@ class IAM:
 
     def __get_user_groups(self, user_name):
         context_helper.logger().debug("Started for User=%s", user_name)
-        results = []
-        response = self.client.list_groups_for_user(UserName=user_name)
-        results.extend(response['Groups'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_groups_for_user(UserName=user_name, Marker=next_token)
-            results.extend(response['Groups'])
-            next_token = response['Marker'] if response.get('Marker') else False
         groups = []
-        for group in results:
+        for group in boto3_helper.paginate(self.client, 'list_groups_for_user', 'Groups', page_size=IAM.page_size,
+                                           UserName=user_name):
             groups.append(group['GroupName'])
         context_helper.logger().debug("Ended for User=%s", user_name)
         return groups
 
     def __get_user_policies(self, user_name):
         context_helper.logger().debug("Started for User=%s", user_name)
-        results = []
-        response = self.client.list_user_policies(UserName=user_name)
-        results.extend(response['PolicyNames'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_user_policies(UserName=user_name, Marker=next_token)
-            results.extend(response['PolicyNames'])
-            next_token = response['Marker'] if response.get('Marker') else False
+        results = list(boto3_helper.paginate(self.client, 'list_user_policies', 'PolicyNames',
+                                             page_size=IAM.page_size, UserName=user_name))
         context_helper.logger().debug("Ended for User=%s", user_name)
         return results
 
     def get_group_details(self):
         context_helper.logger().debug("Started")
-        results = []
-        response = self.client.list_groups()
-        results.extend(response['Groups'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_groups(Marker=next_token)
-            results.extend(response['Groups'])
-            next_token = response['Marker'] if response.get('Marker') else False
-
         groups = []
-        for group in results:
-            group_data = {'id': group['GroupId'], 'name': group['GroupName'], 'arn': group['Arn'],
-                          'path': group['Path'], 'createdOn': group['CreateDate'].isoformat(),
-                          'policies': self.__get_group_policies(group['GroupName'])}
+        for group in boto3_helper.paginate(self.client, 'list_groups', 'Groups', page_size=IAM.page_size):
+            group_data = records.Group(id=group['GroupId'], name=group['GroupName'], arn=group['Arn'],
+                                       path=group['Path'], createdOn=group['CreateDate'].isoformat(),
+                                       policies=self.__get_group_policies(group['GroupName']))
             groups.append(group_data)
         context_helper.logger().debug("Ended")
         return groups
 
     def __get_group_policies(self, group_name):
         context_helper.logger().debug("Started for Group=%s", group_name)
-        results = []
-        response = self.client.list_group_policies(GroupName=group_name)
-        results.extend(response['PolicyNames'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_group_policies(GroupName=group_name, Marker=next_token)
-            results.extend(response['PolicyNames'])
-            next_token = response['Marker'] if response.get('Marker') else False
+        results = list(boto3_helper.paginate(self.client, 'list_group_policies', 'PolicyNames',
+                                             page_size=IAM.page_size, GroupName=group_name))
         context_helper.logger().debug("Ended for Group=%s", group_name)
         return results
 
@@ -169,14 +135,8 @@ class IAM:
 
     def __get_virtual_mfa_details(self):
         context_helper.logger().debug("Started")
-        vmfa_result = []
-        response = self.client.list_virtual_mfa_devices()
-        vmfa_result.extend(response['VirtualMFADevices'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_virtual_mfa_devices(Marker=next_token)
-            vmfa_result.extend(response['VirtualMFADevices'])
-            next_token = response['Marker'] if response.get('Marker') else False
+        vmfa_result = list(boto3_helper.paginate(self.client, 'list_virtual_mfa_devices', 'VirtualMFADevices',
+                                                 page_size=IAM.page_size))
         context_helper.logger().debug("Ended")
         return vmfa_result
 
@@ -278,9 +238,9 @@ class IAM:
 
     @staticmethod
     def get_access_key_details(iam_client, userName):
-        access_keys = iam_client.list_access_keys(UserName=userName)
         access_key_data_list = []
-        for access_key in access_keys['AccessKeyMetadata']:
+        for access_key in boto3_helper.paginate(iam_client, 'list_access_keys', 'AccessKeyMetadata',
+                                                UserName=userName):
             if access_key:
                 try:
                     access_key_data = {'id': access_key['AccessKeyId'], "lastUsed": None}
@@ -299,21 +259,12 @@ class IAM:
 
     def get_role_details(self):
         context_helper.logger().debug("Started")
-        results = []
-        response = self.client.list_roles()
-        results.extend(response['Roles'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_roles(Marker=next_token)
-            results.extend(response['Roles'])
-            next_token = response['Marker'] if response.get('Marker') else False
-
         roles_data = []
-        for role in results:
+        for role in boto3_helper.paginate(self.client, 'list_roles', 'Roles', page_size=IAM.page_size):
             try:
-                role_data = {'name': role['RoleName'], 'id': role['RoleId'], 'arn': role['Arn'],
-                             'createdOn': role['CreateDate'].isoformat(),
-                             'maxSessionDuration': role['MaxSessionDuration'], 'policies': []}
+                role_data = records.Role(name=role['RoleName'], id=role['RoleId'], arn=role['Arn'],
+                                         createdOn=role['CreateDate'].isoformat(),
+                                         maxSessionDuration=role['MaxSessionDuration'], policies=[])
 
                 if 'Description' in role:
                     role_data['description'] = role['Description']
@@ -329,47 +280,19 @@ class IAM:
 
     def __get_role_policies(self, role_name):
         context_helper.logger().debug("Started for Role=%s", role_name)
-        results = []
-        response = self.client.list_attached_role_policies(RoleName=role_name)
-        results.extend(response['AttachedPolicies'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_role_policies(RoleName=role_name, Marker=next_token)
-            results.extend(response['AttachedPolicies'])
-            next_token = response['Marker'] if response.get('Marker') else False
-
-        final_result = []
-        response = self.client.list_role_policies(RoleName=role_name)
-        final_result.extend(response['PolicyNames'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_role_policies(RoleName=role_name, Marker=next_token)
-            final_result.extend(response['PolicyNames'])
-            next_token = response['Marker'] if response.get('Marker') else False
-        context_helper.logger().debug("Ended for Role=%s", role_name)
-
-        for policy in results:
+        final_result = list(boto3_helper.paginate(self.client, 'list_role_policies', 'PolicyNames',
+                                                  page_size=IAM.page_size, RoleName=role_name))
+        for policy in boto3_helper.paginate(self.client, 'list_attached_role_policies', 'AttachedPolicies',
+                                            page_size=IAM.page_size, RoleName=role_name):
             final_result.append(policy['PolicyName'])
+        context_helper.logger().debug("Ended for Role=%s", role_name)
 
         return final_result
 
     def __list_all_policies(self):
         context_helper.logger().debug("Started for all")
-        results = []
-        response = self.client.list_policies(
-            Scope='Local',
-            OnlyAttached=True,
-        )
-        results.extend(response['Policies'])
-        while response['IsTruncated']:
-            next_token = response['Marker']
-            response = self.client.list_policies(
-                Scope='Local',
-                OnlyAttached=True,
-                Marker=next_token
-            )
-            results.extend(response['Policies'])
-            next_token = response['Marker'] if response.get('Marker') else False
+        results = list(boto3_helper.paginate(self.client, 'list_policies', 'Policies', page_size=IAM.page_size,
+                                             Scope='Local', OnlyAttached=True))
         context_helper.logger().debug("Ended for all")
         return results
 
@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from autobot_helpers import context_helper
+from models import aws_collection_watermark, aws_datapoint_history, aws_intent_history
+from services.aws.cloud_trail import CloudTrail
+from services.aws.ec2 import EC2
+from services.aws.utils import Helpers
+
+
+class IncrementalCollection:
+    """
+    Collects the self owned EBS snapshots and AMIs of a region from what changed since the latest snapshot.
+
+    Both are immutable apart from their tags and deletion. Instead of listing all of them, the records of the latest
+    snapshot are taken over and updated with the ones created since it, found with a creation date filter. The
+    resources deleted or retagged since are read from the CloudTrail event history, deleted ones are dropped and
+    retagged ones described again. A watermark per region and datapoint records when it was last collected and
+    when it was last listed in full. Everything is listed again when the watermark doesn't cover the latest
+    snapshot, every full_sync_days, when the window grows past max_window_days or when the events can't be read.
+    """
+
+    collections = {
+        'snapshots': {'list': 'get_snapshot_details', 'created_filter': 'start-time', 'id_filter': 'snapshot-id',
+                      'id_prefix': 'snap-', 'deleted_by': 'DeleteSnapshot'},
+        'amis': {'list': 'get_ami_details', 'created_filter': 'creation-date', 'id_filter': 'image-id',
+                 'id_prefix': 'ami-', 'deleted_by': 'DeregisterImage'}
+    }
+    tag_events = ['CreateTags', 'DeleteTags']
+
+    default_config = {
+        'enabled': True,
+        'full_sync_days': 7,
+        'max_window_days': 14,
+        'event_lag_minutes': 60
+    }
+
+    @staticmethod
+    def config():
+        config = dict(IncrementalCollection.default_config)
+        config.update(context_helper.app().config.get('INCREMENTAL_COLLECTION_CONFIG') or {})
+        return config
+
+    def __init__(self, region, ec2=None):
+        self.region = region
+        self.ec2 = ec2 if ec2 else EC2(region_name=region)
+        self.account_number = context_helper.get_current_session()['attributes']['accountNumber']
+        self.latest = None
+        self.events = None
+
+    def collect(self, datapoint):
+        """ Returns the datapoint's records like the EC2 listing would """
+        config = IncrementalCollection.config()
+        collected_at = datetime.utcnow()
+        watermark = aws_collection_watermark.get(self.account_number, self.region, datapoint)
+        since = self.__since(watermark, config, collected_at)
+        records = None
+        if since:
+            try:
+                records = self.__collect_changes(datapoint, since)
+            except BaseException as e:
+                context_helper.logger().exception("Incremental collection of %s in %s failed, listing all, %s",
+                                                  datapoint, self.region, e)
+        if records is None:
+            records = getattr(self.ec2, IncrementalCollection.collections[datapoint]['list'])() or []
+            full_sync_at = collected_at.isoformat()
+        else:
+            full_sync_at = watermark['fullSyncAt']
+        aws_collection_watermark.save(self.account_number, self.region, datapoint, {
+            'watermark': collected_at.isoformat(),
+            'fullSyncAt': full_sync_at,
+            'itemCount': len(records)
+        })
+        return records if records else None
+
+    def __since(self, watermark, config, collected_at):
+        """ Start of the change window, None when everything has to be listed """
+        if not config['enabled'] or not watermark:
+            return None
+        if collected_at - Helpers.fromisoformat(watermark['fullSyncAt']) >= \
+                timedelta(days=float(config['full_sync_days'])):
+            return None
+        if self.latest is None:
+            self.latest = aws_intent_history.get_latest_snapshot_info(self.account_number) or {}
+        snapshot = self.latest.get('snapshot')
+        if not snapshot or int(snapshot.get('version', 1)) < aws_datapoint_history.SNAPSHOT_VERSION:
+            return None
+        # The region has to have been collected into the latest snapshot, not skipped or lost to a failed fetch
+        if watermark['watermark'] < self.latest['timestamp']:
+            return None
+        since = Helpers.fromisoformat(self.latest['timestamp']) - timedelta(minutes=float(config['event_lag_minutes']))
+        if collected_at - since > timedelta(days=float(config['max_window_days'])):
+            return None
+        return since
+
+    def __collect_changes(self, datapoint, since):
+        collection = IncrementalCollection.collections[datapoint]
+        list_records = getattr(self.ec2, collection['list'])
+        if self.events is None:
+            self.events = CloudTrail(region_name=self.region).get_event_resource_ids(
+                [collection['deleted_by'] for collection in IncrementalCollection.collections.values()] +
+                IncrementalCollection.tag_events, since)
+        previous = aws_datapoint_history.get_snapshot_datapoint(self.account_number, self.latest['timestamp'],
+                                                                datapoint, self.region).get(self.region, [])
+        records = OrderedDict((record['id'], record) for record in previous)
+        for resource_id in self.events[collection['deleted_by']]:
+            records.pop(resource_id, None)
+
+        # Retagged resources and AMIs still being created are described again, the ones not found are gone
+        refresh_ids = set(resource_id for event_name in IncrementalCollection.tag_events
+                          for resource_id in self.events[event_name]
+                          if resource_id.startswith(collection['id_prefix']) and resource_id in records)
+        refresh_ids.update(record['id'] for record in records.values()
+                           if datapoint == 'amis' and record.get('state') != 'available')
+        for resource_id in refresh_ids:
+            records.pop(resource_id)
+        for filters in EC2.id_filters(collection['id_filter'], refresh_ids):
+            for record in list_records(filters) or []:
+                records[record['id']] = record
+
+        for record in list_records([EC2.created_since_filter(collection['created_filter'], since)]) or []:
+            records[record['id']] = record
+        if datapoint == 'amis':
+            for record in records.values():
+                if record.get('createdOn'):
+                    record['age'] = (datetime.now() - Helpers.fromisoformat(record['createdOn'])).days
+        return list(records.values())
@@ -0,0 +1,49 @@
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from autobot_helpers import context_helper
+from models import cloud_service_provider
+
+
+class IndexLease:
+    """
+    Lease on an account's cloud_service_providers item held while its data is fetched, so the scheduler and
+    other invocations leave the account alone.
+
+    The lease has an owner token and an expiry and is taken with a conditional write. It outlives a single
+    invocation: a fetch that stops at the deadline passes the owner on with the resume message and the next
+    invocation takes the lease over. A fetch that dies without releasing it blocks the account only until the
+    lease expires.
+    """
+
+    def __init__(self, email, account_id, owner=None, duration_seconds=960, renew_interval_seconds=60):
+        self.email = email
+        self.account_id = account_id
+        self.owner = owner or str(uuid.uuid4())
+        self.duration_seconds = duration_seconds
+        self.renew_interval_seconds = renew_interval_seconds
+        self.renewed_at = None
+
+    def expires_at(self):
+        return (datetime.utcnow() + timedelta(seconds=self.duration_seconds)).isoformat()
+
+    def acquire(self):
+        if not cloud_service_provider.acquire_index_lease(self.email, self.account_id, self.owner, self.expires_at()):
+            context_helper.logger().info("Account=%s is being indexed by another fetch", self.account_id)
+            return False
+        self.renewed_at = time.time()
+        return True
+
+    def renew_if_due(self):
+        """ Extends the lease every renew_interval_seconds, returns False once it was lost to another owner """
+        if time.time() - self.renewed_at < self.renew_interval_seconds:
+            return True
+        if not cloud_service_provider.renew_index_lease(self.email, self.account_id, self.owner, self.expires_at()):
+            context_helper.logger().error("Indexing lease on account=%s was lost", self.account_id)
+            return False
+        self.renewed_at = time.time()
+        return True
+
+    def release(self):
+        cloud_service_provider.release_index_lease(self.email, self.account_id, self.owner)
@@ -0,0 +1,160 @@
+import copy
+
+from models import aws_datapoint_history
+from services.aws.maintenance_analyser import MaintenanceAnalyser
+from services.aws.security_analyser import SecurityAnalyser
+from services.aws.unused_resources_analyser import UnusedResourcesAnalyser
+from services.aws.utils import Constants, Helpers
+
+
+class PartialRefresh:
+    """
+    Re-collects some datapoints in some regions and merges them into an existing AllResources snapshot.
+
+    Only the metadata keys computed from a refreshed datapoint are recomputed. They still cover every active
+    region, so the datapoints they need are taken fresh where they were refreshed and read back from the snapshot
+    everywhere else. Every other metadata key and every other stored resource is left as it is.
+    """
+
+    # Datapoints each metadata key is computed from, has to follow the analysers
+    key_dependencies = {
+        'unusedResources': {
+            'volumes': ['volumes'],
+            'eips': ['eips'],
+            'vpcs': ['vpcs'],
+            'snapshots': ['snapshots', 'volumes', 'amis'],
+            'enis': ['enis'],
+            'securityGroups': ['securityGroups', 'ec2s', 'enis', 'elbs', 'albs', 'rdses'],
+            'amis': ['amis'],
+            'ec2s': ['ec2s'],
+            'routeTables': ['routeTables'],
+            'internetGateways': ['internetGateways'],
+            'vpnGateways': ['vpnGateways'],
+            'elbs': ['elbs'],
+            'albs': ['albs', 'targetGroups'],
+            'targetGroups': ['targetGroups'],
+            'rdses': ['rdses'],
+            'autoScalingGroups': ['autoScalingGroups'],
+            'launchConfigs': ['launchConfigs', 'autoScalingGroups']
+        },
+        'securityIssues': {
+            'usersWithoutMFA': ['users'],
+            'unusedAccessKeys': ['users'],
+            'unusedIAMUsers': ['users'],
+            'expiredAccessKeys': ['users'],
+            'adminUsers': ['users', 'groups'],
+            'adminRoles': ['roles'],
+            'passwordPolicy': ['passwordPolicy'],
+            'rootAccountWithoutMFA': ['accountSummary'],
+            'publicRWS3Buckets': ['s3Buckets'],
+            'insecurePublicPortsSGs': ['securityGroups'],
+            'publicSSHAccess': ['securityGroups'],
+            'cloudTrailsNotConfigured': ['cloudTrails'],
+            'rdsDataEncryptionAtRest': ['rdses'],
+            'publicRDS': ['rdses'],
+            'ec2WithoutIAM': ['ec2s']
+        },
+        'maintenance': {
+            'staleSecurityGroups': ['vpcs'],
+            'vpcWithoutPrivateSubnet': ['vpcs'],
+            'failingNATGateways': ['vpcs'],
+            'vpcWithoutS3Endpoints': ['vpcs', 'vpcEndpoints'],
+            'ipv6VPCWithoutEgressOnlyIGW': ['vpcs'],
+            'classicEC2Instances': ['ec2s'],
+            'ec2WithoutEBSOptimised': ['ec2s'],
+            'ec2NotTerminationProtected': ['ec2s'],
+            'unencryptedVolumes': ['volumes'],
+            's3BucketsWithoutVersioning': ['s3Buckets']
+        }
+    }
+
+    global_datapoints = ['users', 'roles', 'groups', 'accountSummary', 'passwordPolicy', 's3Buckets']
+
+    def __init__(self, account_number, timestamp, datapoints, regions, active_regions):
+        self.account_number = account_number
+        self.timestamp = timestamp
+        self.datapoints = list(datapoints)
+        self.regions = list(regions)
+        self.active_regions = list(active_regions)
+        self.fresh = {}
+        self.telemetry = []
+
+    def affected_keys(self):
+        affected = {}
+        for section, dependencies in PartialRefresh.key_dependencies.items():
+            keys = [key for key, datapoints in dependencies.items()
+                    if any(datapoint in self.datapoints for datapoint in datapoints)]
+            if keys:
+                affected[section] = keys
+        return affected
+
+    def required_datapoints(self):
+        required = set()
+        for section, keys in self.affected_keys().items():
+            for key in keys:
+                required.update(PartialRefresh.key_dependencies[section][key])
+        return required
+
+    def add(self, region, datapoints, telemetry=None):
+        self.fresh.setdefault(region if region else 'global', {}).update(datapoints)
+        if telemetry:
+            self.telemetry.append(telemetry)
+
+    def merge(self):
+        """ Writes the refreshed datapoints into the snapshot, returns the number of changed items """
+        changes = 0
+        for datapoint in self.datapoints:
+            regions = ['global'] if datapoint in PartialRefresh.global_datapoints else self.regions
+            region_items = {region: self.fresh.get(region, {}).get(datapoint) for region in regions}
+            if any(items is not None and not isinstance(items, list) for items in region_items.values()):
+                # accountSummary and passwordPolicy only live in the metadata
+                continue
+            changes += aws_datapoint_history.merge_resources(self.account_number, self.timestamp, datapoint,
+                                                             region_items)
+        return changes
+
+    def analyse(self, metadata):
+        """ Returns {(section, key): value} for the affected metadata keys, fixes already recorded are kept """
+        required = self.required_datapoints()
+        stored = {}
+        for datapoint in required:
+            if datapoint not in self.datapoints or (datapoint not in PartialRefresh.global_datapoints and
+                                                    set(self.active_regions) - set(self.regions)):
+                stored[datapoint] = aws_datapoint_history.get_snapshot_datapoint(self.account_number,
+                                                                                 self.timestamp, datapoint)
+        analysed = {
+            'unusedResources': copy.deepcopy(Constants.default_unused_dict),
+            'securityIssues': copy.deepcopy(Constants.default_security_dict),
+            'maintenance': copy.deepcopy(Constants.default_bp_maintenance_dict)
+        }
+        regional_required = [datapoint for datapoint in required if datapoint not in PartialRefresh.global_datapoints]
+        if regional_required:
+            for region in self.active_regions:
+                regional_data = {'datapoints': {datapoint: self.__datapoint(datapoint, region, stored)
+                                                for datapoint in regional_required}}
+                UnusedResourcesAnalyser.analyse_regional_data(region, regional_data, analysed['unusedResources'])
+                SecurityAnalyser.analyse_regional_data(region, regional_data, analysed['securityIssues'])
+                MaintenanceAnalyser.analyse_regional_data(region, regional_data, analysed['maintenance'])
+        global_required = [datapoint for datapoint in required if datapoint in PartialRefresh.global_datapoints]
+        if global_required:
+            global_data = {'datapoints': {datapoint: self.__datapoint(datapoint, 'global', stored)
+                                          for datapoint in global_required}}
+            SecurityAnalyser.analyse_global_data(global_data, analysed['securityIssues'])
+            MaintenanceAnalyser.analyse_global_data(global_data, analysed['maintenance'])
+        UnusedResourcesAnalyser.finalise(analysed['unusedResources'])
+        Helpers.clean_dict_for_dynamo(analysed)
+
+        updates = {}
+        for section, keys in self.affected_keys().items():
+            for key in keys:
+                value = analysed[section][key]
+                previous = metadata.get(section, {}).get(key) or {}
+                if previous.get('fixedItemList'):
+                    value['fixedItemList'] = previous['fixedItemList']
+                updates[(section, key)] = value
+        return updates
+
+    def __datapoint(self, datapoint, region, stored):
+        if datapoint in stored and (datapoint not in self.datapoints or region not in self.regions + ['global']):
+            return stored[datapoint].get(region, [])
+        return self.fresh.get(region, {}).get(datapoint)
@@ -1,5 +1,6 @@
 from datetime import datetime
 from autobot_helpers import boto3_helper, policy_helper, context_helper
+from services.aws import records
 from services.aws.utils import Constants
 from flask import current_app as app
 
@@ -20,19 +21,14 @@ class RDS:
         :return:
         '''
 
-        results = []
-        response = self.client.describe_db_instances()
-        results.extend(response['DBInstances'])
-        while 'Marker' in response:
-            next_token = response['Marker']
-            response = self.client.describe_db_instances(Marker=next_token)
-            results.extend(response['DBInstances'])
-            next_token = response['Marker'] if response.get('Marker') else False
         rds_list = []
-        for db_instance in results:
+        for db_instance in boto3_helper.paginate(self.client, 'describe_db_instances', 'DBInstances', page_size=100):
             try:
-                rds_data = {'id': db_instance['DBInstanceIdentifier'],
-                            'name': db_instance['DBInstanceIdentifier'], 'isPublic': db_instance['PubliclyAccessible']}
+                rds_data = records.DBInstance(id=db_instance['DBInstanceIdentifier'],
+                                              name=db_instance['DBInstanceIdentifier'],
+                                              isPublic=db_instance['PubliclyAccessible'],
+                                              securityGroups=[group['VpcSecurityGroupId'] for group in
+                                                              db_instance.get('VpcSecurityGroups', [])])
                 try:
                     rds_data['name'] = db_instance['DBName']
                 except KeyError as e:
@@ -53,19 +49,12 @@ class RDS:
           }
         :return:
         '''
-        results = []
-        response = self.client.describe_db_snapshots(SnapshotType='manual')
-        results.extend(response['DBSnapshots'])
-        while 'Marker' in response:
-            next_token = response['Marker']
-            response = self.client.describe_db_snapshots(SnapshotType='manual', Marker=next_token)
-            results.extend(response['DBSnapshots'])
-            next_token = response['Marker'] if response.get('Marker') else False
         rds_snapshots = []
-        for rds_ss in results:
+        for rds_ss in boto3_helper.paginate(self.client, 'describe_db_snapshots', 'DBSnapshots', page_size=100,
+                                            SnapshotType='manual'):
             try:
-                rds_snapshot = {'id': rds_ss['DBSnapshotIdentifier'], 'rdsId': rds_ss['DBInstanceIdentifier'],
-                                'arn': rds_ss['DBSnapshotArn']}
+                rds_snapshot = records.DBSnapshot(id=rds_ss['DBSnapshotIdentifier'],
+                                                  rdsId=rds_ss['DBInstanceIdentifier'], arn=rds_ss['DBSnapshotArn'])
                 if 'SnapshotCreateTime' in rds_ss:
                     rds_snapshot['age'] = (datetime.now() - rds_ss['SnapshotCreateTime'].replace(tzinfo=None)).days
                 if 'AllocatedStorage' in rds_ss:
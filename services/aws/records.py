@@ -0,0 +1,195 @@
+import sys
+
+
+class Record:
+    """
+    Compact collected resource, one subclass per datapoint with the record's keys as __slots__.
+
+    Records read like the dicts the collectors used to return, so the analysers work on either, and to_item()
+    gives that dict back for storing. A key that was never set is missing, same as a dict key. Repeated strings
+    like region and state are interned and Key/Value tag lists are held as tuples, unpacked when read.
+    """
+    __slots__ = ()
+    interned = frozenset(('region', 'state', 'status', 'type', 'domain', 'availabilityZone', 'vpcId', 'version',
+                          'protocol'))
+
+    def __init__(self, **fields):
+        for key, value in fields.items():
+            self[key] = value
+
+    @classmethod
+    def from_item(cls, item):
+        """ Record of a stored or collected dict, dicts with keys the record has no slot for are kept as they are """
+        if any(key not in cls.__slots__ for key in item):
+            return item
+        return cls(**item)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        try:
+            value = getattr(self, key)
+        except AttributeError:
+            raise KeyError(key)
+        if key == 'tags' and isinstance(value, tuple):
+            return [{'Key': tag_key, 'Value': tag_value} for tag_key, tag_value in value]
+        return value
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError('%s has no %s' % (type(self).__name__, key))
+        if key in Record.interned and isinstance(value, str):
+            value = sys.intern(value)
+        elif key == 'tags' and isinstance(value, list) and \
+                all(isinstance(tag, dict) and len(tag) == 2 and 'Key' in tag and 'Value' in tag for tag in value):
+            value = tuple((sys.intern(tag['Key']), tag['Value']) for tag in value)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, (Record, dict)):
+            return self.to_item() == dict(other.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, self.to_item())
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def keys(self):
+        return [key for key in self.__slots__ if hasattr(self, key)]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+    def to_item(self):
+        """ The record as the dict stored in aws_datapoint_history """
+        return dict(self.items())
+
+
+class Instance(Record):
+    __slots__ = ('id', 'name', 'state', 'region', 'launchedOn', 'isTerminationProtected', 'isEbsOptimized',
+                 'securityGroups', 'isLastStateChangeUserInitiated', 'lastStateChangedOn', 'reasonForLastStateChange',
+                 'privateIp', 'vpcId', 'subnetId', 'tags', 'iamProfileId', 'autoScaled', 'autoScalingGroupName',
+                 'autoScalingHealthStatus')
+
+
+class SecurityGroup(Record):
+    __slots__ = ('id', 'name', 'region', 'vpcId', 'tags', 'ingressRules', 'egressRules')
+
+
+class Volume(Record):
+    __slots__ = ('id', 'name', 'type', 'size', 'iops', 'region', 'availabilityZone', 'createdOn', 'isEncrypted',
+                 'attachments', 'tags')
+
+
+class Snapshot(Record):
+    __slots__ = ('id', 'name', 'volumeId', 'volumeSize', 'isEncrypted', 'createdOn', 'description', 'region',
+                 'tags')
+
+
+class ElasticIp(Record):
+    __slots__ = ('id', 'name', 'ip', 'domain', 'allocationId', 'region', 'networkInterfaceId', 'instanceId', 'tags')
+
+
+class NetworkInterface(Record):
+    __slots__ = ('id', 'name', 'status', 'type', 'region', 'subnetId', 'availabilityZone', 'description',
+                 'association', 'attachment', 'securityGroups', 'tags')
+
+
+class Vpc(Record):
+    __slots__ = ('id', 'name', 'region', 'isDefault', 'hasIPv6Association', 'hasEgressOnlyInternetGateways',
+                 'natGateways', 'flowLogs', 'staleSecurityGroups', 'tags')
+
+
+class VpcEndpoint(Record):
+    __slots__ = ('id', 'vpcId', 'serviceName', 'status', 'type')
+
+
+class RouteTable(Record):
+    __slots__ = ('id', 'name', 'region', 'vpcId', 'associations', 'tags')
+
+
+class InternetGateway(Record):
+    __slots__ = ('id', 'name', 'region', 'attachments', 'tags')
+
+
+class VpnGateway(Record):
+    __slots__ = ('id', 'name', 'state', 'type', 'region', 'availabilityZone', 'vpcAttachments', 'tags')
+
+
+class Ami(Record):
+    __slots__ = ('id', 'name', 'state', 'region', 'createdOn', 'age', 'snapshots', 'tags')
+
+
+class ClassicLoadBalancer(Record):
+    __slots__ = ('id', 'name', 'version', 'createdOn', 'vpcId', 'subnets', 'availabilityZones', 'instances',
+                 'securityGroups')
+
+
+class LoadBalancer(Record):
+    __slots__ = ('id', 'name', 'arn', 'version', 'state', 'type', 'createdOn', 'vpcId', 'availabilityZones',
+                 'instances', 'securityGroups', 'listeners')
+
+
+class TargetGroup(Record):
+    __slots__ = ('id', 'name', 'arn', 'vpcId', 'protocol', 'port', 'loadBalancerArns', 'instanceHealth')
+
+
+class DBInstance(Record):
+    __slots__ = ('id', 'name', 'isPublic', 'isEncrypted', 'securityGroups')
+
+
+class DBSnapshot(Record):
+    __slots__ = ('id', 'rdsId', 'arn', 'age', 'allocatedStorage')
+
+
+class LaunchConfig(Record):
+    __slots__ = ('id', 'name', 'arn')
+
+
+class AutoScalingGroup(Record):
+    __slots__ = ('id', 'name', 'arn', 'status', 'createdOn', 'instances', 'launchConfigName', 'launchTemplateId',
+                 'launchTemplateName', 'availabilityZones', 'loadBalancerNames', 'targetGroupARNs', 'desiredCapacity',
+                 'tags')
+
+
+class CloudTrail(Record):
+    __slots__ = ('id', 'name', 'arn')
+
+
+class User(Record):
+    __slots__ = ('id', 'name', 'arn', 'hasMFAEnabled', 'hasAdminAccess', 'lastLoggedIn', 'policies', 'groups',
+                 'accessKeys')
+
+
+class Role(Record):
+    __slots__ = ('id', 'name', 'arn', 'description', 'createdOn', 'maxSessionDuration', 'policies')
+
+
+class Group(Record):
+    __slots__ = ('id', 'name', 'arn', 'path', 'createdOn', 'policies')
+
+
+class S3Bucket(Record):
+    __slots__ = ('id', 'name', 'createdOn', 'isPublicRead', 'isPublicWrite', 'isVersioningEnabled', 'tags')
+
+
+# Record type of each datapoint, for turning stored records back into records
+datapoint_records = {
+    'ec2s': Instance, 'securityGroups': SecurityGroup, 'volumes': Volume, 'snapshots': Snapshot, 'eips': ElasticIp,
+    'enis': NetworkInterface, 'vpcs': Vpc, 'vpcEndpoints': VpcEndpoint, 'routeTables': RouteTable,
+    'internetGateways': InternetGateway, 'vpnGateways': VpnGateway, 'amis': Ami, 'elbs': ClassicLoadBalancer,
+    'albs': LoadBalancer, 'targetGroups': TargetGroup, 'rdses': DBInstance, 'rdsManualSnapshots': DBSnapshot,
+    'launchConfigs': LaunchConfig, 'autoScalingGroups': AutoScalingGroup, 'cloudTrails': CloudTrail,
+    'users': User, 'roles': Role, 'groups': Group, 's3Buckets': S3Bucket
+}
@@ -0,0 +1,143 @@
+from bisect import bisect_left, bisect_right
+
+
+class RegionIndex:
+    """
+    Lookups over the collected datapoints of one region, for the analysers.
+
+    Each lookup is built from its datapoint the first time it is asked for and reused by every check after, so
+    matching one resource against another is a hash lookup rather than a scan of the other datapoint.
+    """
+
+    def __init__(self, datapoints):
+        self.datapoints = datapoints if datapoints else {}
+        self.indexes = {}
+
+    def records(self, datapoint):
+        return self.datapoints.get(datapoint) or []
+
+    def by(self, datapoint, key='id'):
+        """ Records of the datapoint by the value of key, records without one are left out """
+        index_key = ('by', datapoint, key)
+        if index_key not in self.indexes:
+            self.indexes[index_key] = dict((record[key], record) for record in self.records(datapoint)
+                                           if record.get(key))
+        return self.indexes[index_key]
+
+    def values(self, datapoint, key):
+        """ Set of the values of key across the datapoint's records """
+        index_key = ('values', datapoint, key)
+        if index_key not in self.indexes:
+            self.indexes[index_key] = set(record[key] for record in self.records(datapoint) if record.get(key))
+        return self.indexes[index_key]
+
+    def security_group_graph(self):
+        if 'securityGroupGraph' not in self.indexes:
+            self.indexes['securityGroupGraph'] = SecurityGroupGraph(self)
+        return self.indexes['securityGroupGraph']
+
+    def open_ports(self):
+        if 'openPorts' not in self.indexes:
+            self.indexes['openPorts'] = OpenPorts(self.security_group_graph())
+        return self.indexes['openPorts']
+
+
+class SecurityGroupGraph:
+    """
+    References to the security groups of one region, as adjacency sets keyed by group id.
+
+    Instances, network interfaces, load balancers and RDS instances reference the groups they are in and a group
+    references the groups its rules allow traffic from or to. Network interfaces also cover what isn't collected on
+    its own, like Lambda functions or EFS mount targets in a VPC. The ingress rules open to the whole internet are
+    kept per group for the exposure checks.
+    """
+    members = ('ec2s', 'enis', 'elbs', 'albs', 'rdses')
+
+    def __init__(self, index):
+        self.used_by = {}
+        self.world_open_rules = {}
+        for datapoint in SecurityGroupGraph.members:
+            for record in index.records(datapoint):
+                for group in record.get('securityGroups') or []:
+                    # Instances hold {'id', 'name'} of their groups, the others only the id
+                    self.__add(group['id'] if isinstance(group, dict) else group, datapoint, record['id'])
+        for security_group in index.records('securityGroups'):
+            for rule in (security_group.get('ingressRules') or []) + (security_group.get('egressRules') or []):
+                for group_id in rule.get('sourceGroups') or []:
+                    if group_id != security_group['id']:
+                        self.__add(group_id, 'securityGroups', security_group['id'])
+            self.world_open_rules[security_group['id']] = [
+                rule for rule in security_group.get('ingressRules') or []
+                if any(ip_range.get('CidrIp') == '0.0.0.0/0' for ip_range in rule.get('ipRange') or [])]
+
+    def __add(self, group_id, datapoint, resource_id):
+        self.used_by.setdefault(group_id, set()).add((datapoint, resource_id))
+
+    def is_used(self, group_id):
+        return group_id in self.used_by
+
+    def users(self, group_id):
+        """ What references the group, as [{'type': datapoint, 'id': resource id}] """
+        return [{'type': datapoint, 'id': resource_id}
+                for datapoint, resource_id in sorted(self.used_by.get(group_id, ()))]
+
+    def open_rules(self, group_id):
+        return self.world_open_rules.get(group_id, [])
+
+
+class OpenPorts:
+    """
+    Port ranges the security groups of one region leave open to the internet, sorted by their first port.
+
+    Every port policy is checked in the same pass: the policies' ports are merged into one sorted list and each
+    range takes the slice of it that it covers, found by bisection, so a check costs a range count times the log of
+    the port count whatever the number of policies. Rules open to all traffic cover every port, ICMP rules none.
+    """
+    all_ports = (0, 65535)
+
+    def __init__(self, graph):
+        self.ranges = []
+        for group_id, rules in graph.world_open_rules.items():
+            for rule in rules:
+                port_range = OpenPorts.port_range(rule)
+                if port_range:
+                    self.ranges.append(port_range + (group_id,))
+        self.ranges.sort()
+        self.results = {}
+
+    @staticmethod
+    def port_range(rule):
+        """ (first, last) port of a collected ingress rule, None when it doesn't open TCP or UDP ports """
+        protocol = str(rule.get('protocol') or '').lower()
+        from_port = rule.get('fromPort')
+        to_port = rule.get('toPort')
+        if protocol in ('-1', 'all'):
+            return OpenPorts.all_ports
+        if not protocol:
+            # Rules collected without the protocol, only all traffic has no ports and only ICMP has -1
+            if from_port is None and to_port is None:
+                return OpenPorts.all_ports
+            if from_port in (-1, '-1') or to_port in (-1, '-1'):
+                return None
+        elif protocol not in ('tcp', 'udp', '6', '17'):
+            # ICMP, ESP, GRE... don't have ports
+            return None
+        if from_port in (-1, '-1') or to_port in (-1, '-1'):
+            return OpenPorts.all_ports
+        # Port 0 is collected as None
+        return int(from_port or 0), int(to_port if to_port is not None else from_port or 0)
+
+    def exposed(self, policies):
+        """ Ids of the groups open on any of each policy's ports, as {policy: set of group ids} """
+        key = tuple(sorted((name, tuple(sorted(ports))) for name, ports in policies.items()))
+        if key not in self.results:
+            ports = sorted(set(port for name, policy_ports in key for port in policy_ports))
+            port_policies = dict((port, [name for name, policy_ports in key if port in policy_ports])
+                                 for port in ports)
+            exposed = dict((name, set()) for name in policies)
+            for from_port, to_port, group_id in self.ranges:
+                for port in ports[bisect_left(ports, from_port):bisect_right(ports, to_port)]:
+                    for name in port_policies[port]:
+                        exposed[name].add(group_id)
+            self.results[key] = exposed
+        return self.results[key]
@@ -1,4 +1,5 @@
 from autobot_helpers import context_helper, boto3_helper
+from services.aws import records
 
 
 class S3:
@@ -14,8 +15,8 @@ class S3:
         s3_buckets = []
         for bucket in response['Buckets']:
             try:
-                bucket_data = {'id': bucket['Name'], 'name': bucket['Name'],
-                               'createdOn': bucket['CreationDate'].isoformat()}
+                bucket_data = records.S3Bucket(id=bucket['Name'], name=bucket['Name'],
+                                               createdOn=bucket['CreationDate'].isoformat())
                 is_public_read, is_public_write = self.__bucket_permission_details(bucket['Name'])
                 bucket_data['isPublicRead'] = is_public_read
                 bucket_data['isPublicWrite'] = is_public_write
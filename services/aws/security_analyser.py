@@ -3,6 +3,7 @@ import copy
 from services.aws.ec2 import EC2
 from services.aws.iam import IAM
 from services.aws.rds import RDS
+from services.aws.region_index import RegionIndex
 from services.aws.s3 import S3
 from services.aws.utils import Constants
 
@@ -15,41 +16,46 @@ class SecurityAnalyser:
     @staticmethod
     def analyse_data_for_security(dataset):
         insecure_resources = copy.deepcopy(Constants.default_security_dict)
-        SecurityAnalyser.__analyse_global_data_for_security(dataset['globalData'], insecure_resources)
+        SecurityAnalyser.analyse_global_data(dataset['globalData'], insecure_resources)
         for region in dataset['regionalData']:
-            for datapoint in dataset['regionalData'][region]['datapoints']:
-                if dataset['regionalData'][region]['datapoints'][datapoint] or datapoint == 'cloudTrails':
-
-                    if datapoint == 'rdses':
-                        count, item_list = RDS.get_public_rds(dataset['regionalData'][region]['datapoints'][datapoint])
-                        insecure_resources['publicRDS']['count'] += count
-                        insecure_resources['publicRDS']['itemList'].extend(item_list)
-
-                        count, item_list = RDS.get_rds_without_encryption(dataset['regionalData'][region]['datapoints'][datapoint])
-                        insecure_resources['rdsDataEncryptionAtRest']['count'] += count
-                        insecure_resources['rdsDataEncryptionAtRest']['itemList'].extend(item_list)
-                    elif datapoint == 'ec2s':
-                        count, item_list = EC2.get_ec2_without_iams(dataset['regionalData'][region]['datapoints'][datapoint])
-                        insecure_resources['ec2WithoutIAM']['count'] += count
-                        insecure_resources['ec2WithoutIAM']['itemList'].extend(item_list)
-                    elif datapoint == 'securityGroups':
-                        count, item_list = EC2.get_security_groups_with_insecure_open_ports(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        insecure_resources['insecurePublicPortsSGs']['count'] += count
-                        insecure_resources['insecurePublicPortsSGs']['itemList'].extend(item_list)
-
-                        count, item_list = EC2.get_security_groups_with_open_ssh_port(
-                            dataset['regionalData'][region]['datapoints'][datapoint])
-                        insecure_resources['publicSSHAccess']['count'] += count
-                        insecure_resources['publicSSHAccess']['itemList'].extend(item_list)
-                    elif datapoint == 'cloudTrails':
-                        if not dataset['regionalData'][region]['datapoints'][datapoint]:
-                            insecure_resources['cloudTrailsNotConfigured']['count'] += 1
-                            insecure_resources['cloudTrailsNotConfigured']['itemList'].append(region)
+            SecurityAnalyser.analyse_regional_data(region, dataset['regionalData'][region], insecure_resources)
         return insecure_resources
 
     @staticmethod
-    def __analyse_global_data_for_security(global_data, insecure_resources):
+    def analyse_regional_data(region, regional_data, insecure_resources):
+        datapoints = regional_data['datapoints']
+        index = RegionIndex(datapoints)
+        for datapoint in datapoints:
+            if datapoints[datapoint] or datapoint == 'cloudTrails':
+
+                if datapoint == 'rdses':
+                    count, item_list = RDS.get_public_rds(datapoints[datapoint])
+                    insecure_resources['publicRDS']['count'] += count
+                    insecure_resources['publicRDS']['itemList'].extend(item_list)
+
+                    count, item_list = RDS.get_rds_without_encryption(datapoints[datapoint])
+                    insecure_resources['rdsDataEncryptionAtRest']['count'] += count
+                    insecure_resources['rdsDataEncryptionAtRest']['itemList'].extend(item_list)
+                elif datapoint == 'ec2s':
+                    count, item_list = EC2.get_ec2_without_iams(datapoints[datapoint])
+                    insecure_resources['ec2WithoutIAM']['count'] += count
+                    insecure_resources['ec2WithoutIAM']['itemList'].extend(item_list)
+                elif datapoint == 'securityGroups':
+                    count, item_list = EC2.get_security_groups_with_insecure_open_ports(datapoints[datapoint], index)
+                    insecure_resources['insecurePublicPortsSGs']['count'] += count
+                    insecure_resources['insecurePublicPortsSGs']['itemList'].extend(item_list)
+
+                    count, item_list = EC2.get_security_groups_with_open_ssh_port(datapoints[datapoint], index)
+                    insecure_resources['publicSSHAccess']['count'] += count
+                    insecure_resources['publicSSHAccess']['itemList'].extend(item_list)
+                elif datapoint == 'cloudTrails':
+                    if not datapoints[datapoint]:
+                        insecure_resources['cloudTrailsNotConfigured']['count'] += 1
+                        insecure_resources['cloudTrailsNotConfigured']['itemList'].append(region)
+        return insecure_resources
+
+    @staticmethod
+    def analyse_global_data(global_data, insecure_resources):
         if global_data['datapoints'].get('users'):
             count, item_list = IAM.get_users_without_mfa(global_data['datapoints']['users'])
             insecure_resources['usersWithoutMFA']['count'] += count
@@ -17,24 +17,24 @@ class SecurityIssuesServices:
         if not security_issues:
             return {'success': False, 'error_code': 'UNR_EMPTY_RESOURCE_LIST', 'error': "Resource list is empty"}
 
-        resource_ids = []
+        item_ids = []
         for resource_type in security_issues:
-            if security_issues[resource_type].get('count') and 'itemList' in security_issues[resource_type]:
+            if security_issues[resource_type].get('count') and 'itemList' in security_issues[resource_type] and \
+                    resource_type in Constants.issue_datapoints:
                 for resource_id in security_issues[resource_type]['itemList']:
-                    resource_ids.append(resource_id)
-        resource_list = aws_datapoint_history.get_datapoints_by_ids(
-            account_number=account_id,
-            timestamp=timestamp,
-            resource_ids=resource_ids)
+                    item_ids.append(Constants.issue_datapoints[resource_type] + "_" + resource_id)
+        resources_by_item_id = dict((resource['itemId'], resource) for resource in
+                                    aws_datapoint_history.get_datapoints_by_item_ids(
+                                        account_number=account_id, timestamp=timestamp, item_ids=item_ids))
         resource_list_with_issue = []
         for resource_type in security_issues:
-            if security_issues[resource_type].get('count') and 'itemList' in security_issues[resource_type]:
+            if security_issues[resource_type].get('count') and 'itemList' in security_issues[resource_type] and \
+                    resource_type in Constants.issue_datapoints:
                 for resource_id in security_issues[resource_type]['itemList']:
                     resource_item = None
-                    for resource in resource_list:
-                        if resource['id'] == resource_id:
-                            resource_item = copy.deepcopy(resource)
-                            break
+                    item_id = Constants.issue_datapoints[resource_type] + "_" + resource_id
+                    if item_id in resources_by_item_id:
+                        resource_item = copy.deepcopy(resources_by_item_id[item_id])
                     if resource_item:
                         resource_item['issue'] = Constants.default_security_dict[resource_type].get('label')
                         resource_item['alertMessage'] = Constants.default_security_dict[resource_type]. \
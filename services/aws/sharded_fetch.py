@@ -0,0 +1,112 @@
+import copy
+
+from autobot_helpers import context_helper, telemetry_helper
+from models import aws_datapoint_history, aws_fetch_shard
+from services.aws.maintenance_analyser import MaintenanceAnalyser
+from services.aws.security_analyser import SecurityAnalyser
+from services.aws.unused_resources_analyser import UnusedResourcesAnalyser
+from services.aws.utils import Constants, Helpers
+
+
+class ShardedFetch:
+    """
+    An account fetch split into one job per active region plus one for the global datapoints.
+
+    The coordinator picks the snapshot timestamp and base, stores the shard list in aws_fetch_shards and queues
+    the jobs. Every shard writes its own datapoints into the shared snapshot and reports its counts and telemetry
+    back with a conditional write, so a redelivered job can't report twice. The shard whose report completes
+    the set aggregates: it reads the snapshot back once and runs the analysers over all regions together.
+    Non list global datapoints like accountSummary are not stored as items and travel in the global report.
+    """
+
+    GLOBAL_SHARD = 'global'
+
+    def __init__(self, account_number, state):
+        self.account_number = account_number
+        self.timestamp = state['timestamp']
+        self.base_timestamp = state.get('baseTimestamp')
+        self.lease_owner = state.get('leaseOwner')
+        self.region_order = state['regions']
+        self.shards = state['shards']
+
+    @staticmethod
+    def start(account_number, timestamp, base_timestamp, regions, lease_owner=None):
+        state = {
+            'timestamp': timestamp,
+            'baseTimestamp': base_timestamp,
+            'leaseOwner': lease_owner,
+            'regions': list(regions),
+            'shards': {shard: {'status': 'pending'} for shard in list(regions) + [ShardedFetch.GLOBAL_SHARD]}
+        }
+        aws_fetch_shard.save(account_number, Helpers.cleaned_for_dynamo(state))
+        return ShardedFetch(account_number, state)
+
+    @staticmethod
+    def load(account_number, timestamp):
+        """ The sharded fetch started at timestamp, None once it was aggregated or replaced """
+        state = aws_fetch_shard.get(account_number)
+        if not state or state['timestamp'] != timestamp:
+            return None
+        return ShardedFetch(account_number, Helpers.from_dynamo(state))
+
+    def regions(self):
+        """ The fetched regions in active region order, the order a single fetch analyses them in """
+        return self.region_order
+
+    def report(self, shard, shard_report):
+        """ Records a shard's report, returns True when it was the last one missing """
+        state = aws_fetch_shard.report(self.account_number, self.timestamp, shard, Helpers.to_dynamo(shard_report))
+        if not state:
+            context_helper.logger().info("Shard=%s of fetch %s already reported", shard, self.timestamp)
+            return False
+        self.shards = Helpers.from_dynamo(state)['shards']
+        return all(report['status'] != 'pending' for report in self.shards.values())
+
+    def failures(self):
+        return {shard: report.get('error') for shard, report in self.shards.items() if report['status'] == 'failed'}
+
+    def telemetry(self):
+        return [record for report in self.shards.values() for record in report.get('telemetry', [])]
+
+    def aggregate(self, regional_datapoints, global_datapoints):
+        """
+        Tombstones base groups of regions no longer fetched, then analyses the whole snapshot. Returns the
+        metadata and the snapshot info to be saved with the intent. The datapoints a collector reported without
+        any item are analysed as empty lists.
+        """
+        with aws_datapoint_history.SnapshotWriter(self.account_number, self.timestamp, self.base_timestamp) as writer:
+            for (datapoint, region) in list(writer.base_groups):
+                if region in self.shards:
+                    writer.skip(datapoint, region)
+            snapshot = writer.finish()
+        snapshot['itemCount'] = sum(report.get('itemCount', 0) for report in self.shards.values())
+        snapshot['deltaCount'] += sum(report.get('deltaCount', 0) for report in self.shards.values())
+
+        stored = aws_datapoint_history.read_snapshot(self.account_number, self.timestamp, self.base_timestamp)
+        metadata = {
+            'unusedResources': copy.deepcopy(Constants.default_unused_dict),
+            'securityIssues': copy.deepcopy(Constants.default_security_dict),
+            'maintenance': copy.deepcopy(Constants.default_bp_maintenance_dict)
+        }
+        for region in self.regions():
+            regional_data = {'datapoints': {datapoint: stored.get(region, {}).get(datapoint, [])
+                                            for datapoint in regional_datapoints}}
+            context_helper.logger().debug("Analysing data for region=%s", region)
+            UnusedResourcesAnalyser.analyse_regional_data(region, regional_data, metadata['unusedResources'])
+            SecurityAnalyser.analyse_regional_data(region, regional_data, metadata['securityIssues'])
+            MaintenanceAnalyser.analyse_regional_data(region, regional_data, metadata['maintenance'])
+        global_data = {'datapoints': {datapoint: stored.get(ShardedFetch.GLOBAL_SHARD, {}).get(datapoint, [])
+                                      for datapoint in global_datapoints}}
+        global_data['datapoints'].update(self.shards[ShardedFetch.GLOBAL_SHARD].get('globalData') or {})
+        SecurityAnalyser.analyse_global_data(global_data, metadata['securityIssues'])
+        MaintenanceAnalyser.analyse_global_data(global_data, metadata['maintenance'])
+        UnusedResourcesAnalyser.finalise(metadata['unusedResources'])
+        Helpers.clean_dict_for_dynamo(metadata)
+        return metadata, snapshot
+
+    def telemetry_summary(self):
+        records = self.telemetry()
+        return {'collectors': records, 'totals': telemetry_helper.summarise(records), 'shards': len(self.shards)}
+
+    def delete(self):
+        aws_fetch_shard.delete(self.account_number, self.timestamp)
@@ -173,15 +173,8 @@ class SSM:
             return {'success': False, 'error_code': 'EXCEPTION', 'message': err_str}
 
     def get_instances(self):
-        results = []
-        response = self.client.describe_instance_information()
-        results.extend(response['InstanceInformationList'])
-        while 'NextToken' in response:
-            next_token = response['NextToken']
-            response = self.client.describe_instance_information(NextToken=next_token)
-            results.extend(response['InstanceInformationList'])
-            next_token = response['NextToken'] if response.get('NextToken') else False
-        return results
+        return list(boto3_helper.paginate(self.client, 'describe_instance_information', 'InstanceInformationList',
+                                          page_size=50))
 
 
 def refresh_checks(self):
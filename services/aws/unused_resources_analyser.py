@@ -0,0 +1,125 @@
+import copy
+
+from services.aws.autoscaling import AutoScaling
+from services.aws.ec2 import EC2
+from services.aws.elb import ELB
+from services.aws.rds import RDS
+from services.aws.region_index import RegionIndex
+from services.aws.utils import Constants
+
+
+class UnusedResourcesAnalyser:
+
+    def __init__(self):
+        pass
+
+    @staticmethod
+    def analyse_data(dataset):
+        unused_resources = copy.deepcopy(Constants.default_unused_dict)
+        for region in dataset['regionalData']:
+            UnusedResourcesAnalyser.analyse_regional_data(region, dataset['regionalData'][region], unused_resources)
+        return UnusedResourcesAnalyser.finalise(unused_resources)
+
+    @staticmethod
+    def analyse_regional_data(region, regional_data, unused_resources):
+        datapoints = regional_data['datapoints']
+        index = RegionIndex(datapoints)
+        UnusedResourcesAnalyser.analyse_security_groups(datapoints, unused_resources, index)
+        for datapoint in datapoints:
+            if datapoint == 'securityGroups':
+                continue
+            if datapoints[datapoint] is not None and len(datapoints[datapoint]) > 0 and unused_resources.get(datapoint):
+                # Set the total
+                unused_resources[datapoint]['total'] += len(datapoints[datapoint]) if \
+                    datapoints.get(datapoint, None) else 0
+
+                if datapoint == 'volumes':
+                    count, unused_list, cost = EC2.get_unused_volume_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                    unused_resources[datapoint]['costSaving'] += cost
+                elif datapoint == 'snapshots':
+                    unused_count, unused_list = EC2.get_unused_snapshots_count(
+                        datapoints[datapoint], datapoints['volumes'], datapoints['amis'], index)
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'enis':
+                    unused_count, unused_sec_groups = EC2.get_unused_enis_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_sec_groups)
+                elif datapoint == 'eips':
+                    unused_count, unused_sec_groups, cost = EC2.get_unused_eips_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_sec_groups)
+                    unused_resources[datapoint]['costSaving'] += cost
+                elif datapoint == 'amis':
+                    unused_count, unused_list = EC2.get_unused_amis_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'ec2s':
+                    unused_count, unused_list = EC2.get_stopped_instance_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'elbs':
+                    unused_count, unused_list, cost = ELB.get_unused_elb_count(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                    unused_resources[datapoint]['costSaving'] += cost
+                elif datapoint == 'albs':
+                    unused_count, unused_list, cost = ELB.get_unused_alb_count(datapoints[datapoint],
+                                                                               datapoints['targetGroups'], index)
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                    unused_resources[datapoint]['costSaving'] += cost
+                elif datapoint == 'autoScalingGroups':
+                    unused_count, unused_list = AutoScaling.get_unused_autoscaling_groups(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'launchConfigs':
+                    unused_count, unused_list = AutoScaling.get_unused_lanuchconfigs(
+                        datapoints[datapoint], datapoints['autoScalingGroups'], index)
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'routeTables':
+                    unused_count, unused_list = EC2.get_unused_route_tables(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'internetGateways':
+                    unused_count, unused_list = EC2.get_unused_internet_gateways(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                elif datapoint == 'vpnGateways':
+                    unused_count, unused_list, cost = EC2.get_unused_vpn_gateways(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                    unused_resources[datapoint]['costSaving'] += cost
+                elif datapoint == 'rdses':
+                    unused_count, unused_list, cost = RDS.get_unused_rds_snapshots(datapoints[datapoint])
+                    unused_resources[datapoint]['unused'] += unused_count
+                    unused_resources[datapoint]['itemList'].extend(unused_list)
+                    unused_resources[datapoint]['costSaving'] += cost
+        return unused_resources
+
+    @staticmethod
+    def analyse_security_groups(datapoints, unused_resources, index=None):
+        """
+        Unused security groups of a region. Instances, network interfaces, load balancers and RDS instances all use
+        groups, so datapoints has to hold every one of those of the region along with the securityGroups.
+        """
+        security_groups = datapoints.get('securityGroups')
+        if not security_groups or not unused_resources.get('securityGroups'):
+            return unused_resources
+        index = index if index else RegionIndex(datapoints)
+        unused_resources['securityGroups']['total'] += len(security_groups)
+        unused_count, unused_sec_groups = EC2.get_unused_security_group_count(security_groups,
+                                                                              datapoints.get('ec2s'), index)
+        unused_resources['securityGroups']['unused'] += unused_count
+        unused_resources['securityGroups']['itemList'].extend(unused_sec_groups)
+        return unused_resources
+
+    @staticmethod
+    def finalise(unused_resources):
+        for datapoint in unused_resources:
+            if unused_resources[datapoint].get('costSaving'):
+                unused_resources[datapoint]['costSaving'] = int(round(unused_resources[datapoint].get('costSaving')))
+        return unused_resources
@@ -7,6 +7,7 @@ from models import aws_fix_history
 from models import aws_intent_history
 from services.aws.ec2 import EC2
 from services.aws.elb import ELB
+from services.aws.region_index import RegionIndex, SecurityGroupGraph
 from services.aws.utils import Constants
 
 
@@ -16,25 +17,23 @@ class UnusedResourcesServices:
     def get_unused_resources(unused_resources, account_id, timestamp):
         if not unused_resources:
             return {'success': False, 'error_code': 'UNR_EMPTY_RESOURCE_LIST', 'error': "Resource list is empty"}
-        resource_ids = []
+        item_ids = []
         for resource_type in unused_resources:
             if unused_resources[resource_type]['unused']:
                 for resource_id in unused_resources[resource_type]['itemList']:
-                    resource_ids.append(resource_id)
+                    item_ids.append(resource_type + "_" + resource_id)
 
-        unused_resources_list = aws_datapoint_history.get_datapoints_by_ids(
-            account_number=account_id,
-            timestamp=timestamp, resource_ids=resource_ids)
+        unused_resources_by_item_id = dict((resource['itemId'], resource) for resource in
+                                           aws_datapoint_history.get_datapoints_by_item_ids(
+                                               account_number=account_id, timestamp=timestamp, item_ids=item_ids))
 
         unused_resources_list_with_issue = []
         for resource_type in unused_resources:
             if unused_resources[resource_type].get('unused'):
                 for resource_id in unused_resources[resource_type]['itemList']:
                     resource_item = None
-                    for resource in unused_resources_list:
-                        if resource['itemId'] == resource_type+"_"+resource_id:
-                            resource_item = copy.deepcopy(resource)
-                            break
+                    if resource_type + "_" + resource_id in unused_resources_by_item_id:
+                        resource_item = copy.deepcopy(unused_resources_by_item_id[resource_type + "_" + resource_id])
                     if resource_item:
                         resource_item['issue'] = Constants.default_unused_dict[resource_type].get('label')
                         resource_item['alertMessage'] = Constants.default_unused_dict[resource_type]. \
@@ -42,6 +41,16 @@ class UnusedResourcesServices:
                         unused_resources_list_with_issue.append(resource_item)
         return {'success': True, 'resource_list': unused_resources_list_with_issue}
 
+    @staticmethod
+    def get_security_group_users(account_id, timestamp, region, group_id):
+        """ What references a security group, read from the collected data to preview deleting it """
+        datapoints = {}
+        for datapoint in ('securityGroups',) + SecurityGroupGraph.members:
+            datapoints[datapoint] = aws_datapoint_history.get_snapshot_datapoint(account_id, timestamp, datapoint,
+                                                                                 region).get(region)
+        graph = RegionIndex(datapoints).security_group_graph()
+        return {'success': True, 'id': group_id, 'region': region, 'usedBy': graph.users(group_id)}
+
     @staticmethod
     def clean_unused_resource(data):
         issue = data['issue']
@@ -1,9 +1,17 @@
 import calendar
+import decimal
+import hashlib
+import json
 import math
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
 import re
 
+from services.aws.records import Record
+
+SNAPSHOT_DESCRIPTION_PATTERN = re.compile(r"^Created by CreateImage\((.*?)\) for (.*?) ", re.MULTILINE)
+
 
 class Constants:
     autobot_config_rules = ['autobot-autoscaling_group_elb_healthcheck_required', 'autobot-cloud_trail_enabled',
@@ -246,6 +254,30 @@ class Constants:
         'vpcs': 'VPC',
         's3Buckets': 'S3 Bucket'
     }
+
+    # Datapoint holding the resources listed by each security issue and maintenance task, the ones listing parts of
+    # a resource like access keys or NAT gateways have none
+    issue_datapoints = {
+        'usersWithoutMFA': 'users',
+        'unusedIAMUsers': 'users',
+        'adminUsers': 'users',
+        'adminRoles': 'roles',
+        'publicRWS3Buckets': 's3Buckets',
+        'insecurePublicPortsSGs': 'securityGroups',
+        'publicSSHAccess': 'securityGroups',
+        'rdsDataEncryptionAtRest': 'rdses',
+        'publicRDS': 'rdses',
+        'ec2WithoutIAM': 'ec2s',
+        'staleSecurityGroups': 'securityGroups',
+        'vpcWithoutPrivateSubnet': 'vpcs',
+        'vpcWithoutS3Endpoints': 'vpcs',
+        'ipv6VPCWithoutEgressOnlyIGW': 'vpcs',
+        'classicEC2Instances': 'ec2s',
+        'ec2WithoutEBSOptimised': 'ec2s',
+        'ec2NotTerminationProtected': 'ec2s',
+        'unencryptedVolumes': 'volumes',
+        's3BucketsWithoutVersioning': 's3Buckets'
+    }
     default_unused_dict = {
         "volumes": {
             'label': "Volume",
@@ -493,14 +525,6 @@ class Helpers:
         current_day = (today_date - q_state_date).days
         return (current_day * 100.0) / noof_days_inq
 
-    @staticmethod
-    def parse_snapshot_description(description):
-        regex = r"^Created by CreateImage\((.*?)\) for (.*?) "
-        matches = re.finditer(regex, description, re.MULTILINE)
-        for matchNum, match in enumerate(matches):
-            return match.groups()
-        return '', ''
-
     @staticmethod
     def fromisoformat(strdate):
         try:
@@ -512,6 +536,10 @@ class Helpers:
     def clean_dict_for_dynamo(data):
         def walk_dict(d):
             for i in d.keys():
+                if isinstance(d[i], Record):
+                    d[i] = d[i].to_item()
+                if isinstance(d[i], list):
+                    d[i] = [value.to_item() if isinstance(value, Record) else value for value in d[i]]
                 if isinstance(d[i], dict):
                     walk_dict(d[i])
                 else:
@@ -528,6 +556,48 @@ class Helpers:
                         d[i] = None
         walk_dict(data)
 
+    @staticmethod
+    def cleaned_for_dynamo(data):
+        """
+        Same cleanup as clean_dict_for_dynamo but returns a cleaned copy, the collected data is left untouched
+        so it can still be analysed after it has been queued for writing.
+        """
+        if isinstance(data, Record):
+            data = data.to_item()
+        if isinstance(data, dict):
+            return {key: Helpers.cleaned_for_dynamo(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [Helpers.cleaned_for_dynamo(value) for value in data]
+        if isinstance(data, str) and not data.strip():
+            return None
+        return data
+
+    @staticmethod
+    def to_dynamo(data):
+        """ Copy of the data with floats as Decimals, boto3 refuses to write floats """
+        return json.loads(json.dumps(data, default=Helpers.json_default), parse_float=decimal.Decimal)
+
+    @staticmethod
+    def from_dynamo(data):
+        """ Copy of data read from DynamoDB with the Decimals turned back into ints and floats """
+        if isinstance(data, dict):
+            return {key: Helpers.from_dynamo(value) for key, value in data.items()}
+        if isinstance(data, list):
+            return [Helpers.from_dynamo(value) for value in data]
+        if isinstance(data, decimal.Decimal):
+            return int(data) if data == data.to_integral_value() else float(data)
+        return data
+
+    @staticmethod
+    def content_hash(data):
+        """ Stable hash of a resource record, keys are sorted so the dict ordering of boto3 responses doesn't matter """
+        return hashlib.md5(json.dumps(data, sort_keys=True, default=Helpers.json_default).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def json_default(value):
+        """ json.dumps fallback, collected records are written as their stored dict and anything else as a string """
+        return value.to_item() if isinstance(value, Record) else str(value)
+
     @staticmethod
     def arn(account_id):
         from autobot_helpers import context_helper
@@ -552,10 +622,13 @@ class Helpers:
 
 
     @staticmethod
+    @lru_cache(maxsize=65536)
     def parse_snapshot_description(description):
-        regex = r"^Created by CreateImage\((.*?)\) for (.*?) "
-        matches = re.finditer(regex, description, re.MULTILINE)
-        for matchNum, match in enumerate(matches):
+        """ Instance and AMI ids of a snapshot created for an AMI, parsed once per description """
+        if not description:
+            return '', ''
+        match = SNAPSHOT_DESCRIPTION_PATTERN.search(description)
+        if match:
             return match.groups()
         return '', ''
 
@@ -573,6 +646,16 @@ class Helpers:
     def timestamp():
         return datetime.utcnow().isoformat()
 
+    @staticmethod
+    def group_by(items, key):
+        """ Groups items into {key(item): [items]} in one pass, items without a key are left out """
+        groups = {}
+        for item in items:
+            item_key = key(item)
+            if item_key is not None:
+                groups.setdefault(item_key, []).append(item)
+        return groups
+
     @staticmethod
     def removekey(d, key):
         r = dict(d)
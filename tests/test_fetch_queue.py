@@ -0,0 +1,117 @@
+import json
+import os
+import unittest
+from unittest import mock
+
+import boto3
+
+try:
+    from moto import mock_aws
+except ImportError:
+    # moto before 5.0 mocks each service on its own
+    from moto import mock_dynamodb as mock_aws
+
+import data_fetcher
+from models import autobot_context, aws_intent_history
+from services.aws import fetch_queue
+from services.aws.data_fetch_service import DataFetchService
+from services.aws.sharded_fetch import ShardedFetch
+
+EMAIL = 'user@example.com'
+ACCOUNT_ID = '123456789012'
+REGIONS = ['Virginia', 'Mumbai', 'Ohio']
+
+
+def fetch_ec2_data(region, selected=None):
+    return {'volumes': [{'id': 'vol-' + region, 'attachments': [], 'type': 'gp2', 'size': 10, 'region': region}],
+            'snapshots': [], 'amis': [], 'securityGroups': [], 'ec2s': [], 'eips': []}
+
+
+def fetch_cloudtrail_data(region, selected=None):
+    return {'cloudTrails': []}
+
+
+def fetch_iam_users(selected=None):
+    return {'users': []}
+
+
+def fetch_iam_others(selected=None):
+    return {'accountSummary': {'accountMFAEnabled': False},
+            'passwordPolicy': {'id': 'passwordPolicy', 'name': 'passwordPolicy', 'score': 3}}
+
+
+def initialize(email=None, account_id=None):
+    autobot_context.session['attributes'] = {'email': email, 'accountNumber': account_id,
+                                             'activeRegions': REGIONS, 'defaultRegion': 'Virginia'}
+    return {'success': True}
+
+
+class LocalFetchQueueShardedFetchTest(unittest.TestCase):
+    """ A sharded fetch run in process through LocalFetchQueue against mocked DynamoDB tables """
+
+    def setUp(self):
+        os.environ.update(AWS_ACCESS_KEY_ID='testing', AWS_SECRET_ACCESS_KEY='testing',
+                          AWS_DEFAULT_REGION='us-east-1')
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+
+        app = autobot_context.AutobotApp()
+        app.config.update({'ENVIRONMENT': 'local', 'ACCESS_KEY': 'testing', 'SECRET_KEY': 'testing',
+                           'DATA_FETCH_CONFIG': {'shard_min_regions': 2}})
+        self.queue = fetch_queue.LocalFetchQueue()
+        for patcher in [
+            mock.patch.object(autobot_context, 'app', app),
+            mock.patch.dict(autobot_context.session, clear=True),
+            mock.patch.object(fetch_queue, 'get_queue', return_value=self.queue),
+            mock.patch.object(data_fetcher.context_helper, 'initialize', initialize),
+            mock.patch.object(data_fetcher.AWS, 'refresh_access_policy_for_current_account'),
+            mock.patch.object(DataFetchService, 'regional_function', [fetch_ec2_data, fetch_cloudtrail_data]),
+            mock.patch.object(DataFetchService, 'global_function', [fetch_iam_users, fetch_iam_others]),
+            mock.patch.object(DataFetchService, 'index_success_handler'),
+            mock.patch.object(DataFetchService, 'index_failure_handler')
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.providers = self.create_table('cloud_service_providers', 'userId', 'accountId')
+        self.shards = self.create_table('aws_fetch_shards', 'accountId')
+        self.create_table('aws_intent_history', 'cid', 'timestamp')
+        self.create_table('aws_datapoint_history', 'intentId', 'itemId')
+        self.create_table('aws_index_checkpoints', 'accountId')
+        self.providers.put_item(Item={'userId': EMAIL, 'accountId': ACCOUNT_ID, 'isActive': True})
+
+    @staticmethod
+    def create_table(name, hash_key, range_key=None):
+        keys = [(hash_key, 'HASH')] + ([(range_key, 'RANGE')] if range_key else [])
+        return boto3.resource('dynamodb', region_name='us-east-1').create_table(
+            TableName='staging_' + name,
+            KeySchema=[{'AttributeName': key, 'KeyType': key_type} for key, key_type in keys],
+            AttributeDefinitions=[{'AttributeName': key, 'AttributeType': 'S'} for key, key_type in keys],
+            BillingMode='PAY_PER_REQUEST')
+
+    def test_sharded_fetch_aggregates_once_and_releases_lease(self):
+        with mock.patch.object(ShardedFetch, 'aggregate', autospec=True,
+                               side_effect=ShardedFetch.aggregate) as aggregate:
+            self.queue.publish(EMAIL, ACCOUNT_ID)
+
+        results = [json.loads(result) for result in self.queue.results]
+        # The coordinator, one job per region and the global one
+        self.assertEqual(len(results), len(REGIONS) + 2)
+        self.assertTrue(results[0]['sharded'])
+        self.assertEqual([result['aggregated'] for result in results[1:]], [False] * len(REGIONS) + [True])
+        self.assertTrue(all(result['success'] for result in results))
+
+        self.assertEqual(aggregate.call_count, 1)
+        DataFetchService.index_success_handler.assert_called_once_with(EMAIL, ACCOUNT_ID)
+        DataFetchService.index_failure_handler.assert_not_called()
+
+        provider = self.providers.get_item(Key={'userId': EMAIL, 'accountId': ACCOUNT_ID})['Item']
+        self.assertNotIn('indexLeaseOwner', provider)
+        self.assertEqual(self.shards.scan()['Items'], [])
+        intent = aws_intent_history.get_latest_by_account_id(ACCOUNT_ID)
+        self.assertEqual(intent['data']['unusedResources']['volumes']['total'], len(REGIONS))
+
+
+if __name__ == '__main__':
+    unittest.main()